@@ -0,0 +1,129 @@
+"""
+日志开销基准：对比改造前（逐条f-string + strftime + Queue.put）与改造后（延迟格式化、
+deque批量写入、日志级别过滤）的日志开销占回测循环时间的百分比。
+
+用法: python -m benchmarks.logger_overhead [bars] [repeat]
+"""
+import gc
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from queue import Queue, Empty
+
+from module.buffered_logger import DEBUG, INFO
+from module.exchange import Exchange, Order
+
+
+class LegacyQueueLogger:
+    """改造前的BufferedLogger：每条消息一次Queue.put，后台线程逐条get并逐行write"""
+
+    def __init__(self, log_file, buffer_size=1000, flush_interval=5.0):
+        self.log_file = log_file
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.queue = Queue()
+        self.stop_event = threading.Event()
+        self.writer_thread = threading.Thread(target=self._writer_worker, daemon=True)
+        self.writer_thread.start()
+
+    def info(self, message):
+        self.queue.put(message)
+
+    def _writer_worker(self):
+        buffer = []
+        last_flush = time.time()
+        with open(self.log_file, 'w', encoding='utf-8') as f:
+            while not self.stop_event.is_set():
+                try:
+                    buffer.append(self.queue.get(timeout=1.0))
+                    now = time.time()
+                    if len(buffer) >= self.buffer_size or now - last_flush >= self.flush_interval:
+                        for msg in buffer:
+                            f.write(msg + '\n')
+                        f.flush()
+                        buffer.clear()
+                        last_flush = now
+                except Empty:
+                    pass
+            while not self.queue.empty():
+                buffer.append(self.queue.get_nowait())
+            for msg in buffer:
+                f.write(msg + '\n')
+
+    def close(self):
+        self.stop_event.set()
+        self.writer_thread.join(timeout=30.0)
+
+
+class LegacyExchange(Exchange):
+    """改造前的下单日志：每根K线都做strftime和f-string格式化"""
+
+    def __init__(self, log_file):
+        super().__init__(1000000, 0, os.devnull)
+        self.logger.close()
+        self.logger = LegacyQueueLogger(log_file)
+
+    def place_order(self, side, limit_price=None, order_type='limit', timestamp=None):
+        self.order_id_counter += 1
+        self.limit_order = Order(self.order_id_counter, side, limit_price, order_type)
+        time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.logger.info(f"{time_str} - 下单: {side.upper()} @ ${limit_price:.2f} ({order_type})")
+
+
+class SilentExchange(Exchange):
+    """参照组：下单不写任何日志"""
+
+    def place_order(self, side, limit_price=None, order_type='limit', timestamp=None):
+        self.order_id_counter += 1
+        self.limit_order = Order(self.order_id_counter, side, limit_price, order_type)
+
+
+def run_loop(exchange, bars):
+    """模拟回测主循环中与日志相关的逐bar工作：下单 + 记录净值"""
+    start = datetime(2021, 1, 1)
+    step = timedelta(minutes=1)
+    exchange.reserve_nav(bars)
+    began = time.perf_counter()
+    for i in range(bars):
+        timestamp = start + i * step
+        price = 100.0 + (i % 100) * 0.01
+        exchange.place_order('buy', price * 0.99, timestamp=timestamp)
+        exchange.record_minute_nav(timestamp, price)
+    loop_time = time.perf_counter() - began
+    exchange.close()
+    # 含等待后台线程写完的时间
+    total_time = time.perf_counter() - began
+    return loop_time, total_time
+
+
+def main(bars=500000, repeat=3):
+    with tempfile.TemporaryDirectory() as directory:
+        log_file = os.path.join(directory, "bench.log")
+        scenarios = [
+            ("无日志（参照）", lambda: SilentExchange(1000000, 0, os.devnull)),
+            ("改造前：Queue + 即时格式化", lambda: LegacyExchange(log_file)),
+            ("改造后：DEBUG，延迟格式化", lambda: Exchange(1000000, 0, log_file, log_level=DEBUG)),
+            ("改造后：DEBUG，jsonl事件格式", lambda: Exchange(1000000, 0, log_file, log_level=DEBUG, log_format='jsonl')),
+            ("改造后：INFO，跳过逐bar下单日志", lambda: Exchange(1000000, 0, log_file, log_level=INFO)),
+        ]
+        reference = None
+        print(f"{'场景':<32}{'循环耗时(s)':>12}{'含写盘(s)':>12}{'日志开销':>10}")
+        for name, factory in scenarios:
+            # 每个场景重复repeat次取最快的一次，减少前一场景残留内存和线程的干扰
+            timings = []
+            for _ in range(repeat):
+                gc.collect()
+                timings.append(run_loop(factory(), bars))
+            loop_time, total_time = min(timings)
+            if reference is None:
+                reference = loop_time
+            overhead = (loop_time - reference) / loop_time if loop_time > 0 else 0
+            print(f"{name:<32}{loop_time:>12.3f}{total_time:>12.3f}{overhead:>10.1%}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 3)
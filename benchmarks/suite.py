@@ -0,0 +1,237 @@
+"""
+可复现的性能基准套件：在合成K线上计时数据读取、K线聚合、指标计算、回测主循环、
+日志吞吐和绩效指标计算，输出JSON（每秒处理的K线数、峰值RSS），并可与保存的基准结果对比。
+
+每个场景在单独的子进程中运行，峰值RSS只反映该场景（含场景准备数据）的内存占用；
+场景内重复repeat次取最快的一次。
+
+用法:
+    python -m benchmarks.suite --bars 1000000 --output bench.json
+    python -m benchmarks.suite --bars 1000000 --baseline bench.json
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import polars as pl
+
+from benchmarks.synthetic import write_klines
+from module.buffered_logger import BufferedLogger, DEBUG
+from module.exchange import Exchange
+from module.market_data import MarketData, aggregate_klines, load_klines, scan_klines
+from module.profiler import peak_rss_mb
+
+# 指标计算和回测使用的参数（与back_test默认值一致）
+BENCH_PARAMS = {'interval': 1, 'vwap_window': 20, 'estimate_window': 60 * 24, 'n_sigma': 3}
+AGGREGATE_INTERVALS = (5, 15, 60)
+# 与基准结果相比吞吐下降超过该比例视为退化
+DEFAULT_TOLERANCE = 0.10
+
+
+def _market_data(data_path, rows=None, **params):
+    """加载带指标的市场数据，rows不为None时只保留前rows根"""
+    params = {**BENCH_PARAMS, **params}
+    market_data = MarketData(data_path, None, None, params['interval'], params['vwap_window'],
+                             params['estimate_window'], params['n_sigma'])
+    if rows is not None and rows < len(market_data.data):
+        market_data.data = market_data.data.head(rows)
+    return market_data
+
+
+def bench_load(data_path, options):
+    """读取原始parquet"""
+    began = time.perf_counter()
+    data = load_klines(data_path)
+    return time.perf_counter() - began, len(data)
+
+
+def _bench_aggregate(interval):
+    def bench(data_path, options):
+        """把1分钟K线聚合为interval分钟K线"""
+        klines = load_klines(data_path).sort("open_time").filter(pl.col("quote_volume") > 0).lazy()
+        began = time.perf_counter()
+        # 与MarketData相同：聚合后过滤成交量为0的空窗口
+        aggregate_klines(klines, interval).filter(pl.col("volume") > 0).collect()
+        return time.perf_counter() - began, klines.select(pl.len()).collect().item()
+    return bench
+
+
+def bench_indicators(data_path, options):
+    """完整的MarketData加载：读取、过滤、计算VWAP和阈值"""
+    began = time.perf_counter()
+    market_data = _market_data(data_path)
+    return time.perf_counter() - began, len(market_data.data)
+
+
+def _bench_backtest(engine):
+    def bench(data_path, options):
+        """在已加载的数据上运行回测主循环（DEBUG日志写入临时文件）"""
+        from single_backtest_engine import simulate
+        rows = options['loop_bars'] if engine == 'loop' else None
+        market_data = _market_data(data_path, rows)
+        with tempfile.TemporaryDirectory() as directory:
+            config = {'engine': engine, 'verbose': False, 'log_file': os.path.join(directory, "bench.log")}
+            began = time.perf_counter()
+            exchange = simulate(market_data, config)
+            exchange.close()
+            return time.perf_counter() - began, market_data.get_total_bars()
+    return bench
+
+
+def bench_logger(data_path, options):
+    """日志吞吐：每根K线一条DEBUG下单消息，计时到后台线程全部写完"""
+    messages = options['logger_messages']
+    timestamps = load_klines(data_path)["open_time"].head(messages).to_list()
+    with tempfile.TemporaryDirectory() as directory:
+        logger = BufferedLogger(os.path.join(directory, "bench.log"), level=DEBUG)
+        began = time.perf_counter()
+        for timestamp in timestamps:
+            logger.debug("{:%Y-%m-%d %H:%M:%S} - 下单: {} @ ${:.2f} ({})", timestamp, 'BUY', 100.0, 'limit')
+        logger.close()
+        return time.perf_counter() - began, len(timestamps)
+
+
+def bench_metrics(data_path, options):
+    """由每根K线的净值增量更新并计算绩效指标"""
+    klines = load_klines(data_path)
+    exchange = Exchange(1000000, 0, os.devnull, store_nav=False)
+    exchange.close()
+    timestamps = klines["open_time"].dt.epoch(time_unit="ms").to_numpy()
+    navs = klines["close"].to_numpy() * 10000
+    began = time.perf_counter()
+    exchange.record_nav_series(timestamps, navs)
+    exchange.calculate_performance_metrics()
+    return time.perf_counter() - began, len(klines)
+
+
+SCENARIOS = {
+    'load': bench_load,
+    **{f'aggregate_{interval}m': _bench_aggregate(interval) for interval in AGGREGATE_INTERVALS},
+    'indicators': bench_indicators,
+    'loop_engine': _bench_backtest('loop'),
+    'array_engine': _bench_backtest('array'),
+    'logger': bench_logger,
+    'metrics': bench_metrics,
+}
+
+
+def _run_scenario(task):
+    """子进程：运行一个场景repeat次，取最快的一次"""
+    name, data_path, options = task
+    timings = []
+    for _ in range(options['repeat']):
+        gc.collect()
+        timings.append(SCENARIOS[name](data_path, options))
+    seconds, bars = min(timings)
+    return {
+        'seconds': seconds,
+        'bars': bars,
+        'bars_per_sec': bars / seconds if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_suite(data_path, scenarios=None, repeat=3, loop_bars=1_000_000, logger_messages=1_000_000, show_progress=True):
+    """
+    依次运行各场景（每个场景一个新的子进程），返回可序列化为JSON的结果
+    """
+    options = {'repeat': repeat, 'loop_bars': loop_bars, 'logger_messages': logger_messages}
+    names = list(scenarios or SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"unknown scenarios: {unknown}")
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(_run_scenario, ((name, data_path, options),))
+        if show_progress:
+            print(f"{name:<16}{results[name]['seconds']:>10.3f}s{results[name]['bars_per_sec']:>16,.0f} bars/s"
+                  f"{results[name]['peak_rss_mb'] or 0:>10.0f} MB", file=sys.stderr)
+
+    return {
+        'meta': {
+            'data_path': os.path.abspath(data_path),
+            'rows': scan_klines(data_path).select(pl.len()).collect().item(),
+            'options': options,
+            'python': platform.python_version(),
+            'polars': pl.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        'scenarios': results,
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    与基准结果逐场景对比吞吐和峰值RSS，返回 {场景: {...}}；
+    吞吐低于基准的(1 - tolerance)倍时标记为退化
+    """
+    report = {}
+    for name, result in current['scenarios'].items():
+        reference = baseline.get('scenarios', {}).get(name)
+        if reference is None or not reference.get('bars_per_sec') or not result.get('bars_per_sec'):
+            continue
+        speedup = result['bars_per_sec'] / reference['bars_per_sec']
+        memory = (result['peak_rss_mb'] / reference['peak_rss_mb']
+                  if result.get('peak_rss_mb') and reference.get('peak_rss_mb') else None)
+        report[name] = {'speedup': speedup, 'memory_ratio': memory, 'regression': speedup < 1 - tolerance}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回测性能基准")
+    parser.add_argument('--bars', type=int, default=1_000_000, help="合成K线分钟数（1万到5000万）")
+    parser.add_argument('--seed', type=int, default=0, help="合成数据随机种子")
+    parser.add_argument('--data', default=None, help="已有的K线文件，指定时不生成合成数据")
+    parser.add_argument('--data-dir', default=None, help="合成数据保存目录，已存在同名文件时直接复用；默认用临时目录")
+    parser.add_argument('--scenarios', nargs='+', default=None, choices=list(SCENARIOS), help="只运行指定场景")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--loop-bars', type=int, default=1_000_000, help="逐bar循环场景最多使用的K线数")
+    parser.add_argument('--logger-messages', type=int, default=1_000_000, help="日志场景的消息数")
+    parser.add_argument('--output', default=None, help="结果JSON保存路径")
+    parser.add_argument('--baseline', default=None, help="对比的基准结果JSON")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="允许的吞吐下降比例")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="benchmarks_") as directory:
+        data_path = args.data
+        if data_path is None:
+            data_dir = args.data_dir or directory
+            os.makedirs(data_dir, exist_ok=True)
+            data_path = os.path.join(data_dir, f"synthetic_{args.bars}_{args.seed}.parquet")
+            if not os.path.exists(data_path):
+                write_klines(data_path, args.bars, args.seed)
+        result = run_suite(data_path, args.scenarios, args.repeat, args.loop_bars, args.logger_messages)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report = compare(result, json.load(f), args.tolerance)
+        print(f"{'场景':<16}{'吞吐比':>10}{'内存比':>10}", file=sys.stderr)
+        for name, row in report.items():
+            memory = f"{row['memory_ratio']:.2f}x" if row['memory_ratio'] is not None else '-'
+            flag = '  退化' if row['regression'] else ''
+            print(f"{name:<16}{row['speedup']:>9.2f}x{memory:>10}{flag}", file=sys.stderr)
+        if any(row['regression'] for row in report.values()):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+确定性的合成1分钟K线生成器：同样的(bars, seed)总是生成同样的数据，
+字段与MarketData读取的原始K线一致（open_time, open, high, low, close, volume, quote_volume, jj_code）。
+
+用法: python -m benchmarks.synthetic <bars> <output.parquet> [seed]
+"""
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+
+# 每块生成的K线数：分块生成并逐块写入，5000万根K线也不需要一次性放进内存
+CHUNK_BARS = 1_000_000
+SYNTHETIC_START = datetime(2021, 1, 1)
+
+
+def generate_klines(bars, seed=0, start=SYNTHETIC_START, first_price=100.0, chunk_index=0,
+                    volatility=0.002, gap_rate=0.001, zero_volume_rate=0.01, symbol="SYNUSDT"):
+    """
+    生成从start开始的bars分钟K线（几何随机游走）。
+    约gap_rate比例的分钟缺失（没有这一行），约zero_volume_rate比例的K线成交量为0，
+    用来覆盖MarketData中的无效数据过滤和聚合空窗口
+    """
+    rng = np.random.default_rng([seed, chunk_index])
+    minutes = np.arange(bars, dtype=np.int64)
+    close = first_price * np.exp(np.cumsum(rng.normal(0, volatility, bars)))
+    open_ = np.concatenate([[first_price], close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, volatility / 2, bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, volatility / 2, bars)))
+    volume = rng.gamma(2.0, 50.0, bars)
+    volume[rng.random(bars) < zero_volume_rate] = 0
+    keep = rng.random(bars) >= gap_rate
+
+    start_ms = (start - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+    return pl.DataFrame({
+        "open_time": pl.Series(start_ms + minutes[keep] * 60_000).cast(pl.Datetime(time_unit="ms")),
+        "open": open_[keep],
+        "high": high[keep],
+        "low": low[keep],
+        "close": close[keep],
+        "volume": volume[keep],
+        "quote_volume": volume[keep] * close[keep],
+        "jj_code": pl.repeat(symbol, int(keep.sum()), dtype=pl.String, eager=True),
+    })
+
+
+def iter_chunks(bars, seed=0, chunk_bars=CHUNK_BARS, **kwargs):
+    """
+    分块生成bars分钟的K线，价格在块之间连续；每块的随机数由(seed, 块序号)决定
+    """
+    price = kwargs.pop("first_price", 100.0)
+    start = kwargs.pop("start", SYNTHETIC_START)
+    for chunk_index, offset in enumerate(range(0, bars, chunk_bars)):
+        size = min(chunk_bars, bars - offset)
+        chunk = generate_klines(size, seed, start + timedelta(minutes=offset), price, chunk_index, **kwargs)
+        if len(chunk) > 0:
+            price = chunk["close"][-1]
+        yield chunk
+
+
+def write_klines(path, bars, seed=0, chunk_bars=CHUNK_BARS, **kwargs):
+    """
+    生成K线并写入parquet文件，超过一块时用pyarrow逐块追加写入；返回实际写入的行数
+    """
+    chunks = iter_chunks(bars, seed, chunk_bars, **kwargs)
+    if bars <= chunk_bars:
+        data = next(chunks, None)
+        if data is None:
+            data = generate_klines(0, seed)
+        data.write_parquet(path)
+        return len(data)
+
+    import pyarrow.parquet as pq
+    rows = 0
+    writer = None
+    try:
+        for chunk in chunks:
+            table = chunk.to_arrow()
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+if __name__ == '__main__':
+    rows = write_klines(sys.argv[2], int(sys.argv[1]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print(f"写入 {rows} 根K线到 {sys.argv[2]}")
@@ -0,0 +1,27 @@
+from module.data_store import DataStore
+import sys
+import polars as pl
+
+'''
+把K线文件导入本地数据仓库（按品种、按月分区的Arrow IPC文件）：
+
+    python ingest_data.py <仓库目录> [--day] [K线文件 ...]
+
+不带K线文件时只打印仓库目录。导入后把回测配置的'data_path'设为 <仓库目录>/<品种>，
+回测只内存映射与回测区间有交集的月分区。
+--day按天分区，用于秒级K线或逐笔成交（回测配置的'intrabar_data'）。
+'''
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    granularity = "day" if "--day" in args else "month"
+    args = [arg for arg in args if arg != "--day"]
+    if len(args) < 1:
+        print("usage: python ingest_data.py <store_dir> [--day] [kline_file ...]")
+        sys.exit(1)
+    store = DataStore(args[0], granularity=granularity)
+    for data_path in args[1:]:
+        written = store.ingest(data_path)
+        print(f"{data_path}: {len(written)}个分区, {sum(written.values())}根K线")
+    with pl.Config(tbl_rows=-1, tbl_cols=-1):
+        print(store.catalog())
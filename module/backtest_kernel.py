@@ -0,0 +1,125 @@
+import numpy as np
+from .exchange import Order
+
+# 数组内核用到的行情列（另加策略的挂单价格列）
+KERNEL_COLUMNS = ("open", "high", "low", "close")
+
+
+def run_array_backtest(market_data, exchange):
+    """
+    数组内核：与逐bar循环的成交/下单状态机完全一致，但只在成交点上推进。
+
+    逐bar循环中，每根K线都会按策略状态挂出一张新的限价单（默认策略空仓挂bottom_threshold买单，
+    持仓挂vwap卖单），下一根K线判断是否成交。因此第i根K线能成交的挂单只取决于
+    第i-1根K线的挂单价格和第i根K线的高低价，可以先向量化求出每种挂单的全部候选成交点，
+    再按策略状态二分查找下一个成交点，循环次数等于成交次数而不是K线数。
+
+    market_data.iter_chunks()按时间顺序给出一个或多个数据块（分块模式下每块单独读取和计算指标），
+    块与块之间带上前一块的最后一根K线，前一块最后挂出的订单可以在下一块的第一根K线成交，
+    结果与整段数据一次处理相同。
+    """
+    strategy = market_data.strategy
+    names = KERNEL_COLUMNS + strategy.price_columns()
+    state = strategy.initial_state()
+
+    offset = 0          # 之前各块的K线总数
+    previous = None     # 前一块最后一根K线的各列值
+    last_chunk = None
+    for chunk in market_data.iter_chunks():
+        bars = chunk.get_total_bars()
+        if bars == 0:
+            continue
+        columns = chunk.get_columns(names)
+        lead = 0
+        if previous is not None:
+            columns = {name: np.concatenate(([previous[name]], columns[name])) for name in names}
+            lead = 1
+        state = _run_segment(chunk, exchange, strategy, state, columns, lead, offset)
+        previous = {name: columns[name][-1] for name in names}
+        offset += bars
+        last_chunk = chunk
+
+    if last_chunk is None:
+        return
+
+    # 还原最后一根K线挂出的订单，保持与逐bar循环相同的订单状态
+    exchange.order_id_counter = offset
+    side, column = strategy.order(state)
+    exchange.limit_order = Order(offset, side, float(previous[column]))
+
+    # 最后一根K线有持仓则强制平仓
+    bars = last_chunk.get_total_bars()
+    last_chunk.seek(bars)
+    if exchange.position > 0:
+        exchange.force_close_position(float(previous["open"]), timestamp=last_chunk.get_timestamp(bars - 1))
+
+
+def _run_segment(chunk, exchange, strategy, state, columns, lead, offset):
+    """
+    处理一个数据块，返回块末的策略状态。
+    columns的前lead行是上一块的最后一根K线（只用于判断它挂出的订单能否在本块第一根K线成交），
+    offset为本块第一根K线的全局序号
+    """
+    open_price = columns["open"]
+    high = columns["high"]
+    low = columns["low"]
+    close = columns["close"]
+    intrabar = exchange.intrabar
+
+    # 每种挂单（方向, 价格列）的候选成交点：第i根K线下的单最早在第i+1根K线成交
+    hits = {}
+
+    def candidate_bars(side, column):
+        if (side, column) not in hits:
+            limit = columns[column]
+            if side == "buy":
+                hits[side, column] = np.flatnonzero(low[1:] <= limit[:-1]) + 1
+            else:
+                hits[side, column] = np.flatnonzero(high[1:] >= limit[:-1]) + 1
+        return hits[side, column]
+
+    # 成交点以及成交后的账户状态（用于重建每根K线的净值）
+    fill_bars = []
+    cash_states = [exchange.cash]
+    position_states = [exchange.position]
+
+    last_bar = 0
+    while True:
+        side, column = strategy.order(state)
+        bars = candidate_bars(side, column)
+        k = np.searchsorted(bars, last_bar, side="right")
+        if k == len(bars):
+            break
+        bar = int(bars[k])
+        limit_price = float(columns[column][bar - 1])
+        if side == "buy":
+            fill_price = min(limit_price, float(open_price[bar]))
+        else:
+            fill_price = max(limit_price, float(open_price[bar]))
+        fill_timestamp = chunk.get_timestamp(bar - lead)
+        last_bar = bar
+        if intrabar is not None:
+            # 秒级数据未确认成交时这张单作废，从下一张单的候选成交点继续查找
+            fill_price, fill_timestamp = intrabar.fill(side, limit_price, fill_timestamp, fill_price)
+            if fill_price is None:
+                continue
+
+        # 逐bar循环中每根K线下一张单，第bar-1根K线下的单编号为bar（全局序号）
+        order_id = offset + bar - lead
+        exchange.order_id_counter = order_id
+        order = Order(order_id, side, limit_price)
+        exchange.execute_limit_order(order, fill_price, timestamp=fill_timestamp)
+
+        state = strategy.on_fill(state, side)
+
+        fill_bars.append(bar)
+        cash_states.append(exchange.cash)
+        position_states.append(exchange.position)
+
+    # 重建每根K线的净值：成交发生在记录净值之前
+    segment_lengths = np.diff(np.asarray([lead] + fill_bars + [len(close)]))
+    cash = np.repeat(np.asarray(cash_states, dtype=np.float64), segment_lengths)
+    position = np.repeat(np.asarray(position_states, dtype=np.float64), segment_lengths)
+    nav = cash + close[lead:] * position
+    exchange.record_nav_series(chunk.get_column("open_time"), nav)
+    return state
@@ -1,89 +1,198 @@
+import json
 import logging
 import threading
 import time
-from queue import Queue, Empty
+from collections import deque
+from datetime import datetime, timedelta
+
+# 日志级别，沿用标准库logging的数值
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+LEVEL_NAMES = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def parse_level(level):
+    """日志级别既可以是数值，也可以是'DEBUG'/'INFO'等名称"""
+    if isinstance(level, str):
+        return LEVEL_NAMES[level.upper()]
+    return level
+
+
+def _encode_arg(value):
+    """
+    事件格式中datetime参数编码为毫秒时间戳；
+    numpy标量转换为对应的Python值，其他无法直接序列化的参数依次尝试float()和str()
+    """
+    if isinstance(value, datetime):
+        return {"dt": (value - _EPOCH) // _MILLISECOND}
+    if hasattr(value, "item"):
+        return value.item()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _decode_arg(value):
+    if isinstance(value, dict) and "dt" in value:
+        return _EPOCH + value["dt"] * _MILLISECOND
+    return value
+
+
+def read_event_log(log_file):
+    """
+    读取结构化事件格式（jsonl）的日志，逐条返回(级别, 格式化后的消息)
+    """
+    templates = {}
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                # 模板定义行
+                templates[record["id"]] = record["fmt"]
+                continue
+            template_id, level, *args = record
+            message = templates[template_id]
+            if args:
+                message = message.format(*(_decode_arg(arg) for arg in args))
+            yield level, message
+
 
 class BufferedLogger:
-    
-    def __init__(self, log_file, buffer_size=1000, flush_interval=5.0):
+    """
+    低开销缓冲日志器
+
+    - 日志级别：低于level的消息在调用处直接丢弃，不做任何格式化
+    - 延迟格式化：调用方只放入(级别, 模板, 参数)元组，由后台线程格式化
+    - 批量写入：后台线程每次醒来一次性取走队列中的全部消息，用writelines写入
+    - log_format为'jsonl'时写结构化事件格式：模板只写一次，之后每条消息只写模板编号、级别和原始参数
+
+    队列使用collections.deque，append/popleft在GIL下是原子的，
+    生产者每条消息只是一次append，不再有Queue.put的加锁和条件变量通知。
+    队列不设上限：回测循环中的生产者既不阻塞也不丢弃消息，
+    积压只取决于后台线程的写入速度，可以从stats()的log_max_queue_depth观察。
+    格式化失败的消息（模板与参数不匹配等）写为一条ERROR消息，不会中断后台线程。
+    """
+
+    def __init__(self, log_file, buffer_size=1000, flush_interval=5.0, level=DEBUG, log_format='text', poll_interval=0.1):
+        if log_format not in ('text', 'jsonl'):
+            raise ValueError(f"unknown log format: {log_format}")
         self.log_file = log_file                    # 日志文件路径
-        self.buffer_size = buffer_size              # 缓冲区大小阈值
-        self.flush_interval = flush_interval        # 刷新时间间隔
-        self.buffer = []                            # 本地缓冲区（保留兼容性）
-        self.queue = Queue()                        # 线程安全的消息队列
+        self.buffer_size = buffer_size              # 单次写入的最大消息数
+        self.flush_interval = flush_interval        # 刷新到磁盘的时间间隔
+        self.level = parse_level(level)             # 日志级别
+        self.log_format = log_format                # 日志格式：'text'或'jsonl'
+        self.poll_interval = poll_interval          # 后台线程检查队列的间隔
+        self.queue = deque()                        # 消息队列（线程安全的append/popleft）
         self.stop_event = threading.Event()        # 线程停止事件
-        self.lock = threading.Lock()               # 线程锁（保留兼容性）
-        
+        self.templates = {}                         # jsonl格式：模板 -> 编号
+
+        # 统计（只在后台线程中更新，生产者不做任何计数）
+        self.messages_written = 0                   # 已写入的消息数
+        self.batches_written = 0                    # 批量写入次数
+        self.max_queue_depth = 0                    # 后台线程观察到的最大队列深度
+        self.format_errors = 0                      # 格式化失败的消息数
+
         # 启动后台写入线程
         # daemon=True 表示守护线程，主程序结束时自动结束
         self.writer_thread = threading.Thread(target=self._writer_worker, daemon=True)
         self.writer_thread.start()
-    
-    def info(self, message):
-        self.queue.put(message)
-    
+
+    def is_enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, message, *args):
+        """记录一条消息：有args时message为str.format模板，由后台线程格式化"""
+        if level >= self.level:
+            self.queue.append((level, message, args))
+
+    def debug(self, message, *args):
+        if DEBUG >= self.level:
+            self.queue.append((DEBUG, message, args))
+
+    def info(self, message, *args):
+        if INFO >= self.level:
+            self.queue.append((INFO, message, args))
+
+    def warning(self, message, *args):
+        if WARNING >= self.level:
+            self.queue.append((WARNING, message, args))
+
+    def _format_text(self, level, message, args):
+        return [(message.format(*args) if args else message) + '\n']
+
+    def _format_jsonl(self, level, message, args):
+        template_id = self.templates.get(message)
+        if template_id is not None:
+            return [json.dumps([template_id, level, *args], ensure_ascii=False, separators=(',', ':'), default=_encode_arg) + '\n']
+        # 消息序列化成功后才登记新模板
+        template_id = len(self.templates)
+        line = json.dumps([template_id, level, *args], ensure_ascii=False, separators=(',', ':'), default=_encode_arg) + '\n'
+        self.templates[message] = template_id
+        return [json.dumps({"id": template_id, "fmt": message}, ensure_ascii=False) + '\n', line]
+
+    def _format(self, formatter, records):
+        """逐条格式化，失败的消息替换为一条说明原因的ERROR消息"""
+        lines = []
+        for level, message, args in records:
+            try:
+                lines.extend(formatter(level, message, args))
+            except Exception as exc:
+                self.format_errors += 1
+                lines.extend(formatter(ERROR, f"log format error {exc!r}: {message!r} {args!r}", ()))
+        return lines
+
+    def _drain(self):
+        """一次性取走队列中当前的全部消息（最多buffer_size条）"""
+        count = min(len(self.queue), self.buffer_size)
+        popleft = self.queue.popleft
+        return [popleft() for _ in range(count)]
+
     def _writer_worker(self):
-        buffer = []                                 # 本地消息缓冲区
+        formatter = self._format_jsonl if self.log_format == 'jsonl' else self._format_text
         last_flush = time.time()                   # 上次刷新时间戳
-        
+
         # 打开日志文件，使用UTF-8编码
         with open(self.log_file, 'w', encoding='utf-8') as f:
             # 主循环：持续处理消息直到收到停止信号
-            while not self.stop_event.is_set():
-                try:
-                    # 从队列获取消息，超时时间1秒
-                    # 超时设计的目的：定期检查停止信号和待刷新数据
-                    message = self.queue.get(timeout=1.0)
-                    buffer.append(message)
-                    
-                    # 检查是否需要刷新缓冲区
-                    now = time.time()
-                    if (len(buffer) >= self.buffer_size or           # 缓冲区满了
-                        now - last_flush >= self.flush_interval):    # 超过时间间隔
-                        
-                        # 批量写入所有缓冲的消息
-                        for msg in buffer:
-                            f.write(msg + '\n')
-                        f.flush()                                    # 强制刷新到磁盘
-                        buffer.clear()                               # 清空缓冲区
-                        last_flush = now                             # 更新刷新时间
-                        
-                except Empty:
-                    # 队列超时（1秒内没有新消息）
-                    # 这是正常情况，用于定期检查和维护
-                    if buffer:
-                        # 如果有待写入的数据，立即写入
-                        for msg in buffer:
-                            f.write(msg + '\n')
-                        f.flush()
-                        buffer.clear()
-                        last_flush = time.time()
-            
-            # 程序结束处理：确保所有消息都被写入
-            # 这部分代码在收到停止信号后执行
-            while not self.queue.empty():
-                try:
-                    # 非阻塞方式获取剩余消息
-                    message = self.queue.get_nowait()
-                    buffer.append(message)
-                except Empty:
-                    # 队列已空，跳出循环
+            while True:
+                stopped = self.stop_event.wait(self.poll_interval)
+                # 批量写入所有排队的消息
+                depth = len(self.queue)
+                if depth > self.max_queue_depth:
+                    self.max_queue_depth = depth
+                while self.queue:
+                    records = self._drain()
+                    f.writelines(self._format(formatter, records))
+                    self.messages_written += len(records)
+                    self.batches_written += 1
+                now = time.time()
+                if stopped or now - last_flush >= self.flush_interval:
+                    f.flush()                                    # 强制刷新到磁盘
+                    last_flush = now
+                if stopped:
                     break
-            
-            # 写入最后的缓冲数据
-            if buffer:
-                for msg in buffer:
-                    f.write(msg + '\n')
-                f.flush()
-    
+
+    def stats(self):
+        """日志统计：入队消息数 = 已写入 + 仍在队列中"""
+        depth = len(self.queue)
+        return {
+            'log_messages_enqueued': self.messages_written + depth,
+            'log_messages_written': self.messages_written,
+            'log_batches_written': self.batches_written,
+            'log_queue_depth': depth,
+            'log_max_queue_depth': max(self.max_queue_depth, depth),
+            'log_format_errors': self.format_errors,
+        }
+
     def close(self):
         # 设置停止事件，通知后台线程停止工作
         self.stop_event.set()
-        
-        # 等待后台线程完成工作
-        if self.writer_thread.is_alive():
-            # 最多等待5秒，避免程序无限等待
-            self.writer_thread.join(timeout=5.0)
-            
-            # 如果线程仍然活着，说明可能有问题
-            # 在生产环境中可以添加警告日志
+
+        # 等待后台线程写完队列中剩余的全部消息
+        self.writer_thread.join()
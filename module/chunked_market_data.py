@@ -0,0 +1,195 @@
+import queue
+import threading
+from datetime import datetime, timedelta
+import polars as pl
+from .market_data import MarketData, scan_klines, compute_indicators, indicator_block_start, DATE_FORMAT
+from .kline_pyramid import floor_time
+
+# 预取线程结束的标记
+_END = object()
+# 预取线程放入队列时检查停止信号的间隔（秒）
+_PUT_TIMEOUT = 0.1
+
+
+class ChunkedMarketData(MarketData):
+    """
+    分块（out-of-core）市场数据：按时间顺序每次只读取chunk_days天的K线并计算指标，
+    内存占用取决于块大小而不是数据总量。
+
+    - 块边界对齐到聚合周期，聚合桶不会被块边界切开
+    - 指标与MarketData一样用compute_indicators按纪元时间对齐的指标块计算：读入的K线先缓存，
+      指标块完整后才计算并输出，块前面接上之前读取的最后required_history()根K线，
+      因此指标、成交和净值与一次性读取全部数据逐位相同
+    - 后台线程预先读取并计算后面prefetch块，与当前块的回测并行（polars计算时释放GIL）；
+      回测中途出错或提前结束时由close()通知后台线程停止并等待其退出
+
+    内存占用取决于chunk_days与指标块长度（INDICATOR_BLOCK_BARS根K线）中较大的一个。
+    逐bar循环通过get_current_bar/next_bar/has_more_data顺序读取；数组内核通过iter_chunks逐块处理。
+    总K线数事先未知，get_total_bars返回None。数据只能顺序读取一遍，不支持slice和指标缓存。
+    """
+
+    def __init__(self, data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma, chunk_days=30, prefetch=1, **kwargs):
+        self.chunk_days = chunk_days    # 每块的天数
+        self.prefetch = prefetch        # 预取的块数
+        self._frames = None             # 各块指标帧的迭代器（开始读取后创建）
+        self._chunk = None              # 当前块
+        self._chunk_index = 0           # 当前块内的游标
+        super().__init__(data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma, **kwargs)
+
+    def _load_data(self):
+        # 不在构造时读取数据，按块读取
+        return None
+
+    def _bounds(self):
+        """读取区间：[预热起点或start_date或数据开头, end_date或数据末尾]"""
+        start = datetime.strptime(self.start_date, DATE_FORMAT) if self.start_date is not None else None
+        end = datetime.strptime(self.end_date, DATE_FORMAT) if self.end_date is not None else None
+        scan_start = start
+        if self.warmup and start is not None:
+            scan_start = self._warmup_start(indicator_block_start(start, self.interval))
+        if scan_start is None or end is None:
+            source = self.pyramid.scan(1) if self.pyramid is not None else scan_klines(self.data_path)
+            first, last = source.select(
+                pl.col("open_time").cast(pl.Datetime(time_unit="ms")).min().alias("first"),
+                pl.col("open_time").cast(pl.Datetime(time_unit="ms")).max().alias("last"),
+            ).collect().row(0)
+            scan_start = scan_start if scan_start is not None else first
+            end = end if end is not None else last
+        return start, scan_start, end
+
+    def _iter_frames(self):
+        """按时间顺序逐块读取K线，每凑齐完整的指标块就计算指标并输出"""
+        start, chunk_start, end = self._bounds()
+        if chunk_start is None:
+            return
+        history = self.strategy.required_history()
+        span = timedelta(days=self.chunk_days)
+        buffer = None   # 尚未计算指标的K线，前面带着offset根已经输出过、只作为历史的K线
+        offset = 0
+        while chunk_start <= end:
+            # 块的结束边界对齐到聚合周期
+            chunk_end = max(floor_time(chunk_start + span, self.interval),
+                            floor_time(chunk_start, self.interval) + timedelta(minutes=self.interval))
+            # profiler在后台线程中只计本线程的CPU时间，避免与主线程重复计算
+            with self.profiler.phase("load_data.chunk", thread_cpu=self.prefetch > 0):
+                klines = self._scan(chunk_start, min(chunk_end - timedelta(milliseconds=1), end)).collect()
+                buffer = klines if buffer is None else pl.concat([buffer, klines])
+                # 最后一块读完后全部计算，否则只计算结束时间不晚于chunk_end的完整指标块
+                if chunk_end > end:
+                    ready = len(buffer)
+                else:
+                    boundary = indicator_block_start(chunk_end, self.interval)
+                    ready = buffer.select((pl.col("open_time") < boundary).sum()).item()
+                data = None
+                if ready > offset:
+                    data = compute_indicators(self.strategy, buffer.slice(0, ready), self.interval, offset)
+                    # 去掉预热部分
+                    if self.warmup and start is not None:
+                        data = data.filter(pl.col("open_time") >= start)
+                    keep = max(ready - history, 0)
+                    buffer = buffer.slice(keep)
+                    offset = ready - keep
+            if data is not None:
+                yield data
+            chunk_start = chunk_end
+
+    def _prefetched(self, frames):
+        """
+        在后台线程中提前计算后面的块。
+        生成器被关闭（close()或回测出错）时通知后台线程停止，并等待其退出
+        """
+        pending = queue.Queue(maxsize=max(self.prefetch, 1))
+        stop = threading.Event()
+
+        def put(item):
+            # 队列满时定期检查停止信号，消费者不再读取时不会一直阻塞
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=_PUT_TIMEOUT)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for frame in frames:
+                    if not put(frame):
+                        return
+                put(_END)
+            except BaseException as error:
+                put(error)
+            finally:
+                frames.close()
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    def _next_frame(self):
+        if self._frames is None:
+            frames = self._iter_frames()
+            self._frames = self._prefetched(frames) if self.prefetch > 0 else frames
+        return next(self._frames, None)
+
+    def close(self):
+        """停止读取：关闭块迭代器，有预取线程时等待其退出；之后不再产出数据"""
+        if self._frames is not None:
+            self._frames.close()
+        self._frames = iter(())
+        self._chunk = None
+
+    def iter_chunks(self):
+        """
+        按时间顺序逐块给出数据（普通的MarketData，数组内核使用），读取过的K线计入current_index
+        """
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return
+            if len(frame) == 0:
+                continue
+            self.current_index += len(frame)
+            yield self.with_data(frame)
+
+    def get_current_bar(self):
+        if self.has_more_data():
+            return self._chunk.row(self._chunk_index, named=True)
+        return None
+
+    def next_bar(self):
+        self.current_index += 1
+        self._chunk_index += 1
+        return self.has_more_data()
+
+    def has_more_data(self):
+        # 当前块读完时切换到下一个非空的块
+        while self._chunk is None or self._chunk_index >= len(self._chunk):
+            frame = self._next_frame()
+            if frame is None:
+                self._chunk = None
+                return False
+            self._chunk = frame
+            self._chunk_index = 0
+        return True
+
+    def get_total_bars(self):
+        return None
+
+    def get_timestamp(self, index=None):
+        if index is not None:
+            raise ValueError("chunked market data can only be read sequentially")
+        return self._chunk["open_time"][self._chunk_index]
+
+    def slice(self, start=None, end=None):
+        raise TypeError("chunked market data can only be read sequentially")
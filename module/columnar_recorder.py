@@ -0,0 +1,60 @@
+import numpy as np
+import polars as pl
+
+
+class ColumnarRecorder:
+    """
+    列式记录器：每个字段一列预分配的NumPy数组，容量不足时按倍数扩容
+
+    相比逐条append字典，内存只有每个值本身的字节数；
+    to_frame/column返回的是底层数组的视图，交给polars时不复制。
+    """
+
+    def __init__(self, schema, capacity=1024):
+        self.schema = dict(schema)      # 字段名 -> NumPy dtype
+        self.size = 0                   # 已记录的行数
+        self.columns = {name: np.empty(max(capacity, 1), dtype=dtype) for name, dtype in self.schema.items()}
+
+    def __len__(self):
+        return self.size
+
+    def capacity(self):
+        return len(next(iter(self.columns.values())))
+
+    def reserve(self, capacity):
+        """预分配至少capacity行的空间"""
+        if capacity <= self.capacity():
+            return
+        for name, column in self.columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def append(self, *values):
+        """按schema顺序追加一行"""
+        if self.size == self.capacity():
+            self.reserve(self.capacity() * 2)
+        index = self.size
+        for column, value in zip(self.columns.values(), values):
+            column[index] = value
+        self.size += 1
+
+    def extend(self, **arrays):
+        """按列批量追加多行"""
+        length = len(next(iter(arrays.values())))
+        if self.size + length > self.capacity():
+            self.reserve(max(self.size + length, self.capacity() * 2))
+        for name, column in self.columns.items():
+            column[self.size:self.size + length] = arrays[name]
+        self.size += length
+
+    def column(self, name):
+        """返回某一列已记录部分的视图"""
+        return self.columns[name][:self.size]
+
+    def last(self, name):
+        return self.columns[name][self.size - 1]
+
+    def to_frame(self):
+        """零复制转换为polars DataFrame"""
+        return pl.DataFrame([pl.Series(name, self.column(name)) for name in self.columns])
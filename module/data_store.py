@@ -0,0 +1,155 @@
+import os
+import threading
+from datetime import datetime
+import polars as pl
+from .market_data import scan_klines, partition_paths, time_literal, KLINE_COLUMNS
+
+
+# 分区文件支持的压缩方式：未压缩的文件可以零复制内存映射，lz4/zstd读取时需要解压
+COMPRESSIONS = ("uncompressed", "lz4", "zstd")
+# 分区粒度 -> 分区文件名格式：分钟K线按月分区，秒级K线按天分区
+GRANULARITIES = {"month": "%Y-%m", "day": "%Y-%m-%d"}
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+class DataStore:
+    """
+    本地K线数据仓库：每个品种一个目录，每个月（granularity="day"时每天）一个Arrow IPC分区文件
+
+        root/SOLUSDT/2021-01.arrow
+        root/SOLUSDT/2021-02.arrow
+        ...
+
+    分区内按open_time排序，open_time统一为Datetime("ms")。
+    秒级K线数据量是分钟K线的60倍，按天分区，供逐笔成交模拟按需读取单日数据（见IntrabarFills）。
+    品种目录可以直接作为回测配置的data_path：MarketData只内存映射与回测区间（含预热）有交集的分区，
+    多个回测进程共享同一份操作系统页缓存，而不是各自解压一份完整数据。
+    """
+
+    def __init__(self, root_dir, granularity="month"):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"unknown granularity: {granularity}")
+        self.root_dir = root_dir    # 仓库根目录
+        self.granularity = granularity  # 分区粒度：'month'或'day'
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def symbol_path(self, symbol):
+        """品种目录（即回测配置中的data_path）"""
+        return os.path.join(self.root_dir, symbol)
+
+    def symbols(self):
+        """已入库的品种"""
+        return sorted(
+            name for name in os.listdir(self.root_dir)
+            if os.path.isdir(self.symbol_path(name)) and partition_paths(self.symbol_path(name))
+        )
+
+    def ingest(self, data_path, symbol=None, compression="uncompressed"):
+        """
+        把一个K线文件（parquet或Arrow IPC）按分区写入仓库，与已有分区合并（同一open_time以新数据为准）。
+        symbol默认取jj_code列的第一个值，没有时取文件名。返回 {分区名: 行数}
+        源文件逐月读取，按天分区时再把一个月的数据拆分为单日分区
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"unknown compression: {compression}")
+        source = scan_klines(data_path)
+        schema = source.collect_schema()
+        time_dtype = schema["open_time"]
+        if symbol is None:
+            symbol = self._symbol_of(source, schema, data_path)
+        directory = self.symbol_path(symbol)
+        os.makedirs(directory, exist_ok=True)
+
+        bounds = source.select(
+            pl.col("open_time").cast(pl.Datetime(time_unit="ms")).min().alias("first"),
+            pl.col("open_time").cast(pl.Datetime(time_unit="ms")).max().alias("last")
+        ).collect().row(0)
+        if bounds[0] is None:
+            return {}
+
+        written = {}
+        month = datetime(bounds[0].year, bounds[0].month, 1)
+        while month <= bounds[1]:
+            following = _next_month(month)
+            # 与原始列比较，月份过滤可以下推到parquet的row group统计信息
+            part = source.filter(
+                (pl.col("open_time") >= time_literal(month, time_dtype)) & (pl.col("open_time") < time_literal(following, time_dtype))
+            ).select(
+                [name for name in KLINE_COLUMNS if name in schema]
+            ).with_columns(
+                open_time = pl.col("open_time").cast(pl.Datetime(time_unit="ms"))
+            ).sort("open_time").collect()
+            if self.granularity == "day":
+                parts = part.with_columns(
+                    partition = pl.col("open_time").dt.truncate("1d")
+                ).partition_by("partition", maintain_order=True, as_dict=True)
+                parts = {key[0]: frame.drop("partition") for key, frame in parts.items()}
+            else:
+                parts = {month: part} if len(part) > 0 else {}
+            for partition, frame in parts.items():
+                name = partition.strftime(GRANULARITIES[self.granularity])
+                written[name] = self._write_partition(directory, name, frame, compression)
+            month = following
+        return written
+
+    @staticmethod
+    def _symbol_of(source, schema, data_path):
+        if "jj_code" in schema:
+            code = source.select(pl.col("jj_code").drop_nulls().first()).collect().item()
+            if code:
+                return str(code)
+        return os.path.splitext(os.path.basename(data_path))[0]
+
+    def _write_partition(self, directory, name, data, compression):
+        """写入一个分区（与已有数据合并），先写临时文件再原子替换，读取中的进程不受影响"""
+        path = os.path.join(directory, f"{name}.arrow")
+        if os.path.exists(path):
+            existing = pl.read_ipc(path, memory_map=False)
+            data = pl.concat([existing, data], how="vertical_relaxed").unique(
+                "open_time", keep="last", maintain_order=True
+            ).sort("open_time")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data.write_ipc(tmp_path, compression=compression)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def scan(self, symbol, start=None, end=None):
+        """惰性读取某品种[start, end]区间的K线（只内存映射覆盖该区间的分区）"""
+        data = scan_klines(self.symbol_path(symbol), start, end)
+        if start is not None:
+            data = data.filter(pl.col("open_time") >= start)
+        if end is not None:
+            data = data.filter(pl.col("open_time") <= end)
+        return data
+
+    def catalog(self):
+        """
+        仓库目录：每个品种的分区数、行数、起止时间和磁盘大小
+        """
+        rows = []
+        for symbol in self.symbols():
+            paths = partition_paths(self.symbol_path(symbol))
+            stats = pl.concat([
+                pl.scan_ipc(path, memory_map=True).select(
+                    pl.len().alias("rows"),
+                    pl.col("open_time").min().alias("first"),
+                    pl.col("open_time").max().alias("last"),
+                ) for path in paths
+            ]).collect()
+            rows.append({
+                "symbol": symbol,
+                "partitions": len(paths),
+                "first_partition": os.path.splitext(os.path.basename(paths[0]))[0],
+                "last_partition": os.path.splitext(os.path.basename(paths[-1]))[0],
+                "rows": int(stats["rows"].sum()),
+                "first": stats["first"].min(),
+                "last": stats["last"].max(),
+                "bytes": sum(os.path.getsize(path) for path in paths),
+            })
+        return pl.DataFrame(rows, schema={
+            "symbol": pl.String, "partitions": pl.Int64, "first_partition": pl.String, "last_partition": pl.String,
+            "rows": pl.Int64, "first": pl.Datetime(time_unit="ms"), "last": pl.Datetime(time_unit="ms"), "bytes": pl.Int64,
+        })
@@ -1,21 +1,131 @@
+import heapq
+import math
 import polars as pl
-from datetime import datetime
-from .buffered_logger import BufferedLogger
+from datetime import datetime, timedelta
+from .buffered_logger import BufferedLogger, DEBUG
+from .columnar_recorder import ColumnarRecorder
+from .performance import OnlineMetrics
+from .profiler import NULL_PROFILER
 import numpy as np
 
+# 交易方向编码（列式记录中使用）
+SIDE_CODES = {"buy": 1, "sell": -1}
+# 缺失时间戳的占位值
+NULL_TIMESTAMP = np.iinfo(np.int64).min
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+# 净值记录字段：int64毫秒时间戳 + 净值
+NAV_SCHEMA = {"timestamp": np.int64, "nav": np.float64}
+# 交易记录字段
+TRADE_SCHEMA = {
+    "timestamp": np.int64,
+    "order_id": np.int64,
+    "side": np.int8,
+    "price": np.float64,
+    "quantity": np.float64,
+    "fee": np.float64,
+    "cash": np.float64,
+    "position": np.float64,
+    "realized_pnl": np.float64,
+}
+
+
+def to_epoch_ms(timestamp):
+    """datetime转换为int64毫秒时间戳，None转换为占位值"""
+    if timestamp is None:
+        return NULL_TIMESTAMP
+    return (timestamp - _EPOCH) // _MILLISECOND
+
 # 订单类
 class Order:
-    def __init__(self, order_id, side, limit_price, order_type='limit'):
+    def __init__(self, order_id, side, limit_price, order_type='limit', quantity=None):
         self.order_id = order_id
         self.side = side  # "buy" or "sell"
         self.limit_price = limit_price
-        self.quantity = None
+        self.quantity = quantity  # 委托数量（单一限价单成交时为成交数量）
+        self.remaining = quantity  # 挂单簿中尚未成交的数量
         self.order_type = order_type
         self.fill_price = None
 
+
+# 挂单簿
+class OrderBook:
+    """
+    限价挂单簿：买单按价格从高到低、卖单按价格从低到高保存在堆中，同价按挂单先后。
+
+    每根K线只需查看堆顶：买一价低于最低价（卖一价高于最高价）时没有任何挂单能成交，
+    撮合只触及真正成交的挂单，与挂单总数无关。
+    撤单只从索引中删除（O(1)），堆中的失效条目到达堆顶时才丢弃（均摊O(log n)）；
+    失效条目超过有效挂单数时整体重建一次堆，堆的大小始终与有效挂单数同阶。
+    """
+
+    def __init__(self):
+        self.bids = []      # 买单堆：(-价格, 序号, 订单)
+        self.asks = []      # 卖单堆：(价格, 序号, 订单)
+        self.orders = {}    # 订单ID -> 有效挂单
+        self.sequence = 0   # 挂单序号，保证同价先到先成交
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def get(self, order_id):
+        return self.orders.get(order_id)
+
+    def add(self, order):
+        self.sequence += 1
+        self.orders[order.order_id] = order
+        if order.side == "buy":
+            heapq.heappush(self.bids, (-order.limit_price, self.sequence, order))
+        else:
+            heapq.heappush(self.asks, (order.limit_price, self.sequence, order))
+
+    def cancel(self, order_id):
+        """撤单，返回被撤的订单（不存在时返回None）"""
+        order = self.orders.pop(order_id, None)
+        if len(self.bids) + len(self.asks) > 2 * len(self.orders) + 64:
+            self._compact()
+        return order
+
+    def _compact(self):
+        """去掉堆中的失效条目"""
+        self.bids = [entry for entry in self.bids if self.orders.get(entry[2].order_id) is entry[2]]
+        self.asks = [entry for entry in self.asks if self.orders.get(entry[2].order_id) is entry[2]]
+        heapq.heapify(self.bids)
+        heapq.heapify(self.asks)
+
+    def _top(self, heap):
+        # 丢弃已撤销或已被替换的条目
+        while heap and self.orders.get(heap[0][2].order_id) is not heap[0][2]:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def best_bid(self):
+        """价格最高的买单"""
+        return self._top(self.bids)
+
+    def best_ask(self):
+        """价格最低的卖单"""
+        return self._top(self.asks)
+
+    def remove_best(self, side):
+        """移除完全成交的堆顶订单"""
+        heap = self.bids if side == "buy" else self.asks
+        order = heapq.heappop(heap)[2]
+        del self.orders[order.order_id]
+        return order
+
+    def clear(self):
+        self.bids.clear()
+        self.asks.clear()
+        self.orders.clear()
+
 # 交易所类
 class Exchange:
-    def __init__(self, initial_balance, fee_rate, log_file):
+    def __init__(self, initial_balance, fee_rate, log_file, log_level=DEBUG, log_format='text', profiler=None, store_nav=True, max_volume_fraction=None, intrabar=None):
         # 基础账户信息
         self.initial_balance = initial_balance  # 初始资金
         self.cash = initial_balance     # 当前现金余额
@@ -28,25 +138,33 @@ class Exchange:
         # 订单管理
         self.order_id_counter = 0  # 订单ID计数器
         self.limit_order = None  # 当前订单
+        self.book = OrderBook()  # 挂单簿（多张同时挂出的限价单）
+        self.max_volume_fraction = max_volume_fraction  # 每根K线每个方向最多成交该K线成交量的比例，None表示不限制
+        self.intrabar = intrabar    # K线内成交模拟（IntrabarFills），None表示按分钟K线的高低价成交
 
         # 交易记录
-        self.trades = []    # 所有交易记录列表
-        self.minute_nav = []     # 每分钟净值记录
+        self.trades = ColumnarRecorder(TRADE_SCHEMA)    # 所有交易记录（列式）
+        self.minute_nav = ColumnarRecorder(NAV_SCHEMA, capacity=4096)     # 每分钟净值记录（列式）
+        self.store_nav = store_nav      # 是否保存完整净值序列，为False时只更新增量指标
+        self.metrics = OnlineMetrics()  # 增量绩效指标，随净值和交易记录更新
         self.realized_pnl = 0   # 累计已实现盈亏
         self.trades_records = []   # 详细交易记录表格
 
         # 日志系统
-        self.logger = BufferedLogger(log_file)  # 使用缓冲日志器记录交易过程
+        self.logger = BufferedLogger(log_file, level=log_level, log_format=log_format)  # 使用缓冲日志器记录交易过程
 
         # 时间管理
         self.current_timestamp = None   # 当前交易时间戳
+
+        # 分阶段计时
+        self.profiler = profiler or NULL_PROFILER
     
     def place_order(self, side, limit_price=None, order_type='limit', timestamp=None):
         self.order_id_counter += 1
         self.limit_order = Order(self.order_id_counter, side, limit_price, order_type)
-        # 记录下单日志，便于调试和分析
-        time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.logger.info(f"{time_str} - 下单: {side.upper()} @ ${limit_price:.2f} ({order_type})")
+        # 记录下单日志，便于调试和分析（DEBUG级别，逐bar下单，关闭时不做任何格式化）
+        if self.logger.is_enabled(DEBUG):
+            self.logger.debug("{:%Y-%m-%d %H:%M:%S} - 下单: {} @ ${:.2f} ({})", timestamp or datetime.now(), side.upper(), limit_price, order_type)
     
     def execute_limit_order(self, order, fill_price, timestamp=None):
         """执行限价订单函数"""
@@ -58,7 +176,7 @@ class Exchange:
             self.cash -= cost  # 扣除现金
             self.position += order.quantity  # 增加持仓
             self.position_cost = fill_price  # 更新持仓成本价
-            self.logger.info(f"买入 {order.quantity} @ ${fill_price:.2f}, 成本 ${cost:.2f} (含手续费 ${fee:.2f})")
+            self.logger.info("买入 {} @ ${:.2f}, 成本 ${:.2f} (含手续费 ${:.2f})", order.quantity, fill_price, cost, fee)
         elif order.side == "sell":
             # 卖出操作
             order.quantity = self.position  # 卖出所有持仓
@@ -68,36 +186,161 @@ class Exchange:
             self.realized_pnl += (fill_price - self.position_cost) * order.quantity - fee  # 更新已实现盈亏
             self.position = 0  # 清空持仓
             self.position_cost = 0  # 重置持仓成本价
-            self.logger.info(f"卖出 {order.quantity} @ ${fill_price:.2f}, 收入 ${revenue:.2f} (含手续费 ${fee:.2f})")
+            self.logger.info("卖出 {} @ ${:.2f}, 收入 ${:.2f} (含手续费 ${:.2f})", order.quantity, fill_price, revenue, fee)
         self.limit_order = None
 
         # 记录交易
-        trade = {
-            "timestamp": timestamp,
-            "order_id": order.order_id,
-            "side": order.side,
-            "price": fill_price,
-            "quantity": order.quantity,
-            "fee": fee,
-            "cash": self.cash,
-            "position": self.position,
-            "realized_pnl": self.realized_pnl
-        }
-        self.trades.append(trade)
+        self.trades.append(
+            to_epoch_ms(timestamp), order.order_id, SIDE_CODES[order.side], fill_price,
+            order.quantity, fee, self.cash, self.position, self.realized_pnl
+        )
+        self.metrics.record_trade(SIDE_CODES[order.side], self.realized_pnl)
+
+    def submit_order(self, side, limit_price, quantity, timestamp=None):
+        """
+        向挂单簿提交一张限价单，返回订单ID；挂单一直有效，直到成交完毕或被撤销。
+        数量必须为正数（None、0、负数或NaN抛出ValueError）
+        """
+        if quantity is None or not quantity > 0:
+            raise ValueError(f"order quantity must be positive: {quantity!r}")
+        self.order_id_counter += 1
+        self.book.add(Order(self.order_id_counter, side, limit_price, 'limit', quantity))
+        if self.logger.is_enabled(DEBUG):
+            self.logger.debug("{:%Y-%m-%d %H:%M:%S} - 挂单 #{}: {} {} @ ${:.2f}", timestamp or datetime.now(), self.order_id_counter, side.upper(), quantity, limit_price)
+        return self.order_id_counter
+
+    def cancel_order(self, order_id):
+        """按订单ID撤单，返回是否撤单成功"""
+        order = self.book.cancel(order_id)
+        if order is None:
+            return False
+        self.logger.debug("撤单 #{}: {} 剩余 {} @ ${:.2f}", order_id, order.side.upper(), order.remaining, order.limit_price)
+        return True
+
+    def replace_order(self, order_id, limit_price=None, quantity=None):
+        """
+        按订单ID改单（价格和/或剩余数量），订单ID不变，按新的挂单时间排队；返回是否成功。
+        给出的新数量必须为正数（0、负数或NaN抛出ValueError，撤单请用cancel_order）
+        """
+        if quantity is not None and not quantity > 0:
+            raise ValueError(f"order quantity must be positive: {quantity!r}")
+        order = self.book.cancel(order_id)
+        if order is None:
+            return False
+        replacement = Order(order_id, order.side,
+                            order.limit_price if limit_price is None else limit_price,
+                            'limit', order.remaining if quantity is None else quantity)
+        self.book.add(replacement)
+        self.logger.debug("改单 #{}: {} {} @ ${:.2f}", order_id, replacement.side.upper(), replacement.remaining, replacement.limit_price)
+        return True
+
+    def match_orders(self, bar, timestamp=None):
+        """
+        用一根K线撮合挂单簿：最低价扫过的买单、最高价扫过的卖单按价格优先依次成交，
+        买单成交价为min(限价, 开盘价)，卖单为max(限价, 开盘价)。
+        每个方向最多成交max_volume_fraction倍的K线成交量，买入受现金限制，卖出受持仓限制，
+        不足时部分成交，剩余数量继续挂在簿上。
+        阳线按开盘→最低→最高→收盘的路径先撮合买单，阴线先撮合卖单。返回成交笔数
+        """
+        if not self.book:
+            return 0
+        capacity = math.inf if self.max_volume_fraction is None else self.max_volume_fraction * bar['volume']
+        sides = ("buy", "sell") if bar['close'] >= bar['open'] else ("sell", "buy")
+        fills = 0
+        for side in sides:
+            available = capacity
+            while available > 0:
+                if side == "buy":
+                    order = self.book.best_bid()
+                    if order is None or order.limit_price < bar['low']:
+                        break
+                    fill_price = min(order.limit_price, bar['open'])
+                    quantity = min(order.remaining, available, self.cash / (fill_price * (1 + self.fee_rate)))
+                else:
+                    order = self.book.best_ask()
+                    if order is None or order.limit_price > bar['high']:
+                        break
+                    fill_price = max(order.limit_price, bar['open'])
+                    quantity = min(order.remaining, available, self.position)
+                if quantity <= 0:
+                    break
+                self._fill_book_order(order, fill_price, quantity, timestamp)
+                fills += 1
+                available -= quantity
+                if order.remaining > 0:
+                    # 成交量、现金或持仓已用完，这一方向不再继续
+                    break
+                self.book.remove_best(side)
+        return fills
+
+    def _fill_book_order(self, order, fill_price, quantity, timestamp):
+        """挂单簿订单成交（可以是部分成交），持仓成本按加权平均计算"""
+        fee = quantity * fill_price * self.fee_rate
+        if order.side == "buy":
+            cost = quantity * fill_price + fee
+            self.cash -= cost
+            self.position_cost = (self.position_cost * self.position + fill_price * quantity) / (self.position + quantity)
+            self.position += quantity
+            self.logger.info("成交 #{}: 买入 {} @ ${:.2f}, 成本 ${:.2f} (含手续费 ${:.2f})", order.order_id, quantity, fill_price, cost, fee)
+        else:
+            revenue = quantity * fill_price - fee
+            self.cash += revenue
+            self.realized_pnl += (fill_price - self.position_cost) * quantity - fee
+            self.position -= quantity
+            if self.position <= 0:
+                self.position = 0
+                self.position_cost = 0
+            self.logger.info("成交 #{}: 卖出 {} @ ${:.2f}, 收入 ${:.2f} (含手续费 ${:.2f})", order.order_id, quantity, fill_price, revenue, fee)
+        order.remaining -= quantity
+        order.fill_price = fill_price
+
+        # 记录交易
+        self.trades.append(
+            to_epoch_ms(timestamp), order.order_id, SIDE_CODES[order.side], fill_price,
+            quantity, fee, self.cash, self.position, self.realized_pnl
+        )
+        self.metrics.record_trade(SIDE_CODES[order.side], self.realized_pnl)
 
     def get_portfolio_value(self, current_price):
         """计算当前组合价值 = 现金 + 仓位价值"""
         unrealized_pnl = current_price * self.position
         return (self.cash + unrealized_pnl)
     
-    def record_minute_nav(self, date, current_price):
+    def reserve_nav(self, total_bars):
+        """按K线数预分配净值记录空间"""
+        if self.store_nav:
+            self.minute_nav.reserve(total_bars)
+
+    def record_minute_nav(self, timestamp, current_price):
         """记录每分钟净值"""
         nav = self.get_portfolio_value(current_price)
-        self.minute_nav.append({'date': date, 'nav': nav})
+        self.metrics.update(nav)
+        if self.store_nav:
+            self.minute_nav.append(to_epoch_ms(timestamp), nav)
+
+    def record_nav_series(self, timestamps, navs):
+        """一次性记录整段净值序列（数组内核使用），timestamps为int64毫秒时间戳"""
+        self.metrics.update_batch(navs)
+        if self.store_nav:
+            self.minute_nav.extend(timestamp=timestamps, nav=navs)
+
+    def _nav_frame(self):
+        """返回净值表（零复制）"""
+        return self.minute_nav.to_frame().with_columns(
+            pl.col("timestamp").cast(pl.Datetime(time_unit="ms"))
+        )
+
+    def nav_records(self):
+        """净值表，store_nav为False时返回None"""
+        return self._nav_frame() if self.store_nav else None
 
     def save_trades_records(self):
-        self.trades_records = pl.DataFrame(self.trades)
-        return pl.DataFrame(self.trades_records)
+        with self.profiler.phase("save_trades"):
+            self.trades_records = self.trades.to_frame().with_columns(
+                timestamp = pl.when(pl.col("timestamp") != NULL_TIMESTAMP).then(pl.col("timestamp")).cast(pl.Datetime(time_unit="ms")).cast(pl.Datetime(time_unit="us")),
+                side = pl.when(pl.col("side") == SIDE_CODES["buy"]).then(pl.lit("buy")).otherwise(pl.lit("sell"))
+            )
+        return self.trades_records
 
     def set_start_date(self, start_date):
         self.start_date = start_date
@@ -107,10 +350,14 @@ class Exchange:
     
     def force_close_position(self, close_price, timestamp=None):
         """强制平仓函数 - 在交易结束时强制清空所有持仓"""
+        # 撤销挂单簿中的全部挂单
+        if self.book:
+            self.logger.info("撤销全部挂单: {} 张", len(self.book))
+            self.book.clear()
         if self.position > 0:
             # 取消当前未成交订单
             if self.limit_order:
-                self.logger.info(f"取消未成交订单: {self.limit_order.side.upper()} @ ${self.limit_order.limit_price:.2f}")
+                self.logger.info("取消未成交订单: {} @ ${:.2f}", self.limit_order.side.upper(), self.limit_order.limit_price)
                 self.limit_order = None
             
             # 强制卖出所有持仓
@@ -122,22 +369,15 @@ class Exchange:
             self.realized_pnl += (close_price - self.position_cost) * quantity - fee
             
             # 记录强制平仓日志
-            time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self.logger.info(f"{time_str} - 【强制平仓】卖出 {quantity:.6f} @ ${close_price:.2f}, 收入 ${revenue:.2f} (含手续费 ${fee:.2f}) - 交易结束强制清仓")
+            self.logger.info("{:%Y-%m-%d %H:%M:%S} - 【强制平仓】卖出 {:.6f} @ ${:.2f}, 收入 ${:.2f} (含手续费 ${:.2f}) - 交易结束强制清仓",
+                             timestamp or datetime.now(), quantity, close_price, revenue, fee)
             
             # 记录交易记录
-            trade = {
-                "timestamp": timestamp,
-                "order_id": self.order_id_counter,
-                "side": "sell",
-                "price": close_price,
-                "quantity": quantity,
-                "fee": fee,
-                "cash": self.cash,
-                "position": 0,
-                "realized_pnl": self.realized_pnl
-            }
-            self.trades.append(trade)
+            self.trades.append(
+                to_epoch_ms(timestamp), self.order_id_counter, SIDE_CODES["sell"], close_price,
+                quantity, fee, self.cash, 0, self.realized_pnl
+            )
+            self.metrics.record_trade(SIDE_CODES["sell"], self.realized_pnl)
             
             # 清空持仓
             self.position = 0
@@ -146,70 +386,30 @@ class Exchange:
             return True
         else:
             # 没有持仓，记录日志
-            time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self.logger.info(f"{time_str} - 【强制平仓检查】当前无持仓，无需强制平仓")
+            self.logger.info("{:%Y-%m-%d %H:%M:%S} - 【强制平仓检查】当前无持仓，无需强制平仓", timestamp or datetime.now())
             return False
 
+    def stats(self):
+        """回测过程计数：下单数、成交数、净值记录数和日志统计"""
+        return {
+            'orders_placed': self.order_id_counter,
+            'fills': len(self.trades),
+            'nav_records': self.metrics.count,
+            **self.logger.stats(),
+            **(self.intrabar.stats() if self.intrabar is not None else {}),
+        }
+
     def close(self):
         """关闭Exchange，确保日志系统正确关闭"""
         if hasattr(self, 'logger') and self.logger:
-            self.logger.close()
+            with self.profiler.phase("logger_close"):
+                self.logger.close()
 
     def calculate_performance_metrics(self):
-        """计算回测指标"""
+        """计算回测指标（取自增量指标，回测过程中也可以随时调用）"""
         # 检查是否有净值记录
-        if not self.minute_nav:
+        if self.metrics.count == 0:
             print("警告: 没有净值记录，无法计算回测指标")
-            return {
-                "total_returns": 0,
-                "compounded_total_returns": 0,
-                "simple_annualized_returns": 0,
-                "compounded_annualized_returns": 0,
-                "sharpe_ratio": 0
-            }
-            
-        performance_metrics = pl.DataFrame(self.minute_nav)
-        performance_metrics = performance_metrics.with_columns(
-            returns = pl.col("nav").pct_change().fill_null(0)
-        ).with_columns(
-            cumulative_net_returns=(1 + pl.col("returns")).cum_prod(),
-            cumulative_gross_returns=(1 + pl.col("returns")).cum_prod() - 1
-        )
-        returns = performance_metrics["returns"].to_numpy()
-        # 计算总收益率（净值计算）
-        total_returns = self.minute_nav[-1]["nav"] / self.minute_nav[0]["nav"] - 1
-        # 计算总收益率（复利计算）
-        compounded_total_returns = performance_metrics["cumulative_net_returns"].last() - 1
-        # 计算年化收益率
-        N_minutes = len(performance_metrics)
-        # 简单年化
-        simple_annualized_returns = returns.mean() * (365 * 24 * 60)
-        # 复利年化
-        compounded_annualized_returns = (1 + total_returns) ** (365 * 24 * 60 / N_minutes) - 1
-        # 年化波动率
-        annualized_volatility = returns.std() * np.sqrt(365 * 24 * 60)
-        # 夏普比率
-        sharpe_ratio = compounded_annualized_returns / annualized_volatility
-        # 交易对数
-        num_trades = len(self.trades) / 2 
-        # 胜率
-        wins = sum(1 for trade in self.trades if trade['side'] == 'sell' and (trade['realized_pnl'] > 0))
-        win_rate = wins / num_trades if num_trades > 0 else 0
-        # 最大回撤
-        cumulative_returns = performance_metrics["cumulative_net_returns"].to_numpy()
-        peak = np.maximum.accumulate(cumulative_returns)
-        drawdowns = (peak - cumulative_returns) / peak
-        max_drawdown = np.max(drawdowns)
-
-        # 返回所有计算结果
-        results = {
-            "total_returns": total_returns,
-            "compounded_total_returns": compounded_total_returns,
-            "simple_annualized_returns": simple_annualized_returns,
-            "compounded_annualized_returns": compounded_annualized_returns,
-            "sharpe_ratio": sharpe_ratio,
-            "num_trades": num_trades,
-            "win_rate": win_rate,
-            "max_drawdown": max_drawdown
-        }
-        return results
\ No newline at end of file
+
+        with self.profiler.phase("metrics"):
+            return self.metrics.metrics()
\ No newline at end of file
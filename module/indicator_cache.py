@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import polars as pl
+
+
+# 缓存文件后缀
+CACHE_SUFFIX = ".arrow"
+
+
+def file_identity(path):
+    """
+    数据文件标识：绝对路径 + 文件大小 + 修改时间（纳秒），文件被改写后标识随之变化。
+    目录（本地数据仓库的品种目录）使用其中所有文件的总大小和最新修改时间
+    """
+    if os.path.isdir(path):
+        size, mtime = 0, 0
+        for entry in os.scandir(path):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                size += stat.st_size
+                mtime = max(mtime, stat.st_mtime_ns)
+        return f"{os.path.abspath(path)}|{size}|{mtime}"
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+class IndicatorCache:
+    """
+    指标帧的持久化磁盘缓存
+
+    以数据文件标识和全部指标参数的哈希为键，把计算完成的指标帧保存为未压缩的Arrow IPC文件
+    （读取时内存映射），可跨运行、跨进程复用。文件修改时间作为最近使用时间，总大小超过上限时按LRU淘汰。
+    写入先落到临时文件再原子替换，多个进程并发读写同一目录是安全的。
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir  # 缓存目录
+        self.max_bytes = max_bytes  # 缓存总大小上限（字节），None表示不限制
+        self.hits = 0               # 命中次数
+        self.misses = 0             # 未命中次数
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(data_identity, start_date, end_date, interval, vwap_window, estimate_window, n_sigma, warmup=False, strategy=None, block_bars=None, pyramid=None):
+        """
+        由数据标识、指标参数、策略标识（Strategy.identity()）、指标分块长度
+        和K线金字塔标识（KlinePyramid.identity()，不使用金字塔时为None）生成缓存键
+        """
+        payload = json.dumps([
+            data_identity, start_date, end_date, interval, vwap_window, estimate_window, n_sigma, warmup, strategy, block_bars, pyramid
+        ])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        """读取缓存，未命中返回None"""
+        path = self._path(key)
+        try:
+            data = pl.read_ipc(path, memory_map=True)
+            # 更新修改时间，标记为最近使用
+            os.utime(path)
+        except (FileNotFoundError, OSError, pl.exceptions.ComputeError):
+            # 不存在、已被其他进程淘汰或文件损坏，都按未命中处理
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """写入缓存，并在超出上限时淘汰最久未使用的条目"""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data.write_ipc(tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """按最近使用时间从旧到新删除缓存文件，直到总大小不超过上限"""
+        if self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        """返回命中/未命中统计"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        """清空缓存目录"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_SUFFIX):
+                os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,123 @@
+import bisect
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+import polars as pl
+from .market_data import partition_paths, partition_range
+from .exchange import to_epoch_ms
+
+_EPOCH = datetime(1970, 1, 1)
+_MINUTE_MS = 60 * 1000
+
+
+class IntrabarFills:
+    """
+    K线内成交模拟：回测仍按分钟K线推进，只有限价落在某根K线的高低价范围内（分钟级判断为成交）时，
+    才读取这根K线时间范围内的秒级K线（或逐笔成交），按K线内的实际价格路径确定是否成交以及成交价：
+
+        买单：第一根 low <= 限价 的秒级K线成交，成交价为 min(限价, 该秒开盘价)
+        卖单：第一根 high >= 限价 的秒级K线成交，成交价为 max(限价, 该秒开盘价)
+
+    trade_through为True时要求价格严格越过限价（low < 限价、high > 限价）才成交，
+    即假设挂单排在该价位队列的末尾，只碰到限价的K线不成交。
+    分钟级触及但秒级数据中没有满足条件的K线时不成交；缺少该时间段的秒级数据时沿用分钟级的成交价。
+
+    秒级数据来自DataStore(granularity="day")的品种目录，每天一个分区文件（YYYY-MM-DD.arrow）。
+    分区的时间索引在构造时建立一次，最近使用的max_partitions个分区（时间戳和开高低价的numpy数组）
+    保存在LRU缓存中，每次触及只在对应分区上二分查找这根K线的时间范围。
+    额外开销与触及限价的K线数成正比，而与秒级数据总量无关。
+    逐笔成交数据没有开高低价列时，以price列同时作为开盘价、最高价和最低价。
+    """
+
+    def __init__(self, data_path, interval=1, max_partitions=4, trade_through=False):
+        self.data_path = data_path  # 秒级数据的品种目录
+        self.interval = interval    # 回测K线周期（分钟）
+        self.max_partitions = max_partitions    # LRU缓存的分区数
+        self.trade_through = trade_through  # 是否要求价格严格越过限价
+        # 分区索引：按起始时间排序的 (起始毫秒, 结束毫秒, 路径)
+        self.partitions = []
+        for path in partition_paths(data_path):
+            start, end = partition_range(os.path.basename(path))
+            self.partitions.append((to_epoch_ms(start), to_epoch_ms(end), path))
+        self._starts = [partition[0] for partition in self.partitions]
+        self._cache = OrderedDict()     # 路径 -> (时间戳, 开盘价, 最高价, 最低价)
+        # 计数
+        self.touches = 0    # 分钟级触及限价、需要下钻的次数
+        self.fills = 0      # 秒级数据确认成交的次数
+        self.rejects = 0    # 秒级数据未确认、不成交的次数
+        self.fallbacks = 0  # 缺少秒级数据、沿用分钟级成交的次数
+        self.loads = 0      # 读取分区文件的次数
+        self.cache_hits = 0     # 命中LRU缓存的次数
+
+    def _load(self, path):
+        """读取一个分区的时间戳和开高低价（LRU缓存）"""
+        arrays = self._cache.get(path)
+        if arrays is not None:
+            self._cache.move_to_end(path)
+            self.cache_hits += 1
+            return arrays
+        data = pl.scan_ipc(path, memory_map=True)
+        schema = data.collect_schema()
+        if "quote_volume" in schema:
+            data = data.filter(pl.col("quote_volume") > 0)
+        prices = ("open", "high", "low") if "low" in schema else ("price", "price", "price")
+        data = data.select(
+            pl.col("open_time").cast(pl.Datetime(time_unit="ms")).dt.epoch(time_unit="ms").alias("time"),
+            *[pl.col(name).cast(pl.Float64).alias(alias) for name, alias in zip(prices, ("open", "high", "low"))],
+        ).sort("time").collect()
+        arrays = tuple(data[name].to_numpy() for name in ("time", "open", "high", "low"))
+        self._cache[path] = arrays
+        self.loads += 1
+        if len(self._cache) > self.max_partitions:
+            self._cache.popitem(last=False)
+        return arrays
+
+    def _slices(self, start, end):
+        """[start, end)毫秒区间内的秒级数据，按时间顺序逐个分区返回"""
+        index = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        while index < len(self.partitions) and self.partitions[index][0] < end:
+            partition_start, partition_end, path = self.partitions[index]
+            index += 1
+            if partition_end <= start:
+                continue
+            time, open_price, high, low = self._load(path)
+            begin, stop = np.searchsorted(time, (start, end))
+            if stop > begin:
+                yield time[begin:stop], open_price[begin:stop], high[begin:stop], low[begin:stop]
+
+    def fill(self, side, limit_price, bar_time, bar_price):
+        """
+        分钟级判断为成交的限价单在bar_time这根K线内的成交：返回 (成交价, 成交时间)，不成交时返回 (None, None)。
+        bar_price为分钟级规则的成交价，缺少秒级数据时原样返回
+        """
+        self.touches += 1
+        start = to_epoch_ms(bar_time)
+        found = False
+        for time, open_price, high, low in self._slices(start, start + self.interval * _MINUTE_MS):
+            found = True
+            if side == "buy":
+                hit = low < limit_price if self.trade_through else low <= limit_price
+            else:
+                hit = high > limit_price if self.trade_through else high >= limit_price
+            if hit.any():
+                j = int(hit.argmax())
+                self.fills += 1
+                price = min(limit_price, float(open_price[j])) if side == "buy" else max(limit_price, float(open_price[j]))
+                return price, _EPOCH + timedelta(milliseconds=int(time[j]))
+        if not found:
+            self.fallbacks += 1
+            return bar_price, bar_time
+        self.rejects += 1
+        return None, None
+
+    def stats(self):
+        """下钻计数（随Exchange.stats()写入性能报告）"""
+        return {
+            'intrabar_touches': self.touches,
+            'intrabar_fills': self.fills,
+            'intrabar_rejects': self.rejects,
+            'intrabar_fallbacks': self.fallbacks,
+            'intrabar_loads': self.loads,
+            'intrabar_cache_hits': self.cache_hits,
+        }
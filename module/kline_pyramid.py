@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+import polars as pl
+from .market_data import scan_klines, aggregate_klines, KLINE_COLUMNS
+from .indicator_cache import file_identity
+
+
+# 每一层的文件名：{interval}m.arrow
+LEVEL_PATTERN = re.compile(r"^(\d+)m\.arrow$")
+# 记录金字塔来源文件标识的元数据文件
+SOURCE_FILE = "source.json"
+_EPOCH = datetime(1970, 1, 1)
+
+
+def floor_time(value, interval):
+    """把时间向下对齐到interval分钟的桶边界（与group_by_dynamic一样按纪元时间对齐）"""
+    period = timedelta(minutes=interval)
+    return value - (value - _EPOCH) % period
+
+
+class KlinePyramid:
+    """
+    多周期K线金字塔：把各聚合周期的K线预先算好，保存为未压缩的Arrow IPC文件（读取时内存映射）
+
+    - 第1层是清洗后的1分钟K线（按时间排序、去掉无效数据、open_time为Datetime("ms")）
+    - 更粗的周期优先由能整除它的最粗的已有层聚合而来，例如60分钟由30分钟或15分钟聚合
+    - 各层保存的是聚合后、尚未去掉成交量为0的桶的结果，MarketData读取时再过滤，
+      因此由细层聚合与直接由1分钟聚合得到的桶一一对应
+    - append追加新的1分钟K线时，每一层只重算从第一根新K线所在的桶开始的尾部
+
+    由细层聚合时成交量、成交额的求和顺序不同，结果与直接由1分钟聚合可能在最后几位有效数字上不同。
+    层文件以临时文件加原子替换的方式写入，层的列表由目录中的文件决定，多个进程同时补建层是安全的。
+
+    source.json记录金字塔来源文件的标识（file_identity）：ensure发现数据文件与来源不一致
+    （换了文件或文件被改写）时整个重建；由DataFrame追加过的金字塔不再对应任何文件，ensure直接报错。
+    identity()给出金字塔当前内容的标识，用于指标缓存和结果库的键。
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir    # 金字塔目录
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, interval):
+        return os.path.join(self.root_dir, f"{interval}m.arrow")
+
+    def levels(self):
+        """已建好的周期（分钟），从小到大"""
+        intervals = []
+        for name in os.listdir(self.root_dir):
+            match = LEVEL_PATTERN.match(name)
+            if match:
+                intervals.append(int(match.group(1)))
+        return sorted(intervals)
+
+    def has_level(self, interval):
+        return os.path.exists(self._path(interval))
+
+    def source_identity(self):
+        """
+        来源文件标识：build或append(文件路径)时记录；由DataFrame追加过时为None；
+        没有元数据（旧版本建立的金字塔）时返回False
+        """
+        try:
+            with open(os.path.join(self.root_dir, SOURCE_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)['source']
+        except FileNotFoundError:
+            return False
+
+    def _write_source(self, identity):
+        path = os.path.join(self.root_dir, SOURCE_FILE)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': identity}, f)
+        os.replace(tmp_path, path)
+
+    def identity(self, interval=1):
+        """金字塔内容的标识：来源文件标识，以及第1层和interval层文件的标识（层被重建或追加后随之变化）"""
+        parts = [str(self.source_identity()), file_identity(self._path(1))]
+        if interval > 1 and self.has_level(interval):
+            parts.append(file_identity(self._path(interval)))
+        return "|".join(parts)
+
+    def scan(self, interval):
+        """惰性读取某一层，不存在时返回None"""
+        if not self.has_level(interval):
+            return None
+        return pl.scan_ipc(self._path(interval), memory_map=True)
+
+    def _write(self, interval, data):
+        path = self._path(interval)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data.write_ipc(tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+
+    def _source_level(self, interval):
+        """聚合interval层时使用的来源层：能整除interval的最粗的已有层"""
+        return max(level for level in self.levels() if level < interval and interval % level == 0)
+
+    @staticmethod
+    def _clean(data):
+        """把原始K线整理为第1层的格式"""
+        schema = data.collect_schema()
+        return data.select(
+            [name for name in KLINE_COLUMNS if name in schema]
+        ).sort(
+            "open_time"
+        ).with_columns(
+            open_time = pl.col("open_time").cast(pl.Datetime(time_unit="ms"))
+        ).filter(
+            pl.col("quote_volume") > 0
+        )
+
+    def build(self, data_path, intervals=()):
+        """由原始K线文件重建第1层（删除已有的其他层），记录来源文件标识，并建好intervals中的各层"""
+        identity = file_identity(data_path)
+        self._write(1, self._clean(scan_klines(data_path)).collect())
+        for interval in self.levels():
+            if interval != 1:
+                try:
+                    os.remove(self._path(interval))
+                except FileNotFoundError:
+                    pass
+        self._write_source(identity)
+        for interval in sorted(set(intervals) - {1}):
+            self._build_level(interval)
+
+    def ensure(self, data_path, intervals=()):
+        """
+        只补建缺失的层；第1层不存在、或来源与data_path当前的文件标识不一致时由data_path整个重建。
+        金字塔由DataFrame追加过（不对应任何文件）时抛出ValueError
+        """
+        source = self.source_identity()
+        if source is None and self.has_level(1):
+            raise ValueError(f"pyramid {self.root_dir} was extended from in-memory klines "
+                             f"and does not match {data_path}; rebuild it with build()")
+        if not self.has_level(1) or source != file_identity(data_path):
+            self.build(data_path, intervals)
+            return
+        for interval in sorted(set(intervals) - {1}):
+            if not self.has_level(interval):
+                self._build_level(interval)
+
+    def _build_level(self, interval):
+        source = self._source_level(interval)
+        self._write(interval, aggregate_klines(self.scan(source), interval).collect())
+
+    def append(self, klines):
+        """
+        追加新的1分钟K线（DataFrame、LazyFrame或文件路径），只保留晚于已有数据的部分；
+        各层删除从第一根新K线所在的桶开始的尾部，再由来源层的对应部分重新聚合。
+        由文件追加时来源记为该文件（文件是原来来源的增长版本时，金字塔与它一致），
+        由DataFrame追加时来源记为None。返回追加的1分钟K线数
+        """
+        if isinstance(klines, (str, os.PathLike)):
+            identity = file_identity(klines)
+            klines = scan_klines(klines)
+        else:
+            identity = None
+        new = self._clean(klines.lazy())
+        base = self.scan(1)
+        last = base.select(pl.col("open_time").max()).collect().item()
+        if last is not None:
+            new = new.filter(pl.col("open_time") > last)
+        new = new.collect()
+        if len(new) == 0:
+            if identity is not None:
+                self._write_source(identity)
+            return 0
+
+        first_new = new["open_time"][0]
+        self._write(1, pl.concat([base.collect(), new]))
+        for interval in self.levels():
+            if interval == 1:
+                continue
+            cutoff = floor_time(first_new, interval)
+            source = self._source_level(interval)
+            head = self.scan(interval).filter(pl.col("open_time") < cutoff)
+            tail = aggregate_klines(self.scan(source).filter(pl.col("open_time") >= cutoff), interval)
+            self._write(interval, pl.concat([head, tail]).collect())
+        self._write_source(identity)
+        return len(new)
@@ -1,103 +1,430 @@
-import polars as pl
-
-
-class MarketData:
-    def __init__(self, data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma):
-        self.data_path = data_path
-        self.start_date = start_date
-        self.end_date = end_date
-        self.interval = interval  # 默认1分钟K线
-        self.vwap_window = vwap_window  # VWAP计算窗口，默认20
-        self.estimate_window = estimate_window  # 波动率估计窗口，默认60*24
-        self.n_sigma = n_sigma  # 阈值倍数，默认3
-
-        self.data = pl.read_parquet(self.data_path).sort(
-            "open_time"
-        ).with_columns(
-            open_time = pl.col("open_time").cast(pl.Datetime(time_unit="ms"))
-        )
-        
-        # 根据起始日期和结束日期过滤数据
-        if self.start_date is not None and self.end_date is not None:
-            self.data = self.data.filter(
-                (pl.col("open_time") >= pl.lit(self.start_date).str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S")) &
-                (pl.col("open_time") <= pl.lit(self.end_date).str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S"))
-            )
-        elif self.start_date is not None:
-            self.data = self.data.filter(
-                pl.col("open_time") >= pl.lit(self.start_date).str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S")
-            )
-        elif self.end_date is not None:
-            self.data = self.data.filter(
-                pl.col("open_time") <= pl.lit(self.end_date).str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S")
-            )
-        
-        # 过滤无效数据
-        self.data = self.data.filter(pl.col("quote_volume") > 0)
-        # k线聚合
-        if self.interval > 1:
-            self.data = self._aggregate_klines(self.data, self.interval)
-
-        # 计算VWAP和阈值
-        self.data = self.data.with_columns(
-            vwap = pl.col("quote_volume").rolling_sum(self.vwap_window) / (pl.col("volume").rolling_sum(self.vwap_window) + 1)
-        ).drop_nulls().with_columns(
-            bias = (pl.col("close") / pl.col("vwap") - 1),
-        ).with_columns(
-            sigma = pl.col("bias").rolling_std(self.estimate_window),
-        ).with_columns(
-            bottom_threshold = pl.col("vwap") * (1 - self.n_sigma * pl.col("sigma")),
-            top_threshold = pl.col("vwap") * (1 + self.n_sigma * pl.col("sigma"))
-        ).drop_nulls()
-        
-        self.current_index = 0    
-    def get_current_bar(self):
-        """
-        获取当前K线
-        """
-        if self.current_index < len(self.data):
-            return self.data.row(self.current_index, named=True)
-        else:
-            return None
-    
-    def next_bar(self):
-        """
-        推进到下一根K线
-        """
-        self.current_index += 1
-        return self.current_index < len(self.data)
-
-    def has_more_data(self):
-        return self.current_index < len(self.data)
-
-    def get_total_bars(self):
-        return len(self.data)
-    
-    def _aggregate_klines(self, data, interval):
-
-        result = data.group_by_dynamic(
-            "open_time",
-            every=f"{interval}m",  # 每interval分钟分组
-            closed="left", 
-            label="left"  
-        ).agg([
-            # 开盘价：取第一个
-            pl.col("open").first().alias("open"),
-            # 最高价：取最大值
-            pl.col("high").max().alias("high"),
-            # 最低价：取最小值
-            pl.col("low").min().alias("low"),
-            # 收盘价：取最后一个
-            pl.col("close").last().alias("close"),
-            # 成交量：求和
-            pl.col("volume").sum().alias("volume"),
-            # 成交额：求和
-            pl.col("quote_volume").sum().alias("quote_volume"),
-            # 其他字段取第一个值
-            pl.col("jj_code").first().alias("jj_code") if "jj_code" in data.columns else pl.lit(None).alias("jj_code")
-        ]).sort("open_time")
-        
-        # 过滤掉没有数据的空时间段
-        result = result.filter(pl.col("volume") > 0)
-        
+import os
+import re
+import polars as pl
+import numpy as np
+from datetime import datetime, timedelta
+from .indicator_cache import file_identity
+from .profiler import NULL_PROFILER
+from .strategy import VwapReversionStrategy
+
+
+# Arrow IPC文件后缀，这类文件以内存映射方式读取，多进程共享同一份页缓存
+IPC_SUFFIXES = (".arrow", ".ipc", ".feather")
+# 回测用到的K线列，其余列不读取
+KLINE_COLUMNS = ("open_time", "open", "high", "low", "close", "volume", "quote_volume", "jj_code")
+# 配置中日期字符串的格式
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# 本地数据仓库中品种目录下的分区文件：按月YYYY-MM.arrow，或按天YYYY-MM-DD.arrow
+PARTITION_PATTERN = re.compile(r"^(\d{4})-(\d{2})(?:-(\d{2}))?\.arrow$")
+# 指标分块计算的块长度（聚合周期数），块边界按纪元时间对齐
+INDICATOR_BLOCK_BARS = 1 << 15
+_EPOCH = datetime(1970, 1, 1)
+
+
+def partition_range(name):
+    """分区文件名对应的时间区间[start, end)，不是分区文件时返回None"""
+    match = PARTITION_PATTERN.match(name)
+    if match is None:
+        return None
+    year, month = int(match.group(1)), int(match.group(2))
+    if match.group(3) is not None:
+        start = datetime(year, month, int(match.group(3)))
+        return start, start + timedelta(days=1)
+    return datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def partition_paths(directory, start=None, end=None):
+    """
+    本地数据仓库中某个品种目录下与[start, end]有交集的分区文件，按时间排序
+    """
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        bounds = partition_range(name)
+        if bounds is None:
+            continue
+        if (end is not None and bounds[0] > end) or (start is not None and bounds[1] <= start):
+            continue
+        paths.append(os.path.join(directory, name))
+    return paths
+
+
+def load_klines(data_path):
+    """
+    读取原始K线数据：parquet直接读取，Arrow IPC文件以内存映射方式读取（不复制），
+    目录按本地数据仓库的分区读取
+    """
+    if os.path.isdir(data_path):
+        return scan_klines(data_path).collect()
+    if str(data_path).endswith(IPC_SUFFIXES):
+        return pl.read_ipc(data_path, memory_map=True)
+    return pl.read_parquet(data_path)
+
+
+def scan_klines(data_path, start=None, end=None):
+    """
+    惰性扫描原始K线数据，过滤条件和列选择下推到文件读取。
+    data_path为本地数据仓库的品种目录时，只内存映射与[start, end]有交集的分区
+    （start、end只用于挑选分区，行级过滤仍由调用方完成）
+    """
+    if os.path.isdir(data_path):
+        paths = partition_paths(data_path, start, end)
+        if not paths:
+            # 区间内没有数据：保留一个分区以得到表结构，行由调用方的过滤条件去掉
+            paths = partition_paths(data_path)[:1]
+        if not paths:
+            raise FileNotFoundError(f"no partitions in {data_path}")
+        return pl.scan_ipc(paths, memory_map=True)
+    if str(data_path).endswith(IPC_SUFFIXES):
+        return pl.scan_ipc(data_path, memory_map=True)
+    return pl.scan_parquet(data_path)
+
+
+def time_literal(value, dtype):
+    """
+    把时间转换成与文件中open_time相同类型的字面量，
+    直接和原始列比较，使过滤条件能够下推到row group统计信息
+    """
+    if dtype.is_integer():
+        # 整数时间戳按毫秒处理，与cast(pl.Datetime("ms"))一致
+        return pl.lit(int((value - datetime(1970, 1, 1)) / timedelta(milliseconds=1)), dtype=dtype)
+    return pl.lit(value).cast(dtype)
+
+
+def aggregate_klines(data, interval):
+    """
+    把（惰性的）1分钟K线按interval分钟聚合，窗口按纪元时间对齐；
+    结果保留成交量为0的空窗口，由调用方决定是否过滤
+    """
+    result = data.group_by_dynamic(
+        "open_time",
+        every=f"{interval}m",  # 每interval分钟分组
+        closed="left", 
+        label="left"  
+    ).agg([
+        # 开盘价：取第一个
+        pl.col("open").first().alias("open"),
+        # 最高价：取最大值
+        pl.col("high").max().alias("high"),
+        # 最低价：取最小值
+        pl.col("low").min().alias("low"),
+        # 收盘价：取最后一个
+        pl.col("close").last().alias("close"),
+        # 成交量：求和
+        pl.col("volume").sum().alias("volume"),
+        # 成交额：求和
+        pl.col("quote_volume").sum().alias("quote_volume"),
+        # 其他字段取第一个值
+        pl.col("jj_code").first().alias("jj_code") if "jj_code" in data.collect_schema().names() else pl.lit(None).alias("jj_code")
+    ]).sort("open_time")
+
+    return result
+
+
+def indicator_block_start(value, interval):
+    """value所在指标块的起点（块长度为INDICATOR_BLOCK_BARS个interval分钟）"""
+    period = timedelta(minutes=interval * INDICATOR_BLOCK_BARS)
+    return value - (value - _EPOCH) % period
+
+
+def compute_indicators(strategy, klines, interval, offset=0):
+    """
+    在按时间排序的有效K线（DataFrame）上分块计算策略的指标和挂单价格列。
+
+    polars的滚动窗口是增量计算的，同一根K线的指标值在最后几位有效数字上取决于计算从哪一行开始。
+    这里按纪元时间对齐的块分别计算，每块从块内第一根K线之前的required_history()根K线
+    （不足时从数据起点）开始，块内每根K线的指标只取决于数据本身，与读取区间的起点、是否分块读取无关：
+    预热读取、分块回测与一次性读取全部历史的结果逐位相同。
+    数据只有一块时与直接在整段数据上计算完全相同。
+
+    offset之前的K线只作为历史（分块回测中上一批的最后几根），不输出；offset必须是块的第一行
+    """
+    if len(klines) <= offset:
+        return strategy.prepare(klines.slice(offset).lazy()).collect()
+    period_ms = interval * INDICATOR_BLOCK_BARS * 60 * 1000
+    blocks = (klines["open_time"].dt.epoch(time_unit="ms") // period_ms).to_numpy()[offset:]
+    # 每块第一根K线的行号
+    firsts = np.flatnonzero(np.diff(blocks, prepend=blocks[0] - 1)) + offset
+    stops = np.append(firsts[1:], len(klines))
+    history = strategy.required_history()
+    frames = []
+    for first, stop in zip(firsts, stops):
+        anchor = max(int(first) - history, 0)
+        frame = strategy.prepare(klines.slice(anchor, int(stop) - anchor).lazy())
+        frames.append(frame.filter(pl.col("open_time") >= klines["open_time"][int(first)]))
+    return pl.concat(frames).collect()
+
+
+class MarketData:
+    def __init__(self, data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma, cache=None, data_identity=None, warmup=True, profiler=None, pyramid=None, strategy=None, data=None):
+        self.data_path = data_path
+        self.start_date = start_date
+        self.end_date = end_date
+        self.interval = interval  # 默认1分钟K线
+        self.vwap_window = vwap_window  # VWAP计算窗口，默认20
+        self.estimate_window = estimate_window  # 波动率估计窗口，默认60*24
+        self.n_sigma = n_sigma  # 阈值倍数，默认3
+        self.cache = cache  # 指标缓存，None表示不使用缓存
+        self.data_identity = data_identity  # 数据文件标识，默认由路径、大小和修改时间生成
+        self.warmup = warmup  # 是否读取start_date之前的历史预热滚动窗口（为False时指标从start_date冷启动）
+        self.profiler = profiler or NULL_PROFILER  # 分阶段计时
+        self.pyramid = pyramid  # K线金字塔（KlinePyramid），不为None时直接读取预先聚合好的周期
+        # 策略：声明指标和挂单价格列，默认是由vwap_window、estimate_window、n_sigma决定的VWAP均值回归
+        self.strategy = strategy or VwapReversionStrategy(vwap_window, estimate_window, n_sigma)
+
+        # 给出data（已计算好指标的数据帧）时不再读取文件
+        self.data = data if data is not None else self._load_data()
+
+        self.current_index = 0
+        self._columns = {}    # 列数组缓存，供数组内核按游标读取
+
+    def _load_data(self):
+        """
+        加载带指标的K线数据：命中缓存时直接读取，否则计算后写入缓存
+        """
+        if self.cache is None:
+            with self.profiler.phase("load_data.build"):
+                return self._build_data()
+        key = self.cache.make_key(
+            self.data_identity or file_identity(self.data_path),
+            self.start_date, self.end_date, self.interval,
+            self.vwap_window, self.estimate_window, self.n_sigma, self.warmup,
+            strategy=self.strategy.identity(), block_bars=INDICATOR_BLOCK_BARS,
+            pyramid=self.pyramid.identity(self.interval) if self.pyramid is not None else None
+        )
+        with self.profiler.phase("load_data.cache_get"):
+            data = self.cache.get(key)
+        if data is None:
+            with self.profiler.phase("load_data.build"):
+                data = self._build_data()
+            with self.profiler.phase("load_data.cache_put"):
+                self.cache.put(key, data)
+        return data
+
+    def _build_data(self):
+        """
+        读取、过滤、聚合K线并计算策略声明的指标和挂单价格列
+
+        读取、过滤和聚合保持惰性，日期过滤和列选择下推到文件扫描；指标由compute_indicators分块计算。
+        warmup为True时额外读取start_date所在指标块之前刚好足够的历史数据预热滚动窗口，
+        指标结果与全量历史计算后再截取[start_date, end_date]逐位相同。
+        """
+        start = datetime.strptime(self.start_date, DATE_FORMAT) if self.start_date is not None else None
+        end = datetime.strptime(self.end_date, DATE_FORMAT) if self.end_date is not None else None
+
+        scan_start = start
+        if self.warmup and start is not None:
+            scan_start = self._warmup_start(indicator_block_start(start, self.interval))
+        klines = self._scan(scan_start, end).collect()
+
+        # 计算指标（默认策略为VWAP和阈值）
+        data = compute_indicators(self.strategy, klines, self.interval)
+
+        # 去掉预热部分
+        if self.warmup and start is not None:
+            data = data.filter(pl.col("open_time") >= start)
+        return data
+
+    def _scan(self, start, end):
+        """
+        惰性扫描[start, end]区间的有效K线，按需聚合
+        """
+        if self.pyramid is not None:
+            return self._scan_pyramid(start, end)
+        data = scan_klines(self.data_path, start, end)
+        schema = data.collect_schema()
+        time_dtype = schema["open_time"]
+
+        # 根据起始日期和结束日期过滤数据（与原始列比较，可下推）
+        if start is not None:
+            data = data.filter(pl.col("open_time") >= time_literal(start, time_dtype))
+        if end is not None:
+            data = data.filter(pl.col("open_time") <= time_literal(end, time_dtype))
+
+        data = data.select(
+            [name for name in KLINE_COLUMNS if name in schema]
+        ).sort(
+            "open_time"
+        ).with_columns(
+            open_time = pl.col("open_time").cast(pl.Datetime(time_unit="ms"))
+        )
+
+        # 过滤无效数据
+        data = data.filter(pl.col("quote_volume") > 0)
+        # k线聚合
+        if self.interval > 1:
+            data = self._aggregate_klines(data, self.interval)
+        return data
+
+    def _scan_pyramid(self, start, end):
+        """
+        从K线金字塔读取[start, end]区间的有效K线：完整落在区间内的桶直接取对应周期的层，
+        区间两端不完整的桶由1分钟层重新聚合，与从原始文件读取后聚合的结果一致。
+        金字塔中没有该周期时由1分钟层聚合
+        """
+        base = self.pyramid.scan(1)
+        level = self.pyramid.scan(self.interval) if self.interval > 1 else None
+
+        period = timedelta(minutes=self.interval)
+        # [lower, upper)之间的桶完整落在区间内
+        lower = start + (datetime(1970, 1, 1) - start) % period if start is not None else None
+        upper = end + timedelta(minutes=1) - (end + timedelta(minutes=1) - datetime(1970, 1, 1)) % period if end is not None else None
+
+        if level is None or (lower is not None and upper is not None and lower >= upper):
+            data = base
+            if start is not None:
+                data = data.filter(pl.col("open_time") >= start)
+            if end is not None:
+                data = data.filter(pl.col("open_time") <= end)
+            if self.interval > 1:
+                data = self._aggregate_klines(data, self.interval)
+            return data
+
+        parts = []
+        if start is not None:
+            parts.append(aggregate_klines(base.filter((pl.col("open_time") >= start) & (pl.col("open_time") < lower)), self.interval))
+            level = level.filter(pl.col("open_time") >= lower)
+        if end is not None:
+            level = level.filter(pl.col("open_time") < upper)
+        parts.append(level)
+        if end is not None:
+            parts.append(aggregate_klines(base.filter((pl.col("open_time") >= upper) & (pl.col("open_time") <= end)), self.interval))
+        # 过滤掉没有数据的空时间段
+        return pl.concat(parts).filter(pl.col("volume") > 0)
+
+    def _warmup_start(self, start):
+        """
+        计算预热起点：保证start之前至少有策略所需的有效K线（默认vwap_window + estimate_window - 2根）。
+        回看区间从估计值开始，不够时加倍，直到覆盖足够K线或到达文件开头；
+        起点对齐到聚合周期边界，使聚合结果与全量计算一致
+        """
+        required = self.strategy.required_history()
+        if required <= 0:
+            return start
+        source = self.pyramid.scan(1) if self.pyramid is not None else scan_klines(self.data_path)
+        first = source.select(
+            pl.col("open_time").cast(pl.Datetime(time_unit="ms")).min()
+        ).collect().item()
+        if first is None or first >= start:
+            return start
+
+        period = timedelta(minutes=self.interval)
+        lookback = period * (required + 1)
+        while True:
+            candidate = start - lookback
+            # 对齐到聚合周期边界（group_by_dynamic按纪元时间对齐窗口）
+            candidate -= (candidate - datetime(1970, 1, 1)) % period
+            if candidate <= first:
+                return None
+            rows = self._scan(candidate, start).filter(
+                pl.col("open_time") < start
+            ).select(pl.len()).collect().item()
+            if rows >= required:
+                return candidate
+            lookback *= 2
+
+    def get_current_bar(self):
+        """
+        获取当前K线
+        """
+        if self.current_index < len(self.data):
+            return self.data.row(self.current_index, named=True)
+        else:
+            return None
+    
+    def next_bar(self):
+        """
+        推进到下一根K线
+        """
+        self.current_index += 1
+        return self.current_index < len(self.data)
+
+    def has_more_data(self):
+        return self.current_index < len(self.data)
+
+    def get_total_bars(self):
+        return len(self.data)
+
+    def get_column(self, name):
+        """
+        以连续的NumPy数组形式取出整列数据（只转换一次并缓存）
+        """
+        if name not in self._columns:
+            if name == "open_time":
+                # 时间戳统一为int64毫秒，避免逐bar构造datetime
+                column = self.data["open_time"].dt.epoch(time_unit="ms")
+            else:
+                column = self.data[name].cast(pl.Float64)
+            self._columns[name] = np.ascontiguousarray(column.to_numpy())
+        return self._columns[name]
+
+    def get_columns(self, names):
+        """
+        批量取出多列数组
+        """
+        return {name: self.get_column(name) for name in names}
+
+    def get_value(self, name, index=None):
+        """
+        游标读取：返回当前（或指定）位置某一列的值
+        """
+        if index is None:
+            index = self.current_index
+        return self.get_column(name)[index]
+
+    def get_timestamp(self, index=None):
+        """
+        游标读取：返回当前（或指定）位置的开盘时间（datetime）
+        """
+        if index is None:
+            index = self.current_index
+        return self.data["open_time"][index]
+
+    def slice(self, start=None, end=None):
+        """
+        截取[start, end)时间区间，返回共享指标参数的新MarketData（游标从头开始）
+        """
+        data = self.data
+        if start is not None:
+            data = data.filter(pl.col("open_time") >= start)
+        if end is not None:
+            data = data.filter(pl.col("open_time") < end)
+        return self.with_data(data)
+
+    @classmethod
+    def from_frame(cls, data, data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma, **kwargs):
+        """
+        由已计算好指标的数据帧构造MarketData，不读取文件，其余参数与构造函数相同
+        """
+        return cls(data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma, data=data, **kwargs)
+
+    def with_data(self, data):
+        """
+        共享指标参数、换成另一份指标帧的MarketData（游标从头开始）。
+        子类（如分块模式）的视图也是一份普通的内存数据
+        """
+        return MarketData.from_frame(data, self.data_path, self.start_date, self.end_date, self.interval,
+                                     self.vwap_window, self.estimate_window, self.n_sigma,
+                                     cache=self.cache, data_identity=self.data_identity, warmup=self.warmup,
+                                     profiler=self.profiler, pyramid=self.pyramid, strategy=self.strategy)
+
+    def iter_chunks(self):
+        """
+        按时间顺序给出数据块（数组内核使用），整段数据已在内存中，只有一块
+        """
+        yield self
+
+    def seek(self, index):
+        """
+        将游标移动到指定位置
+        """
+        self.current_index = index
+        return self.current_index < len(self.data)
+    
+    def _aggregate_klines(self, data, interval):
+
+        result = aggregate_klines(data, interval)
+        
+        # 过滤掉没有数据的空时间段
+        result = result.filter(pl.col("volume") > 0)
+        
         return result
\ No newline at end of file
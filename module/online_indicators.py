@@ -0,0 +1,193 @@
+import math
+from datetime import datetime, timedelta
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+class RollingSum:
+    """
+    定长滑动窗口求和（环形缓冲区），每次更新O(1)
+
+    增量加减会累积浮点误差，因此每经过一个窗口长度的更新就用缓冲区重新求和一次，
+    均摊后仍为O(1)。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = [0.0] * window   # 环形缓冲区
+        self.head = 0                  # 下一个写入位置
+        self.count = 0                 # 已写入的元素个数（不超过window）
+        self.total = 0.0               # 当前窗口和
+        self.updates = 0               # 距上次重新求和的更新次数
+
+    def update(self, value):
+        """加入一个新值，窗口满时移出最旧的值"""
+        if self.count == self.window:
+            self.total += value - self.buffer[self.head]
+        else:
+            self.total += value
+            self.count += 1
+        self.buffer[self.head] = value
+        self.head = (self.head + 1) % self.window
+
+        self.updates += 1
+        if self.updates >= self.window:
+            self.total = math.fsum(self.buffer[:self.count])
+            self.updates = 0
+        return self.total
+
+    def is_full(self):
+        return self.count == self.window
+
+
+class RollingVariance:
+    """
+    定长滑动窗口样本方差（ddof=1，与polars的rolling_std一致），每次更新O(1)
+
+    采用滑动窗口版Welford算法维护均值和二阶中心矩，避免sum(x^2) - n*mean^2的抵消误差；
+    同样每经过一个窗口长度的更新用两遍法重新计算一次。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = [0.0] * window
+        self.head = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0                  # 二阶中心矩之和
+        self.updates = 0
+
+    def update(self, value):
+        """加入一个新值，窗口满时替换最旧的值"""
+        if self.count == self.window:
+            old = self.buffer[self.head]
+            old_mean = self.mean
+            self.mean += (value - old) / self.window
+            self.m2 += (value - old) * (value - self.mean + old - old_mean)
+        else:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        self.buffer[self.head] = value
+        self.head = (self.head + 1) % self.window
+
+        self.updates += 1
+        if self.updates >= self.window:
+            self._recompute()
+        return self.variance()
+
+    def _recompute(self):
+        values = self.buffer[:self.count]
+        self.mean = math.fsum(values) / self.count
+        self.m2 = math.fsum((x - self.mean) ** 2 for x in values)
+        self.updates = 0
+
+    def variance(self):
+        if self.count < 2:
+            return None
+        # 抵消误差可能使m2略小于0
+        return max(self.m2, 0.0) / (self.count - 1)
+
+    def std(self):
+        variance = self.variance()
+        return None if variance is None else math.sqrt(variance)
+
+    def is_full(self):
+        return self.count == self.window
+
+
+class OnlineKlineAggregator:
+    """
+    流式K线聚合：把1分钟K线按interval分钟聚合，与MarketData._aggregate_klines一致
+    （窗口按纪元时间对齐，左闭，标签为窗口起点，成交量为0的窗口丢弃）
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.period_ms = interval * 60 * 1000
+        self.bucket_start = None       # 当前窗口起点（毫秒）
+        self.bar = None                # 当前窗口的聚合结果
+
+    def update(self, bar):
+        """加入一根1分钟K线，窗口结束时返回聚合完成的K线，否则返回None"""
+        timestamp_ms = (bar['open_time'] - _EPOCH) // _MILLISECOND
+        bucket_start = timestamp_ms - timestamp_ms % self.period_ms
+        finished = None
+        if self.bucket_start is not None and bucket_start != self.bucket_start:
+            finished = self.flush()
+        if self.bar is None:
+            self.bucket_start = bucket_start
+            self.bar = {
+                'open_time': _EPOCH + bucket_start * _MILLISECOND,
+                'open': bar['open'],
+                'high': bar['high'],
+                'low': bar['low'],
+                'close': bar['close'],
+                'volume': bar['volume'],
+                'quote_volume': bar['quote_volume'],
+                'jj_code': bar.get('jj_code', None),
+            }
+        else:
+            self.bar['high'] = max(self.bar['high'], bar['high'])
+            self.bar['low'] = min(self.bar['low'], bar['low'])
+            self.bar['close'] = bar['close']
+            self.bar['volume'] += bar['volume']
+            self.bar['quote_volume'] += bar['quote_volume']
+        return finished
+
+    def flush(self):
+        """结束当前窗口并返回聚合K线（成交量为0时返回None）"""
+        bar, self.bar, self.bucket_start = self.bar, None, None
+        if bar is None or not bar['volume'] > 0:
+            return None
+        return bar
+
+
+class OnlineIndicators:
+    """
+    增量指标引擎：逐根K线更新VWAP、偏离度、波动率和上下阈值，每根K线O(1)时间和内存
+
+    与MarketData的批量表达式一致：
+    vwap = sum(quote_volume, vwap_window) / (sum(volume, vwap_window) + 1)
+    bias = close / vwap - 1
+    sigma = std(bias, estimate_window)
+    bottom/top_threshold = vwap * (1 -/+ n_sigma * sigma)
+    两个窗口都填满之前返回None（对应批量计算中被drop_nulls丢弃的行）。
+    """
+
+    def __init__(self, vwap_window, estimate_window, n_sigma):
+        self.vwap_window = vwap_window
+        self.estimate_window = estimate_window
+        self.n_sigma = n_sigma
+        self.quote_volume_sum = RollingSum(vwap_window)
+        self.volume_sum = RollingSum(vwap_window)
+        self.bias_variance = RollingVariance(estimate_window)
+
+    def update(self, bar):
+        """输入一根K线，窗口预热完成后返回带指标的新K线，否则返回None"""
+        quote_volume_sum = self.quote_volume_sum.update(bar['quote_volume'])
+        volume_sum = self.volume_sum.update(bar['volume'])
+        if not self.volume_sum.is_full():
+            return None
+
+        vwap = quote_volume_sum / (volume_sum + 1)
+        bias = bar['close'] / vwap - 1
+        self.bias_variance.update(bias)
+        if not self.bias_variance.is_full():
+            return None
+
+        sigma = self.bias_variance.std()
+        return {
+            **bar,
+            'vwap': vwap,
+            'bias': bias,
+            'sigma': sigma,
+            'bottom_threshold': vwap * (1 - self.n_sigma * sigma),
+            'top_threshold': vwap * (1 + self.n_sigma * sigma),
+        }
+
+    def is_warm(self):
+        return self.volume_sum.is_full() and self.bias_variance.is_full()
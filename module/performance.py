@@ -0,0 +1,169 @@
+import numpy as np
+
+# 年化使用的每年分钟数（净值按分钟记录）
+MINUTES_PER_YEAR = 365 * 24 * 60
+
+
+def empty_metrics():
+    """没有净值记录时返回的指标"""
+    return {
+        "total_returns": 0,
+        "compounded_total_returns": 0,
+        "simple_annualized_returns": 0,
+        "compounded_annualized_returns": 0,
+        "sharpe_ratio": 0,
+        "num_trades": 0,
+        "win_rate": 0,
+        "max_drawdown": 0
+    }
+
+
+def performance_metrics(nav, num_trade_records, wins):
+    """
+    由净值序列和交易统计计算回测指标
+
+    nav: 按分钟记录的净值数组
+    num_trade_records: 交易记录条数（买卖各算一条）
+    wins: 已实现盈亏为正的卖出次数
+    """
+    nav = np.asarray(nav, dtype=np.float64)
+    returns = np.zeros(len(nav))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns[1:] = (nav[1:] - nav[:-1]) / nav[:-1]
+    cumulative_net_returns = np.cumprod(1 + returns)
+    # 计算总收益率（净值计算）
+    total_returns = float(nav[-1] / nav[0] - 1)
+    # 计算总收益率（复利计算）
+    compounded_total_returns = float(cumulative_net_returns[-1] - 1)
+    # 计算年化收益率
+    N_minutes = len(nav)
+    # 简单年化
+    simple_annualized_returns = returns.mean() * MINUTES_PER_YEAR
+    # 复利年化
+    compounded_annualized_returns = (1 + total_returns) ** (MINUTES_PER_YEAR / N_minutes) - 1
+    # 年化波动率
+    annualized_volatility = returns.std() * np.sqrt(MINUTES_PER_YEAR)
+    # 夏普比率
+    sharpe_ratio = compounded_annualized_returns / annualized_volatility
+    # 交易对数
+    num_trades = num_trade_records / 2
+    # 胜率
+    win_rate = wins / num_trades if num_trades > 0 else 0
+    # 最大回撤
+    peak = np.maximum.accumulate(cumulative_net_returns)
+    drawdowns = (peak - cumulative_net_returns) / peak
+    max_drawdown = np.max(drawdowns)
+
+    # 返回所有计算结果
+    return {
+        "total_returns": total_returns,
+        "compounded_total_returns": compounded_total_returns,
+        "simple_annualized_returns": simple_annualized_returns,
+        "compounded_annualized_returns": compounded_annualized_returns,
+        "sharpe_ratio": sharpe_ratio,
+        "num_trades": num_trades,
+        "win_rate": win_rate,
+        "max_drawdown": max_drawdown
+    }
+
+
+class OnlineMetrics:
+    """
+    增量绩效指标：每记录一个净值点或一笔交易就更新一次，随时可以查询当前指标，不需要保存完整净值序列
+
+    - 收益率的均值和方差由按时间顺序逐个累加的收益率之和与平方和得到
+    - 复利净值、历史峰值和最大回撤逐点累积
+    - 胜率沿用performance_metrics的口径：卖出后累计已实现盈亏为正计为一次盈利
+
+    批量更新（数组内核）用带初值的cumsum/cumprod保持与逐点更新完全相同的运算顺序，
+    因此结果与净值序列如何分批（一次性还是分块回测）无关，逐点更新与批量更新逐位相同。
+    与performance_metrics的结果一致（均值和方差的求和顺序不同，最后几位有效数字可能不同）
+    """
+
+    def __init__(self):
+        self.count = 0                  # 净值点数
+        self.first_nav = None           # 第一个净值
+        self.last_nav = None            # 最新净值
+        self.sum = 0.0                  # 收益率之和（第一个点的收益率记为0）
+        self.sum_sq = 0.0               # 收益率平方和
+        self.compounded = 1.0           # 复利净值
+        self.peak = 1.0                 # 复利净值的历史峰值
+        self.max_drawdown = 0.0         # 最大回撤
+        self.num_trade_records = 0      # 交易记录条数
+        self.wins = 0                   # 盈利的卖出次数
+
+    def update(self, nav):
+        """记录一个净值点"""
+        if self.count == 0:
+            self.first_nav = nav
+            returns = 0.0
+        else:
+            returns = (nav - self.last_nav) / self.last_nav
+        self.last_nav = nav
+
+        self.count += 1
+        self.sum += returns
+        self.sum_sq += returns * returns
+
+        self.compounded *= 1 + returns
+        if self.compounded > self.peak:
+            self.peak = self.compounded
+        drawdown = (self.peak - self.compounded) / self.peak
+        if drawdown > self.max_drawdown:
+            self.max_drawdown = drawdown
+
+    def update_batch(self, navs):
+        """一次记录一段净值序列（数组内核使用）"""
+        navs = np.asarray(navs, dtype=np.float64)
+        if len(navs) == 0:
+            return
+        previous = np.empty(len(navs))
+        previous[1:] = navs[:-1]
+        if self.count == 0:
+            self.first_nav = float(navs[0])
+            previous[0] = navs[0]
+        else:
+            previous[0] = self.last_nav
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = (navs - previous) / previous
+        self.last_nav = float(navs[-1])
+
+        # 以之前的累计值为初值按顺序累加，与逐点更新的运算顺序相同
+        self.count += len(returns)
+        self.sum = float(np.cumsum(np.concatenate(([self.sum], returns)))[-1])
+        self.sum_sq = float(np.cumsum(np.concatenate(([self.sum_sq], returns * returns)))[-1])
+
+        compounded = np.cumprod(np.concatenate(([self.compounded], 1 + returns)))[1:]
+        peak = np.maximum.accumulate(np.maximum(compounded, self.peak))
+        self.max_drawdown = max(self.max_drawdown, float(np.max((peak - compounded) / peak)))
+        self.compounded = float(compounded[-1])
+        self.peak = float(peak[-1])
+
+    def record_trade(self, side_code, realized_pnl):
+        """记录一笔交易，side_code为SIDE_CODES中的编码"""
+        self.num_trade_records += 1
+        if side_code < 0 and realized_pnl > 0:
+            self.wins += 1
+
+    def metrics(self):
+        """当前的回测指标，字段与performance_metrics相同"""
+        if self.count == 0:
+            return empty_metrics()
+        total_returns = float(self.last_nav / self.first_nav - 1)
+        compounded_annualized_returns = (1 + total_returns) ** (MINUTES_PER_YEAR / self.count) - 1
+        mean = self.sum / self.count
+        variance = max(self.sum_sq / self.count - mean * mean, 0.0)
+        annualized_volatility = np.sqrt(variance) * np.sqrt(MINUTES_PER_YEAR)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe_ratio = np.float64(compounded_annualized_returns) / annualized_volatility
+        num_trades = self.num_trade_records / 2
+        return {
+            "total_returns": total_returns,
+            "compounded_total_returns": self.compounded - 1,
+            "simple_annualized_returns": mean * MINUTES_PER_YEAR,
+            "compounded_annualized_returns": compounded_annualized_returns,
+            "sharpe_ratio": sharpe_ratio,
+            "num_trades": num_trades,
+            "win_rate": self.wins / num_trades if num_trades > 0 else 0,
+            "max_drawdown": self.max_drawdown
+        }
@@ -0,0 +1,229 @@
+import os
+import numpy as np
+import polars as pl
+from .columnar_recorder import ColumnarRecorder
+from .exchange import SIDE_CODES
+from .market_data import MarketData
+from .performance import performance_metrics, empty_metrics
+
+
+# 组合回测用到的列
+PORTFOLIO_COLUMNS = ("open", "high", "low", "close", "vwap", "bottom_threshold")
+# 组合交易记录字段
+PORTFOLIO_TRADE_SCHEMA = {
+    "symbol": np.int32,
+    "bar": np.int64,
+    "side": np.int8,
+    "price": np.float64,
+    "quantity": np.float64,
+    "fee": np.float64,
+    "cash": np.float64,
+    "position": np.float64,
+    "realized_pnl": np.float64,
+}
+
+
+def _forward_fill(values):
+    """按列（时间方向）前向填充NaN"""
+    index = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(index, axis=0, out=index)
+    # 第一根有效值之前index为0，取到的仍是NaN
+    return values[index, np.arange(values.shape[1])]
+
+
+def _next_true(mask):
+    """
+    对每个时间t和品种s，给出t及之后第一个mask为True的位置（没有则为T）。
+    返回(T+1, S)数组，最后一行为哨兵T
+    """
+    rows = mask.shape[0]
+    index = np.where(mask, np.arange(rows)[:, None], rows)
+    index = np.vstack([index, np.full((1, mask.shape[1]), rows)])
+    return np.minimum.accumulate(index[::-1], axis=0)[::-1]
+
+
+class PortfolioData:
+    """
+    多品种对齐后的市场数据：各品种分别计算指标，再按open_time外连接对齐为(T, S)矩阵，
+    某品种缺失的K线为NaN
+    """
+
+    def __init__(self, data_paths, start_date, end_date, interval, vwap_window, estimate_window, n_sigma, cache=None, warmup=True, strategy=None):
+        if isinstance(data_paths, dict):
+            self.symbols = list(data_paths.keys())
+            paths = list(data_paths.values())
+        else:
+            paths = list(data_paths)
+            self.symbols = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+
+        frames = []
+        for path in paths:
+            market_data = MarketData(path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma,
+                                     cache=cache, warmup=warmup, strategy=strategy)
+            frames.append(market_data.data.select("open_time", *PORTFOLIO_COLUMNS))
+
+        # 所有品种时间戳的并集
+        self.open_time = pl.concat([frame.select("open_time") for frame in frames]).unique().sort("open_time")
+        self.columns = {name: np.empty((len(self.open_time), len(frames))) for name in PORTFOLIO_COLUMNS}
+        for s, frame in enumerate(frames):
+            aligned = self.open_time.join(frame, on="open_time", how="left")
+            for name in PORTFOLIO_COLUMNS:
+                self.columns[name][:, s] = aligned[name].cast(pl.Float64).fill_null(np.nan).to_numpy()
+        self.valid = ~np.isnan(self.columns["close"])
+
+    def get_total_bars(self):
+        return len(self.open_time)
+
+
+def run_portfolio_backtest(data, allocations, fee_rate):
+    """
+    单次遍历完成多品种回测，每个品种是一个独立的子账户（初始资金为allocations[s]）。
+
+    与数组内核相同的思路：第t根K线能否成交只取决于该品种上一根有效K线挂出的限价，
+    因此先对整个(T, S)矩阵向量化求出候选成交点及“下一个候选位置”表，
+    然后所有品种一起按轮推进：每一轮每个品种各自跳到自己的下一个成交点，
+    在(S,)状态数组上向量化完成成交和账户更新。循环轮数等于单品种最多的成交次数。
+    返回各品种的净值矩阵、交易记录和最终账户状态。
+    """
+    columns = data.columns
+    valid = data.valid
+    total_bars, n_symbols = valid.shape
+    allocations = np.asarray(allocations, dtype=np.float64)
+
+    # 上一根有效K线挂出的买价（bottom_threshold）和卖价（vwap）
+    buy_limit = np.vstack([np.full((1, n_symbols), np.nan), _forward_fill(columns["bottom_threshold"])[:-1]])
+    sell_limit = np.vstack([np.full((1, n_symbols), np.nan), _forward_fill(columns["vwap"])[:-1]])
+    with np.errstate(invalid="ignore"):
+        next_buy = _next_true(valid & (columns["low"] <= buy_limit))
+        next_sell = _next_true(valid & (columns["high"] >= sell_limit))
+
+    # 每个品种的账户状态
+    cash = allocations.copy()
+    position = np.zeros(n_symbols)
+    position_cost = np.zeros(n_symbols)
+    realized_pnl = np.zeros(n_symbols)
+    last_bar = np.full(n_symbols, -1)
+    symbols = np.arange(n_symbols)
+
+    trades = ColumnarRecorder(PORTFOLIO_TRADE_SCHEMA)
+    # 账户状态变化点（用于重建净值）
+    changes = ColumnarRecorder({"symbol": np.int32, "bar": np.int64, "cash": np.float64, "position": np.float64})
+
+    while True:
+        flat = position == 0
+        bar = np.where(flat, next_buy[last_bar + 1, symbols], next_sell[last_bar + 1, symbols])
+        active = bar < total_bars
+        if not active.any():
+            break
+
+        buying = active & flat
+        selling = active & ~flat
+        fill_price = np.full(n_symbols, np.nan)
+        if buying.any():
+            s, t = symbols[buying], bar[buying]
+            fill_price[s] = np.minimum(buy_limit[t, s], columns["open"][t, s])
+            quantity = cash[s] / (fill_price[s] * (1 + fee_rate))
+            fee = quantity * fill_price[s] * fee_rate
+            cash[s] -= quantity * fill_price[s] + fee
+            position[s] += quantity
+            position_cost[s] = fill_price[s]
+            trades.extend(symbol=s, bar=t, side=np.full(len(s), SIDE_CODES["buy"]), price=fill_price[s],
+                          quantity=quantity, fee=fee, cash=cash[s], position=position[s], realized_pnl=realized_pnl[s])
+        if selling.any():
+            s, t = symbols[selling], bar[selling]
+            fill_price[s] = np.maximum(sell_limit[t, s], columns["open"][t, s])
+            quantity = position[s]
+            fee = quantity * fill_price[s] * fee_rate
+            cash[s] += quantity * fill_price[s] - fee
+            realized_pnl[s] += (fill_price[s] - position_cost[s]) * quantity - fee
+            position[s] = 0
+            position_cost[s] = 0
+            trades.extend(symbol=s, bar=t, side=np.full(len(s), SIDE_CODES["sell"]), price=fill_price[s],
+                          quantity=quantity, fee=fee, cash=cash[s], position=position[s], realized_pnl=realized_pnl[s])
+
+        s = symbols[active]
+        changes.extend(symbol=s, bar=bar[active], cash=cash[s], position=position[s])
+        last_bar[active] = bar[active]
+        # 没有下一个成交点的品种停在末尾
+        last_bar[~active] = total_bars - 1
+
+    # 重建每个品种每根K线的账户状态和净值（成交发生在记录净值之前）
+    cash_matrix = np.full((total_bars, n_symbols), np.nan)
+    position_matrix = np.full((total_bars, n_symbols), np.nan)
+    cash_matrix[0] = allocations
+    position_matrix[0] = 0
+    change_bars = changes.column("bar")
+    change_symbols = changes.column("symbol")
+    cash_matrix[change_bars, change_symbols] = changes.column("cash")
+    position_matrix[change_bars, change_symbols] = changes.column("position")
+    cash_matrix = _forward_fill(cash_matrix)
+    position_matrix = _forward_fill(position_matrix)
+    close = np.nan_to_num(_forward_fill(columns["close"]))
+    nav = cash_matrix + close * position_matrix
+
+    # 每个品种在最后一根有效K线以开盘价强制平仓
+    last_valid = total_bars - 1 - np.argmax(valid[::-1], axis=0)
+    for s in symbols[(position > 0) & valid.any(axis=0)]:
+        t = last_valid[s]
+        close_price = columns["open"][t, s]
+        quantity = position[s]
+        fee = quantity * close_price * fee_rate
+        cash[s] += quantity * close_price - fee
+        realized_pnl[s] += (close_price - position_cost[s]) * quantity - fee
+        position[s] = 0
+        position_cost[s] = 0
+        trades.append(s, t, SIDE_CODES["sell"], close_price, quantity, fee, cash[s], 0, realized_pnl[s])
+
+    return nav, trades, cash
+
+
+class PortfolioResult:
+    """组合回测结果：各品种净值矩阵、交易记录，以及分品种和组合层面的指标"""
+
+    def __init__(self, data, nav, trades, allocations):
+        self.data = data
+        self.nav = nav
+        self.trades = trades
+        self.allocations = allocations
+
+    def trades_frame(self):
+        frame = self.trades.to_frame()
+        timestamps = self.data.open_time["open_time"].dt.epoch(time_unit="ms").to_numpy()
+        return frame.with_columns(
+            timestamp = pl.Series(timestamps[frame["bar"].to_numpy()]).cast(pl.Datetime(time_unit="ms")),
+            symbol = pl.Series([self.data.symbols[s] for s in frame["symbol"].to_list()], dtype=pl.String),
+            side = pl.when(pl.col("side") == SIDE_CODES["buy"]).then(pl.lit("buy")).otherwise(pl.lit("sell"))
+        ).sort("bar", maintain_order=True).drop("bar").select("timestamp", pl.exclude("timestamp"))
+
+    def portfolio_nav(self):
+        return self.nav.sum(axis=1)
+
+    def symbol_metrics(self):
+        """分品种指标：只使用该品种自己的有效K线，与单品种回测一致"""
+        sides = self.trades.column("side")
+        realized = self.trades.column("realized_pnl")
+        trade_symbols = self.trades.column("symbol")
+        results = {}
+        for s, symbol in enumerate(self.data.symbols):
+            nav = self.nav[self.data.valid[:, s], s]
+            if len(nav) == 0:
+                results[symbol] = empty_metrics()
+                continue
+            mine = trade_symbols == s
+            wins = int(np.count_nonzero(mine & (sides == SIDE_CODES["sell"]) & (realized > 0)))
+            results[symbol] = performance_metrics(nav, int(np.count_nonzero(mine)), wins)
+        return results
+
+    def portfolio_metrics(self):
+        """组合指标：对所有品种子账户净值求和后计算"""
+        if self.nav.shape[0] == 0:
+            return empty_metrics()
+        wins = int(np.count_nonzero((self.trades.column("side") == SIDE_CODES["sell"]) & (self.trades.column("realized_pnl") > 0)))
+        return performance_metrics(self.portfolio_nav(), len(self.trades), wins)
+
+    def metrics_frame(self):
+        """分品种指标与组合指标汇总表"""
+        rows = [{"symbol": symbol, "allocation": float(self.allocations[s]), **metrics}
+                for s, (symbol, metrics) in enumerate(self.symbol_metrics().items())]
+        rows.append({"symbol": "PORTFOLIO", "allocation": float(np.sum(self.allocations)), **self.portfolio_metrics()})
+        return pl.DataFrame(rows)
@@ -0,0 +1,126 @@
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+def peak_rss_mb():
+    """当前进程的峰值RSS（MB），平台不支持时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class Profiler:
+    """
+    回测计时与统计
+
+    - phase(name)：按阶段累计墙钟时间和CPU时间，阶段可以嵌套（名称用'.'分隔）；
+      在后台线程中计时的阶段用phase(name, thread_cpu=True)，CPU时间只计当前线程
+      （time.thread_time，不含polars线程池的CPU），不会与主线程同时进行的阶段重复计算
+    - set_counters(**counters)：记录计数器（下单数、成交数、日志消息数、队列深度等），
+      计数器都取自回测过程中本来就维护的状态，逐bar循环里不做任何额外调用
+    - 可选cProfile和tracemalloc，在start/stop之间采集
+
+    enabled为False时phase返回空上下文，其余方法直接返回，开销可以忽略
+    """
+
+    def __init__(self, enabled=True, cprofile=False, tracemalloc=False, top=30):
+        self.enabled = enabled
+        self.use_cprofile = enabled and cprofile
+        self.use_tracemalloc = enabled and tracemalloc
+        self.top = top                  # cProfile和tracemalloc报告的条目数
+        self.phases = {}                # 阶段名 -> {'wall', 'cpu', 'calls'}
+        self.counters = {}
+        self._cprofile = None
+        self._tracemalloc_report = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.use_cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.use_tracemalloc and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            self._tracemalloc_report = {
+                'current_mb': current / 1024 ** 2,
+                'peak_mb': peak / 1024 ** 2,
+                'top': [
+                    {'location': str(stat.traceback[0]), 'size_mb': stat.size / 1024 ** 2, 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:self.top]
+                ],
+            }
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    def phase(self, name, thread_cpu=False):
+        """计时一个阶段：with profiler.phase('load_data'): ..."""
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name, time.thread_time if thread_cpu else time.process_time)
+
+    @contextmanager
+    def _timed(self, name, cpu_clock):
+        wall = time.perf_counter()
+        cpu = cpu_clock()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            stats['wall'] += time.perf_counter() - wall
+            stats['cpu'] += cpu_clock() - cpu
+            stats['calls'] += 1
+
+    def set_counters(self, **counters):
+        if self.enabled:
+            self.counters.update(counters)
+
+    def _cprofile_report(self):
+        if self._cprofile is None:
+            return None
+        stats = pstats.Stats(self._cprofile, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({
+                'function': f"{filename}:{line}({function})",
+                'calls': calls,
+                'total_time': total,
+                'cumulative_time': cumulative,
+            })
+        rows.sort(key=lambda row: row['cumulative_time'], reverse=True)
+        return rows[:self.top]
+
+    def report(self):
+        """汇总为可序列化为JSON的字典"""
+        return {
+            'phases': self.phases,
+            'counters': self.counters,
+            'peak_rss_mb': peak_rss_mb(),
+            'cprofile': self._cprofile_report(),
+            'tracemalloc': self._tracemalloc_report,
+        }
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False, default=str)
+
+
+# 未开启计时时使用的共享实例
+NULL_PROFILER = Profiler(enabled=False)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import polars as pl
+
+
+# 只影响输出位置和显示、不影响回测结果的配置项，不参与结果键
+OUTPUT_KEYS = (
+    'data_path', 'data_identity', 'verbose', 'log_file', 'log_level', 'log_format', 'trades_output',
+    'cache_dir', 'cache_max_bytes', 'results_dir', 'store_nav',
+    'profile', 'profile_output', 'profile_cprofile', 'profile_tracemalloc',
+)
+# 交易记录和净值序列的parquet压缩方式
+PARQUET_COMPRESSION = "zstd"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    key TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    data_identity TEXT,
+    config TEXT NOT NULL,
+    metrics TEXT NOT NULL,
+    trades_path TEXT,
+    nav_path TEXT,
+    elapsed REAL
+)
+"""
+
+
+class ResultsStore:
+    """
+    回测结果库：SQLite保存每次运行的配置和指标，交易记录和净值序列保存为zstd压缩的parquet文件
+
+        root/results.sqlite
+        root/runs/ab/ab12....trades.parquet
+        root/runs/ab/ab12....nav.parquet
+
+    结果键是去掉输出类配置项（OUTPUT_KEYS）后的完整配置与数据标识的哈希，
+    数据标识可以是字符串（数据文件标识）或可序列化为JSON的结构（back_test中还包括K线金字塔、
+    秒级数据和策略源文件的标识），相同的配置在相同的数据和代码上只计算一次。
+    数据库使用WAL模式并设置忙等待超时，parquet文件先写临时文件再原子替换，
+    数据库记录在文件写完之后才插入，多个扫描子进程并发写入同一个结果库是安全的。
+    """
+
+    def __init__(self, root_dir, timeout=60):
+        self.root_dir = root_dir    # 结果库目录
+        self.timeout = timeout      # SQLite忙等待超时（秒）
+        self.db_path = os.path.join(root_dir, "results.sqlite")
+        os.makedirs(os.path.join(root_dir, "runs"), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # 每次操作单独连接：连接不能跨进程共享，短连接也不会长期持有锁
+        connection = sqlite3.connect(self.db_path, timeout=self.timeout)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:    # 提交或回滚事务
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def make_key(config, data_identity):
+        """由回测配置（去掉输出类配置项）和数据文件标识生成结果键"""
+        payload = json.dumps({
+            'config': {key: value for key, value in config.items() if key not in OUTPUT_KEYS},
+            'data_identity': data_identity,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key, kind):
+        return os.path.join(self.root_dir, "runs", key[:2], f"{key}.{kind}.parquet")
+
+    def _write(self, key, kind, data):
+        path = self._path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data.write_parquet(tmp_path, compression=PARQUET_COMPRESSION)
+        os.replace(tmp_path, path)
+        return os.path.relpath(path, self.root_dir)
+
+    def get(self, key):
+        """读取结果键对应的指标，不存在时返回None"""
+        with self._connect() as connection:
+            row = connection.execute("SELECT metrics FROM runs WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["metrics"]) if row is not None else None
+
+    def put(self, key, config, data_identity, metrics, trades=None, nav=None, elapsed=None):
+        """保存一次运行：先写交易记录和净值的parquet文件，再插入（或覆盖）数据库记录"""
+        trades_path = self._write(key, "trades", trades) if trades is not None else None
+        nav_path = self._write(key, "nav", nav) if nav is not None else None
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO runs (key, created_at, data_identity, config, metrics, trades_path, nav_path, elapsed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, time.strftime("%Y-%m-%d %H:%M:%S"),
+                 data_identity if isinstance(data_identity, str) else json.dumps(data_identity, sort_keys=True, default=str),
+                 json.dumps(config, sort_keys=True, default=str),
+                 json.dumps(metrics), trades_path, nav_path, elapsed)
+            )
+
+    def load_trades(self, key):
+        """读取交易记录，没有保存时返回None"""
+        return self._load(key, "trades_path")
+
+    def load_nav(self, key):
+        """读取净值序列，没有保存时返回None（store_nav为False的运行不保存净值）"""
+        return self._load(key, "nav_path")
+
+    def _load(self, key, column):
+        with self._connect() as connection:
+            row = connection.execute(f"SELECT {column} FROM runs WHERE key = ?", (key,)).fetchone()
+        if row is None or row[column] is None:
+            return None
+        return pl.read_parquet(os.path.join(self.root_dir, row[column]))
+
+    def runs(self):
+        """全部运行的列表：键、时间、配置和各项指标各占一列"""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT key, created_at, elapsed, config, metrics FROM runs ORDER BY created_at").fetchall()
+        return pl.DataFrame([
+            {'key': row["key"], 'created_at': row["created_at"], 'elapsed': row["elapsed"],
+             'config': row["config"], **json.loads(row["metrics"])}
+            for row in rows
+        ])
+
+    def delete(self, key):
+        """删除一次运行及其文件"""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM runs WHERE key = ?", (key,))
+        for kind in ("trades", "nav"):
+            try:
+                os.remove(self._path(key, kind))
+            except FileNotFoundError:
+                pass
+
@@ -0,0 +1,199 @@
+import numpy as np
+import polars as pl
+from .performance import MINUTES_PER_YEAR
+
+# 收益率序列重抽样后计算的指标（口径与performance_metrics相同）
+RETURN_METRICS = (
+    "compounded_total_returns",
+    "simple_annualized_returns",
+    "compounded_annualized_returns",
+    "sharpe_ratio",
+    "max_drawdown",
+)
+# 逐笔交易收益率重抽样后计算的指标
+TRADE_METRICS = (
+    "total_returns",
+    "mean_trade_returns",
+    "win_rate",
+    "max_drawdown",
+)
+# 每批重抽样矩阵（及计算中的同尺寸中间数组）占用内存的上限（字节）
+DEFAULT_BATCH_BYTES = 256 * 1024 ** 2
+# 每批计算中同时存在的、与重抽样矩阵同尺寸的数组个数（收益率、复利净值、峰值和回撤等中间结果）
+_BATCH_ARRAYS = 6
+
+
+def nav_returns(nav):
+    """
+    净值序列的逐分钟收益率，第一个点记为0（与performance_metrics相同）。
+    nav可以是净值数组，也可以是Exchange.nav_records()或ResultsStore.load_nav()返回的净值表
+    """
+    if isinstance(nav, pl.DataFrame):
+        nav = nav["nav"].to_numpy()
+    nav = np.asarray(nav, dtype=np.float64)
+    returns = np.zeros(len(nav))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns[1:] = (nav[1:] - nav[:-1]) / nav[:-1]
+    return returns
+
+
+def trade_returns(trades, initial_balance):
+    """
+    逐笔交易收益率：相邻两次空仓时账户现金之比减1（第一次以初始资金为起点）。
+    全仓买入、全部卖出的策略中即每一对买卖的收益率（含手续费）；
+    挂单簿分批成交时，两次空仓之间的多笔成交合并为一笔。
+    trades为Exchange.save_trades_records()或ResultsStore.load_trades()返回的交易记录表
+    """
+    flat_cash = trades.filter(pl.col("position") == 0)["cash"].to_numpy().astype(np.float64)
+    equity = np.concatenate(([float(initial_balance)], flat_cash))
+    return equity[1:] / equity[:-1] - 1
+
+
+def _batch_size(length, batch_size, max_bytes):
+    """每批的重抽样数：未指定时按内存上限计算"""
+    if batch_size is not None:
+        return max(int(batch_size), 1)
+    return max(int(max_bytes // (max(length, 1) * 8 * _BATCH_ARRAYS)), 1)
+
+
+def block_bootstrap_indices(length, block_size, n_resamples, rng):
+    """
+    循环块自助法的抽样下标矩阵（n_resamples x length）：
+    每行由随机起点的连续block_size个下标（超过末尾时回到开头）首尾相接而成，保留块内的自相关
+    """
+    block_size = min(max(int(block_size), 1), length)
+    n_blocks = -(-length // block_size)
+    starts = rng.integers(0, length, size=(n_resamples, n_blocks, 1))
+    indices = (starts + np.arange(block_size)) % length
+    return indices.reshape(n_resamples, n_blocks * block_size)[:, :length]
+
+
+def return_metrics(returns):
+    """
+    按行向量化计算收益率矩阵（每行一条收益率序列，第一列为0）的指标，
+    公式与performance_metrics相同，返回 指标名 -> 各行指标的数组
+    """
+    returns = np.atleast_2d(returns)
+    length = returns.shape[1]
+    growth = np.cumprod(1 + returns, axis=1)
+    compounded_total_returns = growth[:, -1] - 1
+    compounded_annualized_returns = (1 + compounded_total_returns) ** (MINUTES_PER_YEAR / length) - 1
+    annualized_volatility = returns.std(axis=1) * np.sqrt(MINUTES_PER_YEAR)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe_ratio = compounded_annualized_returns / annualized_volatility
+    peak = np.maximum.accumulate(growth, axis=1)
+    max_drawdown = np.max((peak - growth) / peak, axis=1)
+    return {
+        "compounded_total_returns": compounded_total_returns,
+        "simple_annualized_returns": returns.mean(axis=1) * MINUTES_PER_YEAR,
+        "compounded_annualized_returns": compounded_annualized_returns,
+        "sharpe_ratio": sharpe_ratio,
+        "max_drawdown": max_drawdown,
+    }
+
+
+def trade_metrics(returns):
+    """按行向量化计算逐笔交易收益率矩阵（每行一条交易序列）的指标"""
+    returns = np.atleast_2d(returns)
+    growth = np.cumprod(1 + returns, axis=1)
+    # 峰值从初始资金（1）开始
+    peak = np.maximum(np.maximum.accumulate(growth, axis=1), 1)
+    return {
+        "total_returns": growth[:, -1] - 1,
+        "mean_trade_returns": returns.mean(axis=1),
+        "win_rate": (returns > 0).mean(axis=1),
+        "max_drawdown": np.max((peak - growth) / peak, axis=1),
+    }
+
+
+def block_bootstrap(returns, n_resamples=1000, block_size=60 * 24, seed=None, batch_size=None, max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    收益率序列的块自助法重抽样：对第一个点之后的收益率做循环块重抽样（第一列仍为0），
+    每批生成batch_size x 序列长度的重抽样矩阵并向量化计算全部指标，
+    内存占用取决于批大小（未指定时由max_bytes确定）而与重抽样次数无关。
+    返回 指标名 -> 长度为n_resamples的数组
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    body = returns[1:]
+    if len(body) == 0:
+        raise ValueError("at least two nav records are required")
+    rng = np.random.default_rng(seed)
+    batch_size = _batch_size(len(returns), batch_size, max_bytes)
+    samples = {name: np.empty(n_resamples) for name in RETURN_METRICS}
+    for begin in range(0, n_resamples, batch_size):
+        count = min(batch_size, n_resamples - begin)
+        indices = block_bootstrap_indices(len(body), block_size, count, rng)
+        batch = np.zeros((count, len(returns)))
+        batch[:, 1:] = body[indices]
+        del indices
+        for name, values in return_metrics(batch).items():
+            samples[name][begin:begin + count] = values
+    return samples
+
+
+def trade_shuffle(returns, n_resamples=1000, replace=False, seed=None, batch_size=None, max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    逐笔交易收益率的重抽样：replace为False时只打乱交易顺序（总收益率不变，考察回撤对交易顺序的敏感程度），
+    为True时有放回抽样（考察总收益率和胜率的抽样误差）。
+    分批向量化计算，返回 指标名 -> 长度为n_resamples的数组
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    if len(returns) == 0:
+        raise ValueError("at least one completed trade is required")
+    rng = np.random.default_rng(seed)
+    batch_size = _batch_size(len(returns), batch_size, max_bytes)
+    samples = {name: np.empty(n_resamples) for name in TRADE_METRICS}
+    for begin in range(0, n_resamples, batch_size):
+        count = min(batch_size, n_resamples - begin)
+        if replace:
+            indices = rng.integers(0, len(returns), size=(count, len(returns)))
+        else:
+            indices = rng.permuted(np.broadcast_to(np.arange(len(returns)), (count, len(returns))), axis=1)
+        for name, values in trade_metrics(returns[indices]).items():
+            samples[name][begin:begin + count] = values
+    return samples
+
+
+def confidence_intervals(samples, point=None, confidence=0.95):
+    """
+    由重抽样指标计算百分位置信区间：每个指标一行，列为
+    metric, point（原序列的指标）, mean, std, lower, upper
+    """
+    alpha = (1 - confidence) / 2
+    rows = []
+    for name, values in samples.items():
+        values = values[np.isfinite(values)]
+        lower, upper = np.quantile(values, (alpha, 1 - alpha)) if len(values) > 0 else (np.nan, np.nan)
+        rows.append({
+            "metric": name,
+            "point": float(point[name]) if point is not None else None,
+            "mean": float(values.mean()) if len(values) > 0 else np.nan,
+            "std": float(values.std()) if len(values) > 0 else np.nan,
+            "lower": float(lower),
+            "upper": float(upper),
+        })
+    return pl.DataFrame(rows, schema={"metric": pl.Utf8, "point": pl.Float64, "mean": pl.Float64,
+                                      "std": pl.Float64, "lower": pl.Float64, "upper": pl.Float64})
+
+
+def robustness_report(nav, trades=None, initial_balance=None, n_resamples=1000, block_size=60 * 24,
+                      confidence=0.95, seed=None, batch_size=None, max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    一次回测的稳健性分析：净值收益率的块自助法，以及（给出交易记录时）交易顺序打乱和交易有放回抽样。
+    返回的表在confidence_intervals的列之前加一列method（'block_bootstrap'、'trade_shuffle'、'trade_bootstrap'）
+    """
+    rng = np.random.default_rng(seed)
+    returns = nav_returns(nav)
+    reports = [
+        confidence_intervals(block_bootstrap(returns, n_resamples, block_size, rng, batch_size, max_bytes),
+                             {name: values[0] for name, values in return_metrics(returns).items()}, confidence)
+        .with_columns(pl.lit("block_bootstrap").alias("method"))
+    ]
+    if trades is not None:
+        per_trade = trade_returns(trades, initial_balance)
+        if len(per_trade) > 0:
+            point = {name: values[0] for name, values in trade_metrics(per_trade).items()}
+            for method, replace in (("trade_shuffle", False), ("trade_bootstrap", True)):
+                samples = trade_shuffle(per_trade, n_resamples, replace, rng, batch_size, max_bytes)
+                reports.append(confidence_intervals(samples, point, confidence).with_columns(pl.lit(method).alias("method")))
+    return pl.concat(reports).select("method", "metric", "point", "mean", "std", "lower", "upper")
@@ -0,0 +1,164 @@
+import importlib
+import inspect
+from abc import ABC, abstractmethod
+import polars as pl
+from .indicator_cache import file_identity
+
+
+class Strategy(ABC):
+    """
+    策略接口，分两部分：
+
+    1. 批量部分：indicator_stages()以polars表达式声明指标和挂单价格列，
+       在整段数据上按阶段一次性计算（每个阶段一次with_columns，之后去掉含空值的行），
+       结果随MarketData一起缓存。
+    2. 顺序部分：一个很小的状态机。initial_state()给出初始状态，order(state)给出该状态下
+       每根K线挂出的限价单（方向, 价格列名），on_fill(state, side)在成交时返回新状态。
+
+    两次成交之间挂单只由状态决定，因此数组内核可以先向量化求出每种挂单的候选成交点，
+    再逐个成交点推进，真正顺序执行的只有成交和持仓变化。
+    每个状态每根K线都必须挂单；不想成交时让价格列取NaN即可（NaN永远不会成交）。
+
+    子类必须实现indicator_stages、required_history、states、order和on_fill，
+    缺少任何一个时实例化即抛出TypeError。
+    """
+
+    # 策略名称（注册到STRATEGIES中的名字）
+    name = None
+
+    @abstractmethod
+    def indicator_stages(self):
+        """指标计算阶段：[{列名: 表达式}, ...]，后面的阶段可以引用前面阶段的列"""
+
+    @abstractmethod
+    def required_history(self):
+        """
+        指标完整预热所需的有效K线数（最长滚动窗口链减1）。
+        warmup和分块计算指标时由此决定每块向前多读的历史，不需要历史时返回0
+        """
+
+    @abstractmethod
+    def states(self):
+        """全部状态"""
+
+    def initial_state(self):
+        return self.states()[0]
+
+    @abstractmethod
+    def order(self, state):
+        """状态state下挂出的限价单：('buy'或'sell', 价格列名)"""
+
+    @abstractmethod
+    def on_fill(self, state, side):
+        """挂单成交后的状态转移"""
+
+    def params(self):
+        """策略参数（用于缓存键）"""
+        return {}
+
+    def identity(self):
+        """策略标识：名称和参数，指标帧缓存键的一部分"""
+        return [self.name or type(self).__qualname__, self.params()]
+
+    def price_columns(self):
+        """所有状态下用到的挂单价格列"""
+        columns = []
+        for state in self.states():
+            column = self.order(state)[1]
+            if column not in columns:
+                columns.append(column)
+        return tuple(columns)
+
+    def prepare(self, data):
+        """在（惰性的）K线数据上计算全部指标"""
+        for stage in self.indicator_stages():
+            data = data.with_columns(**stage).drop_nulls()
+        return data
+
+
+class VwapReversionStrategy(Strategy):
+    """
+    默认策略：VWAP均值回归
+    空仓时在bottom_threshold = vwap * (1 - n_sigma * sigma)挂买单，持仓时在vwap挂卖单
+    """
+
+    name = 'vwap_reversion'
+
+    def __init__(self, vwap_window=20, estimate_window=60 * 24, n_sigma=3):
+        self.vwap_window = vwap_window  # VWAP计算窗口
+        self.estimate_window = estimate_window  # 波动率估计窗口
+        self.n_sigma = n_sigma  # 阈值倍数
+
+    def indicator_stages(self):
+        return [
+            {"vwap": pl.col("quote_volume").rolling_sum(self.vwap_window) / (pl.col("volume").rolling_sum(self.vwap_window) + 1)},
+            {"bias": pl.col("close") / pl.col("vwap") - 1},
+            {"sigma": pl.col("bias").rolling_std(self.estimate_window)},
+            {
+                "bottom_threshold": pl.col("vwap") * (1 - self.n_sigma * pl.col("sigma")),
+                "top_threshold": pl.col("vwap") * (1 + self.n_sigma * pl.col("sigma")),
+            },
+        ]
+
+    def required_history(self):
+        return self.vwap_window + self.estimate_window - 2
+
+    def states(self):
+        return ('flat', 'long')
+
+    def order(self, state):
+        if state == 'flat':
+            return 'buy', "bottom_threshold"
+        return 'sell', "vwap"
+
+    def on_fill(self, state, side):
+        return 'long' if side == 'buy' else 'flat'
+
+    def params(self):
+        return {'vwap_window': self.vwap_window, 'estimate_window': self.estimate_window, 'n_sigma': self.n_sigma}
+
+
+# 内置策略
+STRATEGIES = {
+    VwapReversionStrategy.name: VwapReversionStrategy,
+}
+DEFAULT_STRATEGY = VwapReversionStrategy.name
+
+
+def source_identity(strategy):
+    """
+    策略类所在源文件的标识（路径、大小、修改时间），策略代码被修改后随之变化，用于结果库的键；
+    取不到源文件时（交互式定义的类等）返回None
+    """
+    try:
+        path = inspect.getsourcefile(type(strategy))
+    except TypeError:
+        return None
+    return file_identity(path) if path is not None else None
+
+
+def load_strategy_class(name):
+    """按名称查找策略类：内置策略名，或'包.模块:类名'形式的自定义策略"""
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    if ':' not in name:
+        raise ValueError(f"unknown strategy: {name}")
+    module_name, class_name = name.split(':', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_strategy(config):
+    """
+    由回测配置创建策略：'strategy'为策略名（默认vwap_reversion），'strategy_params'为构造参数。
+    默认策略的参数也可以沿用顶层的'vwap_window'、'estimate_window'、'n_sigma'
+    """
+    name = config.get('strategy', DEFAULT_STRATEGY)
+    params = dict(config.get('strategy_params', None) or {})
+    if name == DEFAULT_STRATEGY:
+        params = {
+            'vwap_window': config.get('vwap_window', 20),
+            'estimate_window': config.get('estimate_window', 60*24),
+            'n_sigma': config.get('n_sigma', 3),
+            **params,
+        }
+    return load_strategy_class(name)(**params)
@@ -0,0 +1,204 @@
+import json
+import socket
+from collections import deque
+from datetime import datetime, timedelta
+import polars as pl
+from .market_data import scan_klines, time_literal, DATE_FORMAT, KLINE_COLUMNS
+from .online_indicators import OnlineIndicators, OnlineKlineAggregator
+from .strategy import VwapReversionStrategy
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _scan_range(data_path, start=None, end=None, before=None):
+    """惰性扫描[start, end]（或[start, before)）区间的原始K线，保持文件中的顺序"""
+    data = scan_klines(data_path, start, end or before)
+    schema = data.collect_schema()
+    time_dtype = schema["open_time"]
+    if start is not None:
+        data = data.filter(pl.col("open_time") >= time_literal(start, time_dtype))
+    if end is not None:
+        data = data.filter(pl.col("open_time") <= time_literal(end, time_dtype))
+    if before is not None:
+        data = data.filter(pl.col("open_time") < time_literal(before, time_dtype))
+    return data.select(
+        [name for name in KLINE_COLUMNS if name in schema]
+    ).with_columns(
+        open_time = pl.col("open_time").cast(pl.Datetime(time_unit="ms"))
+    )
+
+
+def _replay(data, batch_size):
+    """
+    以流式引擎逐批读取并逐根产出K线字典，内存只与批大小有关。
+    不做全量排序，文件必须已按open_time排序（DataStore的分区和ingest_data写出的文件都是有序的）
+    """
+    last = None
+    for batch in data.collect_batches(chunk_size=batch_size):
+        if len(batch) == 0:
+            continue
+        open_time = batch["open_time"]
+        if not open_time.is_sorted() or (last is not None and open_time[0] < last):
+            raise ValueError("streaming replay requires klines sorted by open_time")
+        last = open_time[-1]
+        yield from batch.iter_rows(named=True)
+
+
+def replay_parquet(data_path, start_date=None, end_date=None, batch_size=10000):
+    """
+    回放本地K线文件：按时间顺序逐根产出1分钟K线字典
+    """
+    start = datetime.strptime(start_date, DATE_FORMAT) if start_date is not None else None
+    end = datetime.strptime(end_date, DATE_FORMAT) if end_date is not None else None
+    yield from _replay(_scan_range(data_path, start, end), batch_size)
+
+
+def replay_warmup(data_path, start_date, bars, interval=1, batch_size=10000):
+    """
+    回放start_date之前用于预热的历史K线（StreamingMarketData的warmup_source）：
+    至少包含bars根有效1分钟K线，结束于start_date所在聚合周期的起点（不含），
+    预热的最后一个聚合窗口在正式回放开始前结束。
+    回看区间从估计值开始，不够时加倍，读取量与历史总长度无关
+    """
+    start = datetime.strptime(start_date, DATE_FORMAT)
+    before = start - (start - _EPOCH) % timedelta(minutes=interval)
+    first = scan_klines(data_path).select(
+        pl.col("open_time").cast(pl.Datetime(time_unit="ms")).min()
+    ).collect().item()
+    if first is None or first >= before:
+        return
+    lookback = timedelta(minutes=bars + 1)
+    while True:
+        candidate = before - lookback
+        if candidate <= first:
+            candidate = None
+            break
+        rows = _scan_range(data_path, candidate, before=before).filter(
+            pl.col("quote_volume") > 0
+        ).select(pl.len()).collect().item()
+        if rows >= bars:
+            break
+        lookback *= 2
+    yield from _replay(_scan_range(data_path, candidate, before=before), batch_size)
+
+
+def replay_socket(host, port):
+    """
+    从TCP socket读取K线：每行一个JSON对象，open_time为毫秒时间戳或"%Y-%m-%d %H:%M:%S"字符串
+    """
+    with socket.create_connection((host, port)) as conn, conn.makefile('r', encoding='utf-8') as stream:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            bar = json.loads(line)
+            open_time = bar['open_time']
+            if isinstance(open_time, (int, float)):
+                bar['open_time'] = _EPOCH + timedelta(milliseconds=open_time)
+            else:
+                bar['open_time'] = datetime.strptime(open_time, DATE_FORMAT)
+            yield bar
+
+
+class StreamingMarketData:
+    """
+    流式市场数据：逐根消费K线源，增量计算指标，接口与MarketData的逐bar接口一致，
+    可直接用于back_test的逐bar循环和Exchange。
+
+    K线源是任意按时间排序的1分钟K线字典迭代器（本地文件回放、socket、实盘推送等）。
+    指标由OnlineIndicators以O(1)增量更新，内存只与窗口长度有关；
+    warmup_source提供start之前的历史K线时（replay_warmup），只需最近的窗口长度的数据即可完成预热。
+    增量指标只实现了默认策略（VwapReversionStrategy）的指标。
+    """
+
+    def __init__(self, source, interval, vwap_window, estimate_window, n_sigma, warmup_source=None):
+        self.interval = interval
+        self.vwap_window = vwap_window
+        self.estimate_window = estimate_window
+        self.n_sigma = n_sigma
+        self.strategy = VwapReversionStrategy(vwap_window, estimate_window, n_sigma)
+
+        self.source = iter(source)
+        self.aggregator = OnlineKlineAggregator(interval) if interval > 1 else None
+        self.indicators = OnlineIndicators(vwap_window, estimate_window, n_sigma)
+        self.pending = deque()     # 已计算完成、等待消费的K线
+        self.exhausted = False     # K线源是否已耗尽
+
+        if warmup_source is not None:
+            self.warmup(warmup_source)
+
+        self.current_index = 0
+        self.current_bar = self._pull()
+        # 预读下一根K线，用于判断当前是否为最后一根
+        self.next_bar_data = self._pull() if self.current_bar is not None else None
+
+    def required_history(self):
+        """预热所需的1分钟K线数量（不计无效K线）"""
+        return (self.vwap_window + self.estimate_window - 1) * self.interval
+
+    def warmup(self, bars):
+        """
+        用历史K线预热聚合器和指标窗口，不产出K线。
+        历史K线应结束于聚合周期的边界（replay_warmup），最后一个聚合窗口在这里直接结束
+        """
+        for bar in bars:
+            self._process(bar)
+        if self.aggregator is not None:
+            bar = self.aggregator.flush()
+            if bar is not None:
+                self._emit(bar)
+        self.pending.clear()
+
+    def _process(self, bar):
+        """处理一根原始K线：过滤、聚合、更新指标"""
+        if not bar['quote_volume'] > 0:
+            return
+        if self.aggregator is not None:
+            bar = self.aggregator.update(bar)
+            if bar is None:
+                return
+        self._emit(bar)
+
+    def _emit(self, bar):
+        bar = self.indicators.update(bar)
+        if bar is not None:
+            self.pending.append(bar)
+
+    def _pull(self):
+        """取出下一根带指标的K线，K线源耗尽时返回None"""
+        while not self.pending:
+            if self.exhausted:
+                return None
+            try:
+                self._process(next(self.source))
+            except StopIteration:
+                self.exhausted = True
+                # 最后一个未结束的聚合窗口
+                if self.aggregator is not None:
+                    bar = self.aggregator.flush()
+                    if bar is not None:
+                        self._emit(bar)
+        return self.pending.popleft()
+
+    def get_current_bar(self):
+        """
+        获取当前K线
+        """
+        return self.current_bar
+
+    def next_bar(self):
+        """
+        推进到下一根K线
+        """
+        self.current_index += 1
+        self.current_bar = self.next_bar_data
+        self.next_bar_data = self._pull() if self.current_bar is not None else None
+        return self.current_bar is not None
+
+    def has_more_data(self):
+        return self.current_bar is not None
+
+    def get_total_bars(self):
+        # 流式数据总长度未知
+        return None
@@ -0,0 +1,135 @@
+from single_backtest_engine import back_test
+from module.market_data import load_klines
+from module.indicator_cache import file_identity
+from module.kline_pyramid import KlinePyramid
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import polars as pl
+from tqdm import tqdm
+
+'''
+参数扫描需要的参数：
+'base_config': 基础回测配置（同back_test），所有组合共享
+'grid': 参数网格，如 {"vwap_window": [10, 20], "n_sigma": [2, 3]}
+'n_samples': 从网格中随机抽取的组合数，默认None表示遍历全部组合
+'seed': 随机抽样种子
+'processes': 进程数，默认为CPU核数
+'output': 结果表保存路径（csv），默认None表示不保存
+base_config中设置'cache_dir'时，各子进程共享同一个指标缓存目录，缓存键使用原始数据文件的标识
+base_config中设置'pyramid_dir'时，扫描开始前一次性建好网格中所有interval的K线金字塔层，
+子进程直接内存映射读取对应的层，不再生成共享的K线副本
+base_config中设置'results_dir'时，各子进程共享同一个结果库，已经算过的组合直接返回保存的指标
+'''
+
+# 扫描时默认的回测设置：数组内核、不打印、不写交易记录和日志、不保存净值序列
+SWEEP_DEFAULTS = {
+    'engine': 'array',
+    'store_nav': False,
+    'verbose': False,
+    'trades_output': None,
+    'log_file': os.devnull,
+    'log_level': 'WARNING',
+}
+
+
+def expand_grid(grid, n_samples=None, seed=None):
+    """
+    展开参数网格为组合列表，n_samples不为None时随机抽取（不放回）
+    """
+    keys = list(grid.keys())
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+    if n_samples is not None and n_samples < len(combos):
+        combos = random.Random(seed).sample(combos, n_samples)
+    return combos
+
+
+def share_klines(data_path, directory):
+    """
+    读取一次原始K线，写成未压缩的Arrow IPC文件，子进程以内存映射方式共享；
+    本地数据仓库的品种目录本身就是内存映射读取的分区文件，直接共享
+    """
+    if os.path.isdir(data_path):
+        return data_path
+    shared_path = os.path.join(directory, "klines.arrow")
+    load_klines(data_path).sort("open_time").write_ipc(shared_path, compression="uncompressed")
+    return shared_path
+
+
+def create_pool(processes):
+    """
+    创建spawn方式启动的进程池（避免fork polars线程池带来的死锁），
+    每个子进程只用一个polars线程，避免进程数×线程数的超额订阅
+    """
+    previous_threads = os.environ.get("POLARS_MAX_THREADS")
+    os.environ["POLARS_MAX_THREADS"] = "1"
+    try:
+        return multiprocessing.get_context("spawn").Pool(processes)
+    finally:
+        if previous_threads is None:
+            del os.environ["POLARS_MAX_THREADS"]
+        else:
+            os.environ["POLARS_MAX_THREADS"] = previous_threads
+
+
+def _run_one(task):
+    """子进程：运行单个配置并返回(序号, 参数, 指标)"""
+    index, params, config = task
+    return index, params, back_test(config)
+
+
+def run_sweep(base_config, grid, n_samples=None, seed=None, processes=None, show_progress=True):
+    """
+    在进程池中并行运行参数组合，返回每个组合的参数与回测指标构成的结果表
+    """
+    if base_config.get('data_path', None) is None:
+        raise ValueError("data_path is required")
+    combos = expand_grid(grid, n_samples, seed)
+    processes = processes or os.cpu_count()
+
+    with tempfile.TemporaryDirectory(prefix="sweep_") as directory:
+        pyramid_dir = base_config.get('pyramid_dir', None)
+        if pyramid_dir is not None:
+            # 金字塔本身就是内存映射共享的，只需补建缺失的层
+            intervals = {params.get('interval', base_config.get('interval', 1)) for params in combos}
+            KlinePyramid(pyramid_dir).ensure(base_config['data_path'], intervals)
+            shared_path = base_config['data_path']
+        else:
+            shared_path = share_klines(base_config['data_path'], directory)
+
+        # 缓存键使用原始文件标识，而不是每次扫描新生成的共享文件
+        data_identity = base_config.get('data_identity', None) or file_identity(base_config['data_path'])
+
+        tasks = []
+        for index, params in enumerate(combos):
+            config = {**base_config, **SWEEP_DEFAULTS, **params,
+                      'data_path': shared_path, 'data_identity': data_identity}
+            tasks.append((index, params, config))
+
+        rows = []
+        with create_pool(processes) as pool:
+            with tqdm(total=len(tasks), desc='参数扫描', unit='run', disable=not show_progress) as pbar:
+                for index, params, results in pool.imap_unordered(_run_one, tasks):
+                    rows.append({'run': index, **params, **results})
+                    pbar.update(1)
+
+    return pl.DataFrame(rows).sort('run')
+
+
+if __name__ == '__main__':
+    config_path = sys.argv[1] if len(sys.argv) > 1 else 'example_sweep_config.json'
+    sweep_config = json.load(open(config_path, 'r'))
+    results = run_sweep(
+        sweep_config['base_config'],
+        sweep_config['grid'],
+        n_samples=sweep_config.get('n_samples', None),
+        seed=sweep_config.get('seed', None),
+        processes=sweep_config.get('processes', None),
+    )
+    print(results)
+    if sweep_config.get('output', None) is not None:
+        results.write_csv(sweep_config['output'])
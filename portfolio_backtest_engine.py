@@ -0,0 +1,78 @@
+from module.portfolio import PortfolioData, run_portfolio_backtest, PortfolioResult
+from module.indicator_cache import IndicatorCache
+from module.strategy import create_strategy, DEFAULT_STRATEGY
+import numpy as np
+
+'''
+组合回测需要的参数（其余同back_test）：
+'data_paths': 各品种数据路径，列表或 {品种: 路径} 字典
+'weights': 各品种资金权重 {品种: 权重}，默认等权，自动归一化
+'initial_balance'：组合初始资金，按权重分配给各品种子账户
+'trades_output': 交易记录csv路径，默认'portfolio_trades_records.csv'，为None时不保存
+'metrics_output': 分品种及组合指标csv路径，默认None表示不保存
+'verbose': 是否打印回测结果，默认True
+'strategy_params': 默认策略的构造参数；组合内核固定按默认策略挂单（bottom_threshold买入、vwap卖出），
+    'strategy'设为其他策略时抛出ValueError
+'''
+
+def portfolio_back_test(config):
+    # 加载配置参数
+    data_paths = config.get('data_paths', None)
+    if not data_paths:
+        raise ValueError("data_paths is required")
+    start_date = config.get('start_date', None)
+    end_date = config.get('end_date', None)
+    interval = config.get('interval', 1)
+    vwap_window = config.get('vwap_window', 20)
+    estimate_window = config.get('estimate_window', 60*24)
+    n_sigma = config.get('n_sigma', 3)
+    initial_balance = config.get('initial_balance', 1000000)
+    fee_rate = config.get('fee_rate', 0)
+    trades_output = config.get('trades_output', 'portfolio_trades_records.csv')
+    metrics_output = config.get('metrics_output', None)
+    verbose = config.get('verbose', True)
+    cache_dir = config.get('cache_dir', None)
+    cache = IndicatorCache(cache_dir, config.get('cache_max_bytes', 2 * 1024 ** 3)) if cache_dir is not None else None
+
+    # 策略（组合内核只实现了默认策略的挂单）
+    if config.get('strategy', DEFAULT_STRATEGY) != DEFAULT_STRATEGY:
+        raise ValueError("portfolio backtest only supports the default strategy")
+    strategy = create_strategy(config)
+
+    # 加载并对齐各品种数据
+    data = PortfolioData(data_paths, start_date, end_date, interval, vwap_window, estimate_window, n_sigma,
+                         cache=cache, warmup=config.get('warmup', True), strategy=strategy)
+
+    # 资金分配
+    weights = config.get('weights', None)
+    if weights is None:
+        weights = np.ones(len(data.symbols))
+    else:
+        weights = np.array([weights.get(symbol, 0) for symbol in data.symbols], dtype=np.float64)
+    if weights.sum() <= 0:
+        raise ValueError("weights must sum to a positive number")
+    allocations = initial_balance * weights / weights.sum()
+
+    # 回测
+    nav, trades, _ = run_portfolio_backtest(data, allocations, fee_rate)
+    result = PortfolioResult(data, nav, trades, allocations)
+
+    # 保存交易记录和指标
+    if trades_output is not None:
+        result.trades_frame().write_csv(trades_output)
+    metrics = result.metrics_frame()
+    if metrics_output is not None:
+        metrics.write_csv(metrics_output)
+
+    if verbose:
+        print("组合回测完成！")
+        print(metrics)
+
+    return result
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+    config_path = sys.argv[1] if len(sys.argv) > 1 else 'example_portfolio_config.json'
+    portfolio_back_test(json.load(open(config_path, 'r')))
@@ -1,23 +1,72 @@
 from module.market_data import MarketData
+from module.streaming_market_data import StreamingMarketData, replay_parquet, replay_warmup
+from module.chunked_market_data import ChunkedMarketData
 from module.exchange import Exchange
+from module.intrabar import IntrabarFills
+from module.backtest_kernel import run_array_backtest
+from module.indicator_cache import IndicatorCache, file_identity
+from module.results_store import ResultsStore, PARQUET_COMPRESSION
+from module.robustness import robustness_report
+from module.kline_pyramid import KlinePyramid
+from module.strategy import create_strategy, source_identity, DEFAULT_STRATEGY
+from module.buffered_logger import parse_level
+from module.profiler import Profiler, NULL_PROFILER
 import datetime
 import os
+import time
+import polars as pl
 from tqdm import tqdm
 
 '''
 回测需要的参数：
-'data_path': 数据路径
+'data_path': 数据路径（parquet或Arrow IPC文件，或DataStore的品种目录：按月分区，只内存映射回测区间内的分区）
 'start_time': 回测开始时间
 'end_time': 回测结束时间
 'interval': 回测时间间隔
 'vwap_window': VWAP窗口
 'estimate_window': 波动率估计窗口
 'n_sigma': 阈值倍数
+'strategy': 策略名称，默认'vwap_reversion'（上面三个参数即其参数）；自定义策略写作'包.模块:类名'
+'strategy_params': 策略构造参数字典，默认None
 'initial_balance'：初始资金
 'fee_rate': 手续费率
+'engine': 回测引擎，'loop'为逐bar循环（默认），'array'为数组内核
+'log_file': 日志文件路径，默认在Logging目录下按时间戳生成
+'trades_output': 交易记录保存路径（.parquet后缀保存为zstd压缩的parquet，否则为csv），默认'trades_records.csv'（设置results_dir时默认None），为None时不保存
+'verbose': 是否打印进度条和回测结果，默认True
+'log_level': 日志级别，默认'DEBUG'（记录逐bar下单），'INFO'只记录成交
+'log_format': 日志格式，'text'（默认）或'jsonl'结构化事件格式
+'cache_dir': 指标缓存目录，默认None表示不使用缓存
+'cache_max_bytes': 指标缓存总大小上限（字节），默认2GB
+'data_identity': 数据文件标识（用于缓存键），默认由data_path的路径、大小和修改时间生成
+'warmup': 是否读取start_date之前刚好足够的历史预热指标窗口，默认True（指标与全量历史计算后截取的结果一致）；
+    为False时指标只用start_date之后的数据计算，开头的窗口是冷启动的
+'streaming': 是否以流式方式逐根回放数据并增量计算指标，默认False（仅支持'loop'引擎）
+'max_volume_fraction': 挂单簿撮合时每根K线每个方向最多成交的K线成交量比例，默认None表示不限制
+'intrabar_data': 秒级K线（或逐笔成交）的品种目录（DataStore按天分区），默认None；设置时限价触及的K线下钻到秒级数据确定成交
+'intrabar_cache_partitions': 秒级数据LRU缓存的分区（天）数，默认4
+'intrabar_trade_through': 秒级成交是否要求价格严格越过限价，默认False
+'store_nav': 是否保存完整的每分钟净值序列，默认True；为False时只增量计算指标，节省内存
+'chunk_days': 分块回测每块的天数，默认None表示一次性读取全部数据；设置时按块读取并计算指标，内存占用取决于块大小
+'chunk_prefetch': 分块回测时后台线程预先计算的块数，默认1，为0时不预取
+'pyramid_dir': K线金字塔目录，默认None；设置时直接读取预先聚合好的interval周期（缺失时由data_path补建，
+    data_path变化时整个重建），金字塔标识计入指标缓存和结果库的键
+'results_dir': 结果库目录，默认None；设置时以配置和数据标识（数据文件、K线金字塔、秒级数据和策略源文件）的哈希为键，
+    已有结果直接返回（设置了trades_output时由结果库中的交易记录写出），新结果的指标写入SQLite，交易记录和净值序列写入parquet文件
+'bootstrap_resamples': 稳健性分析的重抽样次数，默认None表示不做；设置时对净值收益率做块自助法、对逐笔交易做打乱和有放回抽样，
+    结果中增加各指标的置信区间（'<指标>_ci_lower'、'<指标>_ci_upper'，来自块自助法），需要完整净值序列（自动保存）
+'bootstrap_block_size': 块自助法的块长度（净值点数），默认1440
+'bootstrap_confidence': 置信水平，默认0.95
+'bootstrap_seed': 重抽样的随机种子，默认None
+'profile': 是否记录分阶段耗时和回测计数，默认False
+'profile_output': 性能报告（json）路径，默认与日志文件同名、后缀为.profile.json
+    （日志写入os.devnull时在当前目录下按进程号和时间戳命名）
+'profile_cprofile': 是否同时用cProfile采集函数级耗时，默认False
+'profile_tracemalloc': 是否同时用tracemalloc采集内存分配，默认False
 '''
 
 def back_test(config):
+    began = time.perf_counter()
     # 加载配置参数
     data_path = config.get('data_path', None)
     # 检查数据路径是否存在
@@ -35,57 +84,312 @@ def back_test(config):
     estimate_window = config.get('estimate_window', 60*24)
     # 阈值倍数
     n_sigma = config.get('n_sigma', 3)
+    # 检查回测引擎、流式回放、分块回测和策略的组合
+    validate_config(config)
+    # 流式回放
+    streaming = config.get('streaming', False)
+    # 分块回测
+    chunk_days = config.get('chunk_days', None)
+    # 策略
+    strategy = create_strategy(config)
+    # 是否打印
+    verbose = config.get('verbose', True)
+    # K线金字塔：补建缺失的层，数据文件变化时重建
+    pyramid_dir = config.get('pyramid_dir', None)
+    pyramid = None
+    if pyramid_dir is not None and not streaming:
+        pyramid = KlinePyramid(pyramid_dir)
+        pyramid.ensure(data_path, [interval])
+    # 分阶段计时
+    profiler = Profiler(cprofile=config.get('profile_cprofile', False),
+                        tracemalloc=config.get('profile_tracemalloc', False)) if config.get('profile', False) else NULL_PROFILER
+    # 结果库：相同的配置在相同的数据上已有结果时直接返回（仍然按trades_output输出交易记录、按profile写性能报告）
+    results_dir = config.get('results_dir', None)
+    results_store = None
+    if results_dir is not None:
+        results_store = ResultsStore(results_dir)
+        data_identity = {
+            'data': config.get('data_identity', None) or file_identity(data_path),
+            'pyramid': pyramid.identity(interval) if pyramid is not None else None,
+            'intrabar': file_identity(config['intrabar_data']) if config.get('intrabar_data', None) is not None else None,
+            'strategy': source_identity(strategy),
+        }
+        result_key = ResultsStore.make_key(config, data_identity)
+        with profiler.phase("results_store.get"):
+            cached = results_store.get(result_key)
+        if cached is not None:
+            trades_output = config.get('trades_output', None)
+            if trades_output is not None:
+                with profiler.phase("write_trades"):
+                    trades_records = results_store.load_trades(result_key)
+                    if trades_records is None:
+                        raise ValueError(f"stored run {result_key[:16]} has no trades records")
+                    write_trades(trades_records, trades_output)
+            if verbose:
+                print(f"结果库命中: {result_key[:16]}")
+                print_results(cached)
+            if profiler.enabled:
+                profiler.set_counters(results_store_hit=1)
+                profiler.write(config.get('profile_output', None) or profile_path(resolve_log_file(config)))
+            return cached
+    # 交易记录输出路径（使用结果库时交易记录保存在结果库中）
+    trades_output = config.get('trades_output', 'trades_records.csv' if results_store is None else None)
+    # 指标缓存
+    cache_dir = config.get('cache_dir', None)
+    cache = IndicatorCache(cache_dir, config.get('cache_max_bytes', 2 * 1024 ** 3)) if cache_dir is not None else None
+    # 日志文件
+    log_file = resolve_log_file(config)
+    profiler.start()
+
+    market_data = None
+    exchange = None
+    try:
+        # 初始化市场数据
+        with profiler.phase("load_data"):
+            if streaming:
+                # 流式回放只支持默认策略，指标参数取自策略（strategy_params覆盖顶层的同名参数）
+                params = strategy.params()
+                # 预热：回放start_date之前刚好足够的历史K线
+                warmup_source = None
+                if config.get('warmup', True) and start_date is not None:
+                    warmup_bars = (params['vwap_window'] + params['estimate_window'] - 1) * interval
+                    warmup_source = replay_warmup(data_path, start_date, warmup_bars, interval)
+                market_data = StreamingMarketData(replay_parquet(data_path, start_date, end_date),
+                                                  interval, params['vwap_window'], params['estimate_window'],
+                                                  params['n_sigma'], warmup_source=warmup_source)
+            elif chunk_days is not None:
+                market_data = ChunkedMarketData(data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma,
+                                                chunk_days=chunk_days, prefetch=config.get('chunk_prefetch', 1),
+                                                warmup=config.get('warmup', True), profiler=profiler, pyramid=pyramid,
+                                                strategy=strategy)
+            else:
+                market_data = MarketData(data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma,
+                                         cache=cache, data_identity=config.get('data_identity', None),
+                                         warmup=config.get('warmup', True), profiler=profiler, pyramid=pyramid,
+                                         strategy=strategy)
+
+        # 稳健性分析的重抽样次数
+        bootstrap_resamples = config.get('bootstrap_resamples', None)
+
+        # 回测主循环（稳健性分析需要完整净值序列）
+        simulate_config = {**config, 'log_file': log_file}
+        if bootstrap_resamples:
+            simulate_config['store_nav'] = True
+        exchange = simulate(market_data, simulate_config, profiler)
+
+        # 交易记录表只生成一次，供输出文件、稳健性分析和结果库共用
+        trades_records = None
+        if trades_output is not None or bootstrap_resamples or results_store is not None:
+            trades_records = exchange.save_trades_records()
+
+        #  保存交易记录表格（csv或parquet）
+        if trades_output is not None:
+            with profiler.phase("write_trades"):
+                write_trades(trades_records, trades_output)
+
+        # # 计算回测指标
+        results = exchange.calculate_performance_metrics()
+
+        # 稳健性分析：块自助法的置信区间写入结果
+        report = None
+        if bootstrap_resamples:
+            with profiler.phase("robustness"):
+                report = robustness_report(exchange.nav_records(), trades_records, exchange.initial_balance,
+                                           n_resamples=bootstrap_resamples,
+                                           block_size=config.get('bootstrap_block_size', 60 * 24),
+                                           confidence=config.get('bootstrap_confidence', 0.95),
+                                           seed=config.get('bootstrap_seed', None))
+            for row in report.filter(report["method"] == "block_bootstrap").iter_rows(named=True):
+                results[f"{row['metric']}_ci_lower"] = row["lower"]
+                results[f"{row['metric']}_ci_upper"] = row["upper"]
+
+        # 写入结果库
+        if results_store is not None:
+            with profiler.phase("store_results"):
+                results_store.put(result_key, config, data_identity, results,
+                                  trades=trades_records, nav=exchange.nav_records(),
+                                  elapsed=time.perf_counter() - began)
+
+        if verbose:
+            print_results(results)
+            if report is not None:
+                print(f"稳健性分析（{bootstrap_resamples}次重抽样）:")
+                with pl.Config(tbl_rows=len(report)):
+                    print(report)
+            if cache is not None:
+                print(f"指标缓存: 命中 {cache.hits} 次, 未命中 {cache.misses} 次")
+    finally:
+        # 回测出错时也要停止分块预取线程、关闭日志线程，并停止cProfile和tracemalloc
+        if isinstance(market_data, ChunkedMarketData):
+            market_data.close()
+        if exchange is not None:
+            exchange.close()
+        profiler.stop()
+
+    # 保存性能报告
+    if profiler.enabled:
+        profiler.set_counters(bars=market_data.current_index, **exchange.stats())
+        profiler.write(config.get('profile_output', None) or profile_path(log_file))
+
+    return results
+
+
+def print_results(results):
+    """打印回测指标"""
+    print("回测完成！")
+    print(f"总收益率（净值计算）: {results['total_returns']:.2%}")
+    print(f"总收益率（复利计算）: {results['compounded_total_returns']:.2%}")
+    print(f"简单年化收益率: {results['simple_annualized_returns']:.2%}")
+    print(f"复利年化收益率: {results['compounded_annualized_returns']:.2%}")
+    print(f"夏普比率: {results['sharpe_ratio']:.2f}")
+    print(f"最大回撤: {results['max_drawdown']:.2%}")
+    print(f"总交易对数: {results['num_trades']}")
+    print(f'胜率： {results["win_rate"]:.2%}')
+
+
+def write_trades(trades_records, trades_output):
+    """保存交易记录表：.parquet后缀保存为zstd压缩的parquet，否则为csv"""
+    if trades_output.endswith(".parquet"):
+        trades_records.write_parquet(trades_output, compression=PARQUET_COMPRESSION)
+    else:
+        trades_records.write_csv(trades_output)
+
+
+def resolve_log_file(config):
+    """返回配置中的日志文件路径，未配置时在Logging目录下按时间戳生成"""
+    log_file = config.get('log_file', None)
+    if log_file is None:
+        # 检查是否存在日志目录，如果没有则生成
+        if not os.path.exists('./Logging'):
+            os.mkdir('./Logging')
+        # 生成日志文件路径
+        current_timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_file = "Logging/" + current_timestamp + ".log"
+    return log_file
+
+
+def profile_path(log_file):
+    """
+    性能报告路径：与日志文件同名，后缀为.profile.json；
+    日志写入os.devnull时（如参数扫描的子进程）按进程号和时间戳命名，并发的回测不会互相覆盖
+    """
+    if log_file == os.devnull:
+        return f"profile_{os.getpid()}_{time.time_ns()}.profile.json"
+    return os.path.splitext(log_file)[0] + ".profile.json"
+
+
+def validate_config(config):
+    """检查回测引擎、流式回放、分块回测和策略的组合是否受支持（back_test和simulate共用）"""
+    engine = config.get('engine', 'loop')
+    if engine not in ('loop', 'array'):
+        raise ValueError(f"unknown engine: {engine}")
+    if config.get('streaming', False):
+        if engine != 'loop':
+            raise ValueError("streaming mode requires the 'loop' engine")
+        if config.get('chunk_days', None) is not None:
+            raise ValueError("streaming mode cannot be combined with chunk_days")
+        if config.get('strategy', DEFAULT_STRATEGY) != DEFAULT_STRATEGY:
+            raise ValueError("streaming mode only supports the default strategy")
+
+
+def simulate(market_data, config, profiler=None):
+    """
+    在已加载的市场数据上运行回测，返回Exchange（调用方负责close）。
+    使用config中的initial_balance、fee_rate、engine、verbose和日志相关参数
+    """
+    profiler = profiler or NULL_PROFILER
     # 初始资金
     initial_balance = config.get('initial_balance', 1000000)
     # 手续费率
     fee_rate = config.get('fee_rate', 0)
+    # 回测引擎
+    validate_config(config)
+    engine = config.get('engine', 'loop')
 
     # 日志
-    # 检查是否存在日志目录，如果没有则生成
-    if not os.path.exists('./Logging'):
-        os.mkdir('./Logging')
-    # 生成日志文件路径
-    current_timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = "Logging/" + current_timestamp + ".log"
+    log_file = resolve_log_file(config)
+
+    # K线内成交模拟
+    intrabar = None
+    if config.get('intrabar_data', None) is not None:
+        intrabar = IntrabarFills(config['intrabar_data'], market_data.interval,
+                                 max_partitions=config.get('intrabar_cache_partitions', 4),
+                                 trade_through=config.get('intrabar_trade_through', False))
 
+    # 初始化交易所
+    exchange = Exchange(initial_balance=initial_balance, fee_rate=fee_rate, log_file=log_file,
+                        log_level=parse_level(config.get('log_level', 'DEBUG')),
+                        log_format=config.get('log_format', 'text'), profiler=profiler,
+                        store_nav=config.get('store_nav', True),
+                        max_volume_fraction=config.get('max_volume_fraction', None), intrabar=intrabar)
 
-    # 初始化市场数据和交易所
-    market_data = MarketData(data_path, start_date, end_date, interval, vwap_window, estimate_window, n_sigma)
-    exchange = Exchange(initial_balance=initial_balance, fee_rate=fee_rate, log_file=log_file)
+    # 回测主循环（出错时关闭日志线程后再抛出）
+    try:
+        with profiler.phase("backtest_loop"):
+            if engine == 'array':
+                run_array_backtest(market_data, exchange)
+            else:
+                _run_bar_loop(market_data, exchange, show_progress=config.get('verbose', True))
+    except BaseException:
+        exchange.close()
+        raise
+    return exchange
 
+
+def _run_bar_loop(market_data, exchange, show_progress=True):
+    """逐bar回测循环"""
     # 进度条数
     total_bars = market_data.get_total_bars()
+    # 预分配净值记录空间
+    if total_bars is not None:
+        exchange.reserve_nav(total_bars)
+
+    # 策略状态
+    strategy = market_data.strategy
+    state = strategy.initial_state()
+    # K线内成交模拟
+    intrabar = exchange.intrabar
 
     # 回测主循环
-    with tqdm(total = total_bars, desc = '回测进度', unit = 'bar') as pbar:
+    with tqdm(total = total_bars, desc = '回测进度', unit = 'bar', disable = not show_progress) as pbar:
         while market_data.has_more_data():
             current_bar = market_data.get_current_bar()
             current_timestamp = current_bar['open_time']
-            current_minute = current_timestamp.strftime('%Y-%m-%d %H:%M')
             current_price = current_bar['close']
 
+            # 撮合挂单簿中的挂单
+            if exchange.book:
+                exchange.match_orders(current_bar, timestamp=current_timestamp)
+
             # 检查是否有未完成订单
             if exchange.limit_order:
                 # 判断买卖点
+                side = None
                 if current_bar['low'] <= exchange.limit_order.limit_price and exchange.limit_order.side == 'buy':
+                    side = 'buy'
                     fill_price = min(exchange.limit_order.limit_price, current_bar['open'])
-                    exchange.execute_limit_order(exchange.limit_order, fill_price, timestamp=current_timestamp)
                 elif current_bar['high'] >= exchange.limit_order.limit_price and exchange.limit_order.side == 'sell':
+                    side = 'sell'
                     fill_price = max(exchange.limit_order.limit_price, current_bar['open'])
-                    exchange.execute_limit_order(exchange.limit_order, fill_price, timestamp=current_timestamp)
+                if side is not None:
+                    fill_timestamp = current_timestamp
+                    # 下钻到K线内的秒级数据确认成交和成交价
+                    if intrabar is not None:
+                        fill_price, fill_timestamp = intrabar.fill(side, exchange.limit_order.limit_price, current_timestamp, fill_price)
+                    if fill_price is not None:
+                        exchange.execute_limit_order(exchange.limit_order, fill_price, timestamp=fill_timestamp)
+                        state = strategy.on_fill(state, side)
 
-            # 基于持仓情况，每分钟均下单
-            if exchange.position == 0:
-                exchange.place_order('buy', current_bar["bottom_threshold"], timestamp=current_timestamp)
-            elif exchange.position > 0:
-                exchange.place_order('sell', current_bar["vwap"], timestamp=current_timestamp)
+            # 按策略状态，每分钟均下单（默认策略：空仓挂bottom_threshold买单，持仓挂vwap卖单）
+            side, column = strategy.order(state)
+            exchange.place_order(side, current_bar[column], timestamp=current_timestamp)
 
             # 记录每分钟净值
-            exchange.record_minute_nav(current_minute, current_price)
-            
+            exchange.record_minute_nav(current_timestamp, current_price)
+
             # 推进到下一根K线
             market_data.next_bar()
-            
+
             # 检查是否为最后一根K线，如果是且有持仓则强制平仓
             if not market_data.has_more_data():
                 # 这是最后一根K线，检查持仓状态
@@ -95,22 +399,3 @@ def back_test(config):
                     exchange.force_close_position(force_close_price, timestamp=current_timestamp)
 
             pbar.update(1)
-
-    #  保存交易记录表格为csv文件
-    exchange.save_trades_records().write_csv('trades_records.csv')
-
-    # # 计算回测指标
-    results = exchange.calculate_performance_metrics()
-
-    print("回测完成！")
-    print(f"总收益率（净值计算）: {results['total_returns']:.2%}")
-    print(f"总收益率（复利计算）: {results['compounded_total_returns']:.2%}")
-    print(f"简单年化收益率: {results['simple_annualized_returns']:.2%}")
-    print(f"复利年化收益率: {results['compounded_annualized_returns']:.2%}")
-    print(f"夏普比率: {results['sharpe_ratio']:.2f}")
-    print(f"最大回撤: {results['max_drawdown']:.2%}")
-    print(f"总交易对数: {results['num_trades']}")
-    print(f'胜率： {results["win_rate"]:.2%}')
-
-    # 关闭Exchange，确保日志系统正确关闭
-    exchange.close()
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# 测试直接导入仓库根目录下的脚本和module包
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import generate_klines
+
+# 测试用的小窗口指标参数，几万根K线就能产生足够多的成交
+INDICATOR_CONFIG = {'interval': 1, 'vwap_window': 10, 'estimate_window': 120, 'n_sigma': 1.0}
+SYNTHETIC_BARS = 20000
+
+
+@pytest.fixture(scope="session")
+def klines():
+    """确定性的合成1分钟K线"""
+    return generate_klines(SYNTHETIC_BARS, seed=7)
+
+
+@pytest.fixture(scope="session")
+def klines_path(tmp_path_factory, klines):
+    """合成K线的parquet文件"""
+    path = tmp_path_factory.mktemp("data") / "klines.parquet"
+    klines.write_parquet(path)
+    return str(path)
+
+
+@pytest.fixture
+def base_config(klines_path):
+    """不打印、不写日志和交易记录的回测配置"""
+    return {
+        'data_path': klines_path,
+        **INDICATOR_CONFIG,
+        'fee_rate': 0.0005,
+        'verbose': False,
+        'log_file': os.devnull,
+        'log_level': 'WARNING',
+        'trades_output': None,
+    }
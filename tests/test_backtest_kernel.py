@@ -0,0 +1,40 @@
+from module.market_data import MarketData
+from single_backtest_engine import simulate
+
+
+def run(config, market_data):
+    exchange = simulate(market_data, config)
+    exchange.close()
+    return exchange
+
+
+def load(config, **kwargs):
+    return MarketData(config['data_path'], config.get('start_date'), config.get('end_date'), config['interval'],
+                      config['vwap_window'], config['estimate_window'], config['n_sigma'], **kwargs)
+
+
+def test_array_engine_matches_loop(base_config):
+    market_data = load(base_config)
+    loop = run({**base_config, 'engine': 'loop'}, market_data)
+    array = run({**base_config, 'engine': 'array'}, load(base_config))
+
+    loop_trades = loop.save_trades_records()
+    assert len(loop_trades) > 20
+    assert array.save_trades_records().equals(loop_trades)
+    assert array.nav_records().equals(loop.nav_records())
+    assert array.order_id_counter == loop.order_id_counter
+
+
+def test_array_engine_matches_loop_aggregated(base_config):
+    config = {**base_config, 'interval': 5, 'start_date': "2021-01-03 00:00:00"}
+    loop = run({**config, 'engine': 'loop'}, load(config))
+    array = run({**config, 'engine': 'array'}, load(config))
+    assert array.save_trades_records().equals(loop.save_trades_records())
+    assert array.nav_records().equals(loop.nav_records())
+
+
+def test_array_engine_metrics(base_config):
+    loop = run({**base_config, 'engine': 'loop'}, load(base_config)).calculate_performance_metrics()
+    array = run({**base_config, 'engine': 'array'}, load(base_config)).calculate_performance_metrics()
+    # 增量指标的批量更新与逐点更新运算顺序相同
+    assert array == loop
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from module.buffered_logger import BufferedLogger, read_event_log, INFO, ERROR
+
+
+def test_jsonl_round_trip_with_numpy_arguments(tmp_path):
+    path = tmp_path / "events.jsonl"
+    logger = BufferedLogger(str(path), log_format='jsonl', poll_interval=0.01)
+    timestamp = datetime(2021, 1, 2, 3, 4, 5)
+    logger.info("{} price {} qty {}", timestamp, np.float64(1.5), np.int64(3))
+    logger.info("value {}", np.datetime64("2021-01-02T03:04:05", "ms"))
+    logger.info("object {}", object)
+    logger.close()
+
+    messages = list(read_event_log(path))
+    assert messages[0] == (INFO, "2021-01-02 03:04:05 price 1.5 qty 3")
+    assert messages[1] == (INFO, "value 2021-01-02 03:04:05")
+    assert messages[2] == (INFO, f"object {object}")
+    assert logger.stats()['log_format_errors'] == 0
+
+
+def circular():
+    value = []
+    value.append(value)
+    return value
+
+
+@pytest.mark.parametrize("log_format, bad_args", [('text', ("missing {} {}", 1)), ('jsonl', ("circular {}", circular()))])
+def test_format_error_does_not_stop_writer(tmp_path, log_format, bad_args):
+    """文本格式的模板参数不匹配、事件格式的参数无法序列化"""
+    path = tmp_path / "log.txt"
+    logger = BufferedLogger(str(path), log_format=log_format, poll_interval=0.01)
+    logger.info(*bad_args)
+    for i in range(5000):
+        logger.info("message {}", i)
+    logger.close()
+
+    stats = logger.stats()
+    assert stats['log_format_errors'] == 1
+    assert stats['log_messages_written'] == 5001
+    assert stats['log_queue_depth'] == 0
+    if log_format == 'jsonl':
+        messages = list(read_event_log(path))
+        assert messages[0][0] == ERROR
+        assert messages[-1] == (INFO, "message 4999")
+    else:
+        lines = path.read_text(encoding='utf-8').splitlines()
+        assert lines[0].startswith("log format error")
+        assert lines[-1] == "message 4999"
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+import single_backtest_engine
+from module import market_data
+from module.chunked_market_data import ChunkedMarketData
+from single_backtest_engine import back_test
+
+from test_backtest_kernel import run, load
+
+START = "2021-01-03 05:17:00"
+END = "2021-01-13 20:00:00"
+
+
+def load_chunked(config, **kwargs):
+    return ChunkedMarketData(config['data_path'], config.get('start_date'), config.get('end_date'), config['interval'],
+                             config['vwap_window'], config['estimate_window'], config['n_sigma'], **kwargs)
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    """缩小指标块，让合成数据跨越多个指标块和读取块"""
+    monkeypatch.setattr(market_data, "INDICATOR_BLOCK_BARS", 1000)
+
+
+@pytest.mark.parametrize("engine", ['loop', 'array'])
+@pytest.mark.parametrize("interval, warmup", [(1, True), (1, False), (5, True)])
+@pytest.mark.parametrize("chunk_days, prefetch", [(0.3, 0), (2, 1)])
+def test_chunked_matches_in_memory(base_config, small_blocks, engine, interval, warmup, chunk_days, prefetch):
+    """分块读取的指标、成交和净值与一次性读取逐位相同"""
+    config = {**base_config, 'engine': engine, 'interval': interval, 'start_date': START, 'end_date': END}
+    expected = run(config, load(config, warmup=warmup))
+    chunked = run(config, load_chunked(config, warmup=warmup, chunk_days=chunk_days, prefetch=prefetch))
+
+    trades = expected.save_trades_records()
+    assert len(trades) > 20
+    assert chunked.save_trades_records().equals(trades)
+    assert chunked.nav_records().equals(expected.nav_records())
+    assert chunked.calculate_performance_metrics() == expected.calculate_performance_metrics()
+
+
+def test_chunked_indicators_match_in_memory(base_config, small_blocks):
+    config = {**base_config, 'start_date': START}
+    chunked = load_chunked(config, chunk_days=1, prefetch=1)
+    frames = [chunk.data for chunk in chunked.iter_chunks()]
+    assert len(frames) > 5
+    expected = load(config).data
+    assert market_data.pl.concat(frames).equals(expected)
+
+
+def test_chunks_are_plain_market_data(base_config):
+    chunked = load_chunked(base_config, chunk_days=5, prefetch=0)
+    chunk = next(chunked.iter_chunks())
+    assert type(chunk) is market_data.MarketData
+    assert chunk.strategy is chunked.strategy
+    assert chunk.slice(chunk.get_timestamp(10)).get_timestamp() == chunk.get_timestamp(10)
+    # 分块数据只能顺序读取
+    with pytest.raises(TypeError):
+        chunked.slice()
+    with pytest.raises(ValueError):
+        chunked.get_timestamp(0)
+    chunked.close()
+
+
+def test_close_stops_prefetch_thread(base_config):
+    threads = threading.active_count()
+    chunked = load_chunked(base_config, chunk_days=0.2, prefetch=2)
+    for _ in range(10):
+        assert chunked.has_more_data()
+        chunked.next_bar()
+    assert threading.active_count() == threads + 1
+    chunked.close()
+    assert threading.active_count() == threads
+    assert not chunked.has_more_data()
+
+
+def test_prefetch_thread_stopped_when_backtest_fails(base_config, monkeypatch):
+    def failing_loop(market_data, exchange, show_progress=True):
+        for _ in range(100):
+            market_data.has_more_data()
+            market_data.next_bar()
+        raise RuntimeError("strategy error")
+
+    monkeypatch.setattr(single_backtest_engine, "_run_bar_loop", failing_loop)
+    threads = threading.active_count()
+    with pytest.raises(RuntimeError):
+        back_test({**base_config, 'chunk_days': 0.2, 'chunk_prefetch': 2})
+    assert threading.active_count() == threads
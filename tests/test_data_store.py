@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+from benchmarks.synthetic import generate_klines
+from module.data_store import DataStore
+from module.market_data import partition_paths
+
+from conftest import INDICATOR_CONFIG, ROOT
+from test_backtest_kernel import run, load
+
+START = "2021-01-27 03:10:00"
+END = "2021-02-06 20:00:00"
+
+
+@pytest.fixture(scope="module")
+def month_klines():
+    """跨月的合成K线（1月25日到2月8日）"""
+    return generate_klines(20000, seed=3, start=datetime(2021, 1, 25))
+
+
+def write(frame, path):
+    frame.write_parquet(path)
+    return str(path)
+
+
+def test_ingest_merges_overlapping_files(month_klines, tmp_path):
+    """重叠的文件合并后去重，同一open_time以后导入的数据为准"""
+    first = write(month_klines.head(12000), tmp_path / "first.parquet")
+    # 第二个文件与第一个重叠4000根，重叠部分的收盘价不同
+    second_frame = month_klines.slice(8000).with_columns(close=pl.col("close") * 2)
+    second = write(second_frame, tmp_path / "second.parquet")
+
+    store = DataStore(str(tmp_path / "store"))
+    store.ingest(first)
+    written = store.ingest(second)
+    assert store.symbols() == ["SYNUSDT"]
+    assert sorted(written) == ["2021-01", "2021-02"]
+
+    merged = store.scan("SYNUSDT").collect()
+    expected = pl.concat([month_klines.head(8000), second_frame])
+    assert merged.equals(expected.select(merged.columns))
+    assert merged["open_time"].is_sorted() and merged["open_time"].n_unique() == len(merged)
+    # 重复导入不改变数据
+    store.ingest(second)
+    assert store.scan("SYNUSDT").collect().equals(merged)
+
+
+@pytest.mark.parametrize("granularity", ["month", "day"])
+def test_partition_layout(month_klines, tmp_path, granularity):
+    store = DataStore(str(tmp_path / "store"), granularity=granularity)
+    written = store.ingest(write(month_klines, tmp_path / "klines.parquet"), symbol="SOL")
+    truncate = "1mo" if granularity == "month" else "1d"
+    counts = month_klines.group_by(pl.col("open_time").dt.truncate(truncate)).len().sort("open_time")
+    names = [value.strftime("%Y-%m" if granularity == "month" else "%Y-%m-%d") for value in counts["open_time"]]
+    assert written == dict(zip(names, counts["len"].to_list()))
+    directory = store.symbol_path("SOL")
+    assert sorted(os.listdir(directory)) == [f"{name}.arrow" for name in names]
+
+    catalog = store.catalog().row(0, named=True)
+    assert catalog["partitions"] == len(names)
+    assert catalog["rows"] == len(month_klines)
+    assert catalog["first"] == month_klines["open_time"][0]
+    assert catalog["last"] == month_klines["open_time"][-1]
+
+
+@pytest.mark.parametrize("granularity", ["month", "day"])
+def test_partition_paths_pruned_by_date_range(month_klines, tmp_path, granularity):
+    store = DataStore(str(tmp_path / "store"), granularity=granularity)
+    store.ingest(write(month_klines, tmp_path / "klines.parquet"))
+    directory = store.symbol_path("SYNUSDT")
+    start, end = datetime(2021, 1, 31, 12), datetime(2021, 2, 2, 6)
+    names = [os.path.basename(path) for path in partition_paths(directory, start, end)]
+    if granularity == "month":
+        assert names == ["2021-01.arrow", "2021-02.arrow"]
+        assert [os.path.basename(path) for path in partition_paths(directory, datetime(2021, 2, 3))] == ["2021-02.arrow"]
+    else:
+        assert names == ["2021-01-31.arrow", "2021-02-01.arrow", "2021-02-02.arrow"]
+        # 区间终点恰好是分区起点时包含该分区（终点是闭区间），区间起点恰好是分区终点时不包含
+        assert len(partition_paths(directory, datetime(2021, 2, 1), datetime(2021, 2, 2))) == 2
+    assert len(partition_paths(directory)) == len(os.listdir(directory))
+
+    scanned = store.scan("SYNUSDT", start, end).collect()
+    assert scanned.equals(month_klines.filter(pl.col("open_time").is_between(start, end)).select(scanned.columns))
+
+
+@pytest.mark.parametrize("granularity", ["month", "day"])
+def test_backtest_on_store_matches_source(month_klines, tmp_path, granularity):
+    """以品种目录为data_path的回测与直接读取源parquet文件逐位相同"""
+    source = write(month_klines, tmp_path / "klines.parquet")
+    store = DataStore(str(tmp_path / "store"), granularity=granularity)
+    store.ingest(source)
+    config = {**INDICATOR_CONFIG, 'fee_rate': 0.0005, 'verbose': False, 'log_file': os.devnull,
+              'log_level': 'WARNING', 'start_date': START, 'end_date': END}
+    expected = run(config, load({**config, 'data_path': source}))
+    stored = run(config, load({**config, 'data_path': store.symbol_path("SYNUSDT")}))
+    trades = expected.save_trades_records()
+    assert len(trades) > 20
+    assert stored.save_trades_records().equals(trades)
+    assert stored.nav_records().equals(expected.nav_records())
+
+
+def test_ingest_script(month_klines, tmp_path):
+    first = write(month_klines.head(12000), tmp_path / "first.parquet")
+    second = write(month_klines.slice(8000), tmp_path / "second.parquet")
+    output = subprocess.run([sys.executable, os.path.join(ROOT, "ingest_data.py"), str(tmp_path / "store"), "--day", first, second],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert "SYNUSDT" in output
+    store = DataStore(str(tmp_path / "store"), granularity="day")
+    assert store.scan("SYNUSDT").collect().equals(month_klines)
+    assert len(os.listdir(store.symbol_path("SYNUSDT"))) == month_klines["open_time"].dt.date().n_unique()
@@ -0,0 +1,32 @@
+from module.indicator_cache import IndicatorCache
+from module.market_data import MarketData
+
+
+def load(config, cache):
+    return MarketData(config['data_path'], None, None, config['interval'], config['vwap_window'],
+                      config['estimate_window'], config['n_sigma'], cache=cache)
+
+
+def test_cache_hit_matches_miss(tmp_path, base_config):
+    cache = IndicatorCache(str(tmp_path / "cache"))
+    miss = load(base_config, cache).data
+    hit = load(base_config, cache).data
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert hit.equals(miss)
+    assert miss.equals(load(base_config, None).data)
+
+
+def test_cache_key_depends_on_parameters(tmp_path, base_config):
+    cache = IndicatorCache(str(tmp_path / "cache"))
+    load(base_config, cache)
+    other = load({**base_config, 'n_sigma': 2.0}, cache)
+    assert cache.hits == 0
+    assert other.data.equals(load({**base_config, 'n_sigma': 2.0}, None).data)
+
+
+def test_cache_eviction(tmp_path, base_config):
+    cache = IndicatorCache(str(tmp_path / "cache"), max_bytes=1)
+    load(base_config, cache)
+    # 超过上限时写入后立即被淘汰，下一次仍然未命中
+    load(base_config, cache)
+    assert (cache.misses, cache.hits) == (2, 0)
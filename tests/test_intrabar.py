@@ -0,0 +1,147 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+
+from module.data_store import DataStore
+from module.intrabar import IntrabarFills
+
+from test_backtest_kernel import run, load
+
+DAY = datetime(2021, 1, 1)
+SUB_BARS = 4    # 合成秒级数据每分钟的子K线数
+
+
+def seconds(rows):
+    """由 (时间, 开, 高, 低) 列表生成秒级K线"""
+    return pl.DataFrame({
+        "open_time": [row[0] for row in rows],
+        "open": [row[1] for row in rows],
+        "high": [row[2] for row in rows],
+        "low": [row[3] for row in rows],
+        "close": [row[1] for row in rows],
+        "volume": [1.0] * len(rows),
+        "quote_volume": [100.0] * len(rows),
+    }).with_columns(pl.col("open_time").cast(pl.Datetime(time_unit="ms")))
+
+
+def ingest(frame, tmp_path, name="seconds"):
+    """写入按天分区的秒级数据仓库，返回品种目录"""
+    path = tmp_path / f"{name}.parquet"
+    frame.write_parquet(path)
+    store = DataStore(str(tmp_path / "store"), granularity="day")
+    store.ingest(str(path), symbol=name)
+    return store.symbol_path(name)
+
+
+@pytest.fixture
+def minute_path(tmp_path):
+    """2021-01-01 00:00这一分钟的4根秒级K线"""
+    return ingest(seconds([
+        (DAY, 100.1, 100.2, 100.0),
+        (DAY + timedelta(seconds=1), 99.9, 100.0, 99.8),
+        (DAY + timedelta(seconds=2), 99.6, 99.7, 99.5),
+        (DAY + timedelta(seconds=3), 99.3, 100.6, 99.2),
+    ]), tmp_path)
+
+
+def test_fill_inside_bar(minute_path):
+    intrabar = IntrabarFills(minute_path)
+    # 买单在第一根low <= 限价的秒级K线成交
+    assert intrabar.fill("buy", 99.5, DAY, 99.5) == (99.5, DAY + timedelta(seconds=2))
+    # 开盘价已经低于限价时按开盘价成交
+    assert intrabar.fill("buy", 99.4, DAY, 99.4) == (99.3, DAY + timedelta(seconds=3))
+    assert intrabar.fill("sell", 100.5, DAY, 100.5) == (100.5, DAY + timedelta(seconds=3))
+    assert intrabar.fill("sell", 100.0, DAY, 100.0) == (100.1, DAY)
+    assert intrabar.stats()['intrabar_fills'] == 4
+
+
+def test_reject_and_trade_through(minute_path):
+    intrabar = IntrabarFills(minute_path)
+    # 分钟级触及但秒级价格路径没有达到限价
+    assert intrabar.fill("buy", 99.1, DAY, 99.1) == (None, None)
+    assert intrabar.fill("sell", 100.7, DAY, 100.7) == (None, None)
+    assert intrabar.rejects == 2
+    # 只碰到限价：默认成交，trade_through时要求严格越过
+    assert intrabar.fill("buy", 99.2, DAY, 99.2) == (99.2, DAY + timedelta(seconds=3))
+    through = IntrabarFills(minute_path, trade_through=True)
+    assert through.fill("buy", 99.2, DAY, 99.2) == (None, None)
+    assert through.fill("buy", 99.25, DAY, 99.25) == (99.25, DAY + timedelta(seconds=3))
+    assert through.fill("sell", 100.6, DAY, 100.6) == (None, None)
+
+
+def test_fallback_without_partition(minute_path):
+    intrabar = IntrabarFills(minute_path)
+    later = DAY + timedelta(days=3)
+    # 缺少当天的秒级数据时沿用分钟级成交
+    assert intrabar.fill("buy", 99.0, later, 98.7) == (98.7, later)
+    # 有分区但这根K线的时间范围内没有秒级数据时同样沿用
+    assert intrabar.fill("buy", 99.0, DAY + timedelta(minutes=5), 98.7) == (98.7, DAY + timedelta(minutes=5))
+    assert intrabar.fallbacks == 2 and intrabar.fills == 0
+
+
+def test_aggregated_bar_covers_interval(minute_path):
+    # 5分钟K线从00:00开始，覆盖00:00的秒级数据；从00:05开始则没有秒级数据
+    intrabar = IntrabarFills(minute_path, interval=5)
+    assert intrabar.fill("buy", 99.5, DAY, 99.5) == (99.5, DAY + timedelta(seconds=2))
+    assert intrabar.fill("buy", 99.5, DAY + timedelta(minutes=5), 99.0) == (99.0, DAY + timedelta(minutes=5))
+
+
+def test_lru_eviction(tmp_path):
+    days = [DAY + timedelta(days=k) for k in range(3)]
+    path = ingest(seconds([(day, 100.0, 100.0, 99.0) for day in days]), tmp_path)
+    intrabar = IntrabarFills(path, max_partitions=2)
+    for day in days + [days[2], days[0]]:
+        assert intrabar.fill("buy", 99.5, day, 99.5) == (99.5, day)
+    # 第三天读入时淘汰最久未用的第一天，再次读取第一天时重新读入
+    assert intrabar.loads == 4
+    assert intrabar.cache_hits == 1
+    assert [os.path.basename(key) for key in intrabar._cache] == ["2021-01-03.arrow", "2021-01-01.arrow"]
+
+
+@pytest.fixture
+def intrabar_path(klines, tmp_path):
+    """
+    由合成分钟K线生成的秒级数据：每分钟SUB_BARS根子K线，价格在分钟高低价之间随机，
+    通常达不到分钟的最高和最低价（部分触及限价的K线不成交）；缺少一整天的数据（沿用分钟级成交）
+    """
+    rng = np.random.default_rng(5)
+    minutes = klines.filter(pl.col("quote_volume") > 0)
+    count = len(minutes) * SUB_BARS
+    low = np.repeat(minutes["low"].to_numpy(), SUB_BARS)
+    high = np.repeat(minutes["high"].to_numpy(), SUB_BARS)
+    a, b = rng.random(count), rng.random(count)
+    sub_low = low + (high - low) * np.minimum(a, b)
+    sub_high = low + (high - low) * np.maximum(a, b)
+    times = (np.repeat(minutes["open_time"].dt.epoch(time_unit="ms").to_numpy(), SUB_BARS)
+             + np.tile(np.arange(SUB_BARS) * 15_000, len(minutes)))
+    frame = pl.DataFrame({
+        "open_time": pl.Series(times).cast(pl.Datetime(time_unit="ms")),
+        "open": sub_low + (sub_high - sub_low) * rng.random(count),
+        "high": sub_high,
+        "low": sub_low,
+        "close": sub_low,
+        "volume": np.ones(count),
+        "quote_volume": np.ones(count),
+    }).filter(pl.col("open_time").dt.date() != datetime(2021, 1, 6).date())
+    return ingest(frame, tmp_path)
+
+
+def test_engines_agree_with_intrabar_data(base_config, intrabar_path):
+    """设置intrabar_data时逐bar循环与数组内核的成交完全相同"""
+    config = {**base_config, 'intrabar_data': intrabar_path}
+    loop = run({**config, 'engine': 'loop'}, load(config))
+    array = run({**config, 'engine': 'array'}, load(config))
+    loop_trades = loop.save_trades_records()
+    assert len(loop_trades) > 20
+    assert array.save_trades_records().equals(loop_trades)
+    assert array.nav_records().equals(loop.nav_records())
+    assert array.intrabar.stats() == loop.intrabar.stats()
+    stats = loop.intrabar.stats()
+    assert stats['intrabar_fills'] > 0 and stats['intrabar_rejects'] > 0 and stats['intrabar_fallbacks'] > 0
+
+    # 秒级数据改变了成交
+    minute_level = run({**base_config, 'engine': 'loop'}, load(base_config)).save_trades_records()
+    assert not minute_level.equals(loop_trades)
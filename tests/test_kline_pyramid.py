@@ -0,0 +1,71 @@
+import polars as pl
+import pytest
+
+from module.kline_pyramid import KlinePyramid
+from module.market_data import MarketData
+from module.indicator_cache import IndicatorCache
+
+from conftest import INDICATOR_CONFIG
+
+START = "2021-01-03 00:07:00"
+END = "2021-01-12 13:31:00"
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume", "quote_volume"]
+
+
+def load(path, interval, **kwargs):
+    return MarketData(path, START, END, interval, INDICATOR_CONFIG['vwap_window'], INDICATOR_CONFIG['estimate_window'],
+                      INDICATOR_CONFIG['n_sigma'], **kwargs)
+
+
+@pytest.mark.parametrize("interval, levels", [(1, []), (5, [5]), (15, [5, 15]), (30, [])])
+def test_pyramid_matches_raw_aggregation(klines_path, tmp_path, interval, levels):
+    """金字塔读取（含区间两端不完整的桶）与直接由1分钟K线聚合的结果一一对应"""
+    pyramid = KlinePyramid(str(tmp_path))
+    pyramid.build(klines_path, levels)
+    raw = load(klines_path, interval).data
+    pyramid_data = load(klines_path, interval, pyramid=pyramid).data
+    assert len(raw) > 100
+    assert pyramid_data["open_time"].equals(raw["open_time"])
+    assert pyramid_data["jj_code"].equals(raw["jj_code"])
+    for name in PRICE_COLUMNS:
+        assert pyramid_data[name].to_list() == pytest.approx(raw[name].to_list(), rel=1e-12)
+
+
+def test_ensure_rebuilds_when_source_changes(klines, tmp_path):
+    path = str(tmp_path / "klines.parquet")
+    klines.head(5000).write_parquet(path)
+    pyramid = KlinePyramid(str(tmp_path / "pyramid"))
+    pyramid.ensure(path, [5, 15])
+    before = pyramid.identity(5)
+
+    klines.write_parquet(path)
+    pyramid.ensure(path, [5])
+    assert pyramid.identity(5) != before
+    assert pyramid.levels() == [1, 5]
+    assert len(pyramid.scan(1).collect()) == len(klines.filter(pl.col("quote_volume") > 0))
+    # 来源一致时不再重建
+    after = pyramid.identity(5)
+    pyramid.ensure(path, [5])
+    assert pyramid.identity(5) == after
+
+
+def test_ensure_rejects_pyramid_extended_in_memory(klines, klines_path, tmp_path):
+    pyramid = KlinePyramid(str(tmp_path))
+    path = str(tmp_path / "head.parquet")
+    klines.head(5000).write_parquet(path)
+    pyramid.build(path)
+    assert pyramid.append(klines) > 0
+    assert pyramid.source_identity() is None
+    with pytest.raises(ValueError):
+        pyramid.ensure(klines_path)
+
+
+def test_cache_key_includes_pyramid(klines_path, tmp_path):
+    pyramid = KlinePyramid(str(tmp_path / "pyramid"))
+    pyramid.build(klines_path, [5])
+    cache = IndicatorCache(str(tmp_path / "cache"))
+    load(klines_path, 5, cache=cache, data_identity="synthetic")
+    load(klines_path, 5, cache=cache, data_identity="synthetic", pyramid=pyramid)
+    assert (cache.misses, cache.hits) == (2, 0)
+    load(klines_path, 5, cache=cache, data_identity="synthetic", pyramid=pyramid)
+    assert cache.hits == 1
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+from module import market_data
+from module.market_data import MarketData, DATE_FORMAT, compute_indicators
+from module.strategy import VwapReversionStrategy
+
+START = "2021-01-05 00:00:00"
+END = "2021-01-10 12:00:00"
+
+
+def baseline_klines(path, start_date, end_date, interval):
+    """原实现的读取方式：整个文件读入内存后排序、过滤、聚合"""
+    data = pl.read_parquet(path).sort("open_time").with_columns(
+        open_time=pl.col("open_time").cast(pl.Datetime(time_unit="ms"))
+    )
+    if start_date is not None:
+        data = data.filter(pl.col("open_time") >= datetime.strptime(start_date, DATE_FORMAT))
+    if end_date is not None:
+        data = data.filter(pl.col("open_time") <= datetime.strptime(end_date, DATE_FORMAT))
+    data = data.filter(pl.col("quote_volume") > 0)
+    if interval > 1:
+        data = data.group_by_dynamic("open_time", every=f"{interval}m", closed="left", label="left").agg(
+            pl.col("open").first(), pl.col("high").max(), pl.col("low").min(), pl.col("close").last(),
+            pl.col("volume").sum(), pl.col("quote_volume").sum(), pl.col("jj_code").first(),
+        ).sort("open_time").filter(pl.col("volume") > 0)
+    return data
+
+
+def baseline_indicators(data, vwap_window, estimate_window, n_sigma):
+    """原实现的指标表达式，在整段数据上一次计算"""
+    return data.with_columns(
+        vwap=pl.col("quote_volume").rolling_sum(vwap_window) / (pl.col("volume").rolling_sum(vwap_window) + 1)
+    ).drop_nulls().with_columns(
+        bias=pl.col("close") / pl.col("vwap") - 1,
+    ).with_columns(
+        sigma=pl.col("bias").rolling_std(estimate_window),
+    ).with_columns(
+        bottom_threshold=pl.col("vwap") * (1 - n_sigma * pl.col("sigma")),
+        top_threshold=pl.col("vwap") * (1 + n_sigma * pl.col("sigma")),
+    ).drop_nulls()
+
+
+def load(config, start_date, end_date, interval=None, **kwargs):
+    return MarketData(config['data_path'], start_date, end_date, interval or config['interval'],
+                      config['vwap_window'], config['estimate_window'], config['n_sigma'], **kwargs).data
+
+
+@pytest.mark.parametrize("interval", [1, 5])
+@pytest.mark.parametrize("bounds", [(None, None), (START, None), (START, END)])
+def test_lazy_scan_matches_full_read(base_config, interval, bounds):
+    klines = baseline_klines(base_config['data_path'], *bounds, interval)
+    strategy = VwapReversionStrategy(base_config['vwap_window'], base_config['estimate_window'], base_config['n_sigma'])
+    expected = compute_indicators(strategy, klines, interval)
+    actual = load(base_config, *bounds, interval=interval, warmup=False)
+    assert len(actual) > 0
+    assert actual.equals(expected)
+
+
+@pytest.mark.parametrize("interval", [1, 5])
+def test_single_block_matches_original_expressions(base_config, interval):
+    # 整段数据在一个指标块内时，分块计算与原来在整段数据上一次计算完全相同
+    klines = baseline_klines(base_config['data_path'], None, "2021-01-08 00:00:00", interval)
+    strategy = VwapReversionStrategy(base_config['vwap_window'], base_config['estimate_window'], base_config['n_sigma'])
+    expected = baseline_indicators(klines, base_config['vwap_window'], base_config['estimate_window'], base_config['n_sigma'])
+    assert compute_indicators(strategy, klines, interval).select(expected.columns).equals(expected)
+
+
+def test_blocks_match_single_pass_within_rounding(base_config, monkeypatch):
+    monkeypatch.setattr(market_data, "INDICATOR_BLOCK_BARS", 1000)
+    klines = baseline_klines(base_config['data_path'], None, None, 1)
+    strategy = VwapReversionStrategy(base_config['vwap_window'], base_config['estimate_window'], base_config['n_sigma'])
+    blocked = compute_indicators(strategy, klines, 1)
+    single = baseline_indicators(klines, base_config['vwap_window'], base_config['estimate_window'], base_config['n_sigma'])
+    assert blocked["open_time"].equals(single["open_time"])
+    for name in ("vwap", "sigma", "bottom_threshold"):
+        assert blocked[name].to_numpy() == pytest.approx(single[name].to_numpy(), rel=1e-9)
+
+
+@pytest.mark.parametrize("block_bars", [None, 500])
+@pytest.mark.parametrize("interval", [1, 5])
+def test_warmup_matches_full_history(base_config, monkeypatch, interval, block_bars):
+    if block_bars is not None:
+        monkeypatch.setattr(market_data, "INDICATOR_BLOCK_BARS", block_bars)
+    # 预热只读取start_date之前刚好足够的历史，指标与全量历史计算后截取的结果一致
+    full = load(base_config, None, END, interval=interval)
+    expected = full.filter(pl.col("open_time") >= datetime.strptime(START, DATE_FORMAT))
+    actual = load(base_config, START, END, interval=interval)
+    assert len(actual) > 0
+    assert actual.equals(expected)
@@ -0,0 +1,124 @@
+import math
+import os
+import random
+from datetime import datetime
+
+import pytest
+
+from module.exchange import Exchange
+
+FEE_RATE = 0.001
+INITIAL_BALANCE = 10000
+
+
+def brute_force_match(account, orders, bar, max_volume_fraction):
+    """
+    逐笔线性扫描的参考撮合：每次在全部挂单中找价格优先、时间优先的一张成交，
+    规则与Exchange.match_orders相同。返回新的(现金, 持仓, 持仓成本)和成交列表
+    """
+    cash, position, position_cost = account
+    fills = []
+    capacity = math.inf if max_volume_fraction is None else max_volume_fraction * bar['volume']
+    sides = ('buy', 'sell') if bar['close'] >= bar['open'] else ('sell', 'buy')
+    for side in sides:
+        available = capacity
+        while available > 0:
+            if side == 'buy':
+                candidates = [order for order in orders.values() if order['side'] == 'buy' and order['price'] >= bar['low']]
+                if not candidates:
+                    break
+                order = max(candidates, key=lambda order: (order['price'], -order['seq']))
+                price = min(order['price'], bar['open'])
+                quantity = min(order['remaining'], available, cash / (price * (1 + FEE_RATE)))
+            else:
+                candidates = [order for order in orders.values() if order['side'] == 'sell' and order['price'] <= bar['high']]
+                if not candidates:
+                    break
+                order = min(candidates, key=lambda order: (order['price'], order['seq']))
+                price = max(order['price'], bar['open'])
+                quantity = min(order['remaining'], available, position)
+            if quantity <= 0:
+                break
+            fee = quantity * price * FEE_RATE
+            if side == 'buy':
+                cash -= quantity * price + fee
+                position_cost = (position_cost * position + price * quantity) / (position + quantity)
+                position += quantity
+            else:
+                cash += quantity * price - fee
+                position -= quantity
+                if position <= 0:
+                    position, position_cost = 0, 0
+            order['remaining'] -= quantity
+            available -= quantity
+            fills.append((order['id'], price, quantity))
+            if order['remaining'] > 0:
+                break
+            del orders[order['id']]
+    return (cash, position, position_cost), fills
+
+
+@pytest.mark.parametrize("max_volume_fraction", [None, 0.05])
+def test_order_book_matches_brute_force(max_volume_fraction):
+    """随机挂单、撤单、改单下，挂单簿的成交、账户和剩余挂单与线性扫描逐位一致"""
+    rng = random.Random(3)
+    exchange = Exchange(INITIAL_BALANCE, FEE_RATE, os.devnull, store_nav=False, max_volume_fraction=max_volume_fraction)
+    account = (INITIAL_BALANCE, 0, 0)
+    orders, seq, price, total_fills = {}, 0, 100.0, 0
+    timestamp = datetime(2021, 1, 1)
+    try:
+        for _ in range(3000):
+            for _ in range(rng.randint(0, 5)):
+                side = rng.choice(['buy', 'sell'])
+                limit_price = round(price * (1 + rng.uniform(-0.02, 0.02)), 2)
+                quantity = rng.uniform(0.1, 20)
+                order_id = exchange.submit_order(side, limit_price, quantity)
+                seq += 1
+                orders[order_id] = {'id': order_id, 'side': side, 'price': limit_price, 'remaining': quantity, 'seq': seq}
+            if orders and rng.random() < 0.3:
+                order_id = rng.choice(list(orders))
+                assert exchange.cancel_order(order_id)
+                del orders[order_id]
+            if orders and rng.random() < 0.3:
+                order_id = rng.choice(list(orders))
+                limit_price = round(price * (1 + rng.uniform(-0.02, 0.02)), 2)
+                assert exchange.replace_order(order_id, limit_price=limit_price)
+                seq += 1
+                orders[order_id].update(price=limit_price, seq=seq)
+
+            close = price * (1 + rng.gauss(0, 0.01))
+            bar = {
+                'open': price, 'close': close, 'volume': rng.uniform(10, 500),
+                'high': max(price, close) * (1 + abs(rng.gauss(0, 0.005))),
+                'low': min(price, close) * (1 - abs(rng.gauss(0, 0.005))),
+            }
+            price = close
+
+            first = len(exchange.trades)
+            exchange.match_orders(bar, timestamp)
+            account, fills = brute_force_match(account, orders, bar, max_volume_fraction)
+            columns = exchange.trades.columns
+            assert [(int(columns['order_id'][k]), columns['price'][k], columns['quantity'][k])
+                    for k in range(first, len(exchange.trades))] == fills
+            assert (exchange.cash, exchange.position, exchange.position_cost) == account
+            assert set(exchange.book.orders) == set(orders)
+            total_fills += len(fills)
+    finally:
+        exchange.close()
+    assert total_fills > 1000
+
+
+@pytest.mark.parametrize("quantity", [None, 0, -1.0, float("nan")])
+def test_invalid_quantity_rejected(quantity):
+    exchange = Exchange(INITIAL_BALANCE, FEE_RATE, os.devnull, store_nav=False)
+    try:
+        with pytest.raises(ValueError):
+            exchange.submit_order('buy', 100.0, quantity)
+        order_id = exchange.submit_order('buy', 100.0, 1.0)
+        if quantity is not None:
+            with pytest.raises(ValueError):
+                exchange.replace_order(order_id, quantity=quantity)
+        assert exchange.replace_order(order_id, limit_price=99.0)
+        assert set(exchange.book.orders) == {order_id}
+    finally:
+        exchange.close()
@@ -0,0 +1,40 @@
+from module.results_store import ResultsStore
+from parameter_sweep import SWEEP_DEFAULTS, expand_grid, run_sweep
+from single_backtest_engine import back_test
+
+GRID = {'vwap_window': [10, 20], 'n_sigma': [1.0, 2.0]}
+
+
+def test_expand_grid():
+    combos = expand_grid(GRID)
+    assert combos == [{'vwap_window': 10, 'n_sigma': 1.0}, {'vwap_window': 10, 'n_sigma': 2.0},
+                      {'vwap_window': 20, 'n_sigma': 1.0}, {'vwap_window': 20, 'n_sigma': 2.0}]
+    sampled = expand_grid(GRID, n_samples=3, seed=1)
+    assert len(sampled) == 3 and sampled == expand_grid(GRID, n_samples=3, seed=1)
+    assert all(combo in combos for combo in sampled)
+
+
+def test_sweep_rows_match_direct_back_test(base_config):
+    """每一行的指标与直接用该组合配置运行back_test相同"""
+    results = run_sweep(base_config, GRID, processes=2, show_progress=False)
+    assert len(results) == 4
+    assert results['run'].to_list() == [0, 1, 2, 3]
+    assert results.columns[:3] == ['run', 'vwap_window', 'n_sigma']
+    assert results['num_trades'].min() > 0 and results['num_trades'].n_unique() > 1
+    for row, params in zip(results.iter_rows(named=True), expand_grid(GRID)):
+        assert {key: row[key] for key in params} == params
+        expected = back_test({**base_config, **SWEEP_DEFAULTS, **params})
+        assert {key: row[key] for key in expected} == expected
+
+
+def test_sweep_reuses_results_store(base_config, tmp_path):
+    config = {**base_config, 'results_dir': str(tmp_path / "results")}
+    first = run_sweep(config, GRID, processes=2, show_progress=False)
+    store = ResultsStore(config['results_dir'])
+    runs = store.runs()
+    assert len(runs) == 4
+
+    # 再次扫描和直接回测都命中结果库，不新增记录
+    assert run_sweep(config, GRID, processes=2, show_progress=False).equals(first)
+    back_test({**config, **SWEEP_DEFAULTS, **expand_grid(GRID)[0]})
+    assert store.runs()["key"].sort().equals(runs["key"].sort())
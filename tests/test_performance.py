@@ -0,0 +1,74 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from module.performance import performance_metrics, MINUTES_PER_YEAR
+
+from test_backtest_kernel import run, load
+
+
+def baseline_metrics(nav_frame, trades):
+    """原实现的指标计算：polars的pct_change和cum_prod"""
+    frame = nav_frame.with_columns(
+        returns=pl.col("nav").pct_change().fill_null(0)
+    ).with_columns(
+        cumulative_net_returns=(1 + pl.col("returns")).cum_prod(),
+    )
+    returns = frame["returns"].to_numpy()
+    total_returns = frame["nav"][-1] / frame["nav"][0] - 1
+    compounded_annualized_returns = (1 + total_returns) ** (MINUTES_PER_YEAR / len(frame)) - 1
+    num_trades = len(trades) / 2
+    wins = len(trades.filter((pl.col("side") == "sell") & (pl.col("realized_pnl") > 0)))
+    cumulative_returns = frame["cumulative_net_returns"].to_numpy()
+    peak = np.maximum.accumulate(cumulative_returns)
+    return {
+        "total_returns": total_returns,
+        "compounded_total_returns": frame["cumulative_net_returns"].last() - 1,
+        "simple_annualized_returns": returns.mean() * MINUTES_PER_YEAR,
+        "compounded_annualized_returns": compounded_annualized_returns,
+        "sharpe_ratio": compounded_annualized_returns / (returns.std() * np.sqrt(MINUTES_PER_YEAR)),
+        "num_trades": num_trades,
+        "win_rate": wins / num_trades if num_trades > 0 else 0,
+        "max_drawdown": np.max((peak - cumulative_returns) / peak),
+    }
+
+
+def test_metrics_match_polars_baseline(base_config):
+    """performance_metrics在净值数组上的结果与原来基于DataFrame的计算逐位相同"""
+    exchange = run({**base_config, 'engine': 'loop'}, load(base_config))
+    trades = exchange.save_trades_records()
+    nav = exchange.nav_records()
+    assert len(trades) > 20
+    wins = len(trades.filter((pl.col("side") == "sell") & (pl.col("realized_pnl") > 0)))
+    assert performance_metrics(nav["nav"].to_numpy(), len(trades), wins) == baseline_metrics(nav, trades)
+
+
+def test_returns_match_pct_change(base_config):
+    nav = run({**base_config, 'engine': 'array'}, load(base_config)).nav_records()["nav"]
+    returns = np.zeros(len(nav))
+    returns[1:] = (nav.to_numpy()[1:] - nav.to_numpy()[:-1]) / nav.to_numpy()[:-1]
+    assert np.array_equal(returns, nav.pct_change().fill_null(0).to_numpy())
+
+
+def batch_metrics(exchange):
+    """在完整净值序列和交易记录上批量计算的指标"""
+    trades = exchange.save_trades_records()
+    wins = len(trades.filter((pl.col("side") == "sell") & (pl.col("realized_pnl") > 0)))
+    return performance_metrics(exchange.nav_records()["nav"].to_numpy(), len(trades), wins)
+
+
+@pytest.mark.parametrize("engine", ['loop', 'array'])
+def test_online_metrics_match_batch(base_config, engine):
+    """增量指标（逐点更新和数组内核的批量合并）与批量计算只有浮点舍入误差"""
+    exchange = run({**base_config, 'engine': engine}, load(base_config))
+    online = exchange.calculate_performance_metrics()
+    batch = batch_metrics(exchange)
+    assert online.keys() == batch.keys()
+    for name in batch:
+        assert online[name] == pytest.approx(batch[name], rel=1e-9), name
+
+
+def test_metrics_without_stored_nav(base_config):
+    stored = run({**base_config, 'engine': 'loop'}, load(base_config)).calculate_performance_metrics()
+    exchange = run({**base_config, 'engine': 'loop', 'store_nav': False}, load(base_config))
+    assert exchange.calculate_performance_metrics() == stored
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+import pytest
+
+from benchmarks.synthetic import generate_klines
+from portfolio_backtest_engine import portfolio_back_test
+
+from conftest import SYNTHETIC_BARS
+from test_backtest_kernel import run, load
+
+
+@pytest.fixture
+def second_path(tmp_path):
+    """第二个品种：起点晚一天、中间缺一整段，与第一个品种的时间轴不一致"""
+    klines = generate_klines(SYNTHETIC_BARS, seed=11, start=datetime(2021, 1, 2), symbol="SECUSDT")
+    klines = klines.filter(~pl.col("open_time").is_between(datetime(2021, 1, 5), datetime(2021, 1, 6, 6)))
+    path = tmp_path / "second.parquet"
+    klines.write_parquet(path)
+    return str(path)
+
+
+def test_symbols_match_single_back_test(base_config, second_path):
+    """组合中每个品种的交易、净值和指标与单品种回测相同"""
+    paths = {'first': base_config['data_path'], 'second': second_path}
+    result = portfolio_back_test({**base_config, 'data_paths': paths, 'initial_balance': 2000000})
+    trades = result.trades_frame()
+    metrics = result.symbol_metrics()
+    # 两个品种各有对方没有的K线
+    assert not result.data.valid.all(axis=0).any()
+
+    for s, (symbol, path) in enumerate(paths.items()):
+        exchange = run({**base_config, 'engine': 'array', 'initial_balance': 1000000},
+                       load({**base_config, 'data_path': path}))
+        expected = exchange.save_trades_records()
+        mine = trades.filter(pl.col("symbol") == symbol)
+        assert len(mine) == len(expected) > 20
+        assert mine["side"].to_list() == expected["side"].to_list()
+        assert mine["price"].to_list() == expected["price"].to_list()
+        assert mine["timestamp"].to_list() == expected["timestamp"].to_list()
+
+        nav = exchange.nav_records()
+        assert np.array_equal(result.nav[result.data.valid[:, s], s], nav["nav"].to_numpy())
+        assert metrics[symbol] == pytest.approx(exchange.calculate_performance_metrics(), rel=1e-12)
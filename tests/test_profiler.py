@@ -0,0 +1,34 @@
+import json
+import os
+import sys
+import threading
+import tracemalloc
+
+import pytest
+
+from single_backtest_engine import back_test, profile_path
+
+
+def test_devnull_profile_paths_are_unique():
+    assert profile_path(os.devnull) != profile_path(os.devnull)
+    assert profile_path("Logging/run.log") == "Logging/run.profile.json"
+
+
+def test_profile_written(base_config, tmp_path):
+    output = tmp_path / "run.profile.json"
+    back_test({**base_config, 'profile': True, 'profile_output': str(output)})
+    report = json.loads(output.read_text(encoding='utf-8'))
+    assert report['counters']['bars'] > 0
+    assert "backtest_loop" in report['phases']
+
+
+def test_profiler_stopped_when_backtest_fails(base_config, tmp_path):
+    """回测出错时cProfile、tracemalloc和日志线程都要停止"""
+    threads = threading.active_count()
+    config = {**base_config, 'profile': True, 'profile_cprofile': True, 'profile_tracemalloc': True,
+              'trades_output': str(tmp_path / "missing" / "trades.csv")}
+    with pytest.raises(OSError):
+        back_test(config)
+    assert not tracemalloc.is_tracing()
+    assert sys.getprofile() is None
+    assert threading.active_count() == threads
@@ -0,0 +1,72 @@
+import json
+
+import polars as pl
+
+import single_backtest_engine
+from module.exchange import Exchange
+from module.results_store import ResultsStore
+from single_backtest_engine import back_test
+
+
+def test_results_store_hit(base_config, tmp_path):
+    config = {**base_config, 'results_dir': str(tmp_path / "results")}
+    first = back_test(config)
+    assert back_test(config) == first
+    store = ResultsStore(config['results_dir'])
+    assert len(store.runs()) == 1
+    assert len(store.load_trades(store.runs()["key"][0])) == 2 * first['num_trades']
+
+
+def test_key_covers_intrabar_data_and_strategy_source(base_config, tmp_path, monkeypatch):
+    intrabar = tmp_path / "seconds"
+    intrabar.mkdir()
+    config = {**base_config, 'results_dir': str(tmp_path / "results"), 'intrabar_data': str(intrabar)}
+    store = ResultsStore(config['results_dir'])
+    back_test(config)
+    back_test(config)
+    assert len(store.runs()) == 1
+
+    # 秒级数据目录变化
+    (intrabar / "notes.txt").write_text("changed", encoding='utf-8')
+    back_test(config)
+    assert len(store.runs()) == 2
+
+    # 策略源文件变化
+    monkeypatch.setattr(single_backtest_engine, "source_identity", lambda strategy: "edited")
+    back_test(config)
+    assert len(store.runs()) == 3
+
+
+def test_trades_frame_built_once(base_config, tmp_path, monkeypatch):
+    calls = []
+    save_trades_records = Exchange.save_trades_records
+
+    def counted(self):
+        calls.append(1)
+        return save_trades_records(self)
+
+    monkeypatch.setattr(Exchange, "save_trades_records", counted)
+    back_test({**base_config, 'results_dir': str(tmp_path / "results"), 'trades_output': str(tmp_path / "trades.csv"),
+               'bootstrap_resamples': 10, 'bootstrap_block_size': 60})
+    assert len(calls) == 1
+
+
+def test_hit_writes_trades_output_and_profile(base_config, tmp_path):
+    config = {**base_config, 'results_dir': str(tmp_path / "results")}
+    first = back_test({**config, 'trades_output': str(tmp_path / "first.csv")})
+    expected = pl.read_csv(tmp_path / "first.csv")
+
+    # 命中结果库时由保存的交易记录写出请求的文件
+    for name in ("hit.csv", "hit.parquet"):
+        output = tmp_path / name
+        assert back_test({**config, 'trades_output': str(output)}) == first
+        hit = pl.read_csv(output) if name.endswith(".csv") else pl.read_parquet(output)
+        assert len(hit) == len(expected) == 2 * first['num_trades']
+        assert hit["price"].to_list() == expected["price"].to_list()
+    assert len(ResultsStore(config['results_dir']).runs()) == 1
+
+    profile_output = tmp_path / "hit.profile.json"
+    back_test({**config, 'profile': True, 'profile_output': str(profile_output)})
+    report = json.loads(profile_output.read_text(encoding='utf-8'))
+    assert report['counters'] == {'results_store_hit': 1}
+    assert "results_store.get" in report['phases']
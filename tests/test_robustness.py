@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from module.performance import performance_metrics
+from module.robustness import (RETURN_METRICS, TRADE_METRICS, block_bootstrap, block_bootstrap_indices, nav_returns,
+                               return_metrics, robustness_report, trade_metrics, trade_returns, trade_shuffle)
+
+from test_backtest_kernel import run, load
+
+
+@pytest.fixture
+def backtest(base_config):
+    """一次合成数据回测的净值和交易记录"""
+    exchange = run({**base_config, 'engine': 'array'}, load(base_config))
+    return exchange.nav_records(), exchange.save_trades_records(), exchange.initial_balance
+
+
+def test_identity_resample_matches_performance_metrics(backtest):
+    """按原顺序重抽样（恒等下标）得到的指标与performance_metrics相同"""
+    nav, trades, _ = backtest
+    returns = nav_returns(nav)
+    expected = performance_metrics(nav["nav"].to_numpy(), len(trades), 0)
+    identity = np.arange(len(returns))[None, :]
+    metrics = return_metrics(returns[identity])
+    for name in RETURN_METRICS:
+        # 复利年化在performance_metrics中由首尾净值计算，这里由累乘收益率计算，只差浮点误差
+        assert metrics[name][0] == pytest.approx(expected[name], rel=1e-9, abs=1e-12)
+    assert metrics["max_drawdown"][0] == expected["max_drawdown"]
+    assert metrics["compounded_total_returns"][0] == expected["compounded_total_returns"]
+
+
+def test_whole_series_block_is_a_rotation(backtest):
+    """块长等于序列长度时每次重抽样都是原收益率的循环移位，复利总收益率和均值不变"""
+    nav, _, _ = backtest
+    returns = nav_returns(nav)
+    point = return_metrics(returns)
+    samples = block_bootstrap(returns, n_resamples=20, block_size=len(returns), seed=3)
+    for name in ("compounded_total_returns", "simple_annualized_returns"):
+        assert samples[name] == pytest.approx(np.full(20, point[name][0]), rel=1e-9, abs=1e-12)
+
+    indices = block_bootstrap_indices(10, 10, 5, np.random.default_rng(0))
+    for row in indices:
+        assert list(row) == list(np.roll(np.arange(10), -row[0]))
+
+
+def test_trade_returns_compound_to_final_cash(backtest):
+    _, trades, initial_balance = backtest
+    per_trade = trade_returns(trades, initial_balance)
+    assert len(per_trade) == len(trades) // 2
+    final_cash = trades.filter(trades["position"] == 0)["cash"][-1]
+    assert trade_metrics(per_trade)["total_returns"][0] == pytest.approx(final_cash / initial_balance - 1, rel=1e-12)
+
+    # 只打乱顺序时总收益率、平均收益率和胜率不变
+    point = trade_metrics(per_trade)
+    samples = trade_shuffle(per_trade, n_resamples=50, seed=1)
+    for name in ("total_returns", "mean_trade_returns", "win_rate"):
+        assert samples[name] == pytest.approx(np.full(50, point[name][0]), rel=1e-9, abs=1e-12)
+
+
+def test_resamples_independent_of_batch_size(backtest):
+    """同一个种子下分批大小不改变重抽样结果"""
+    nav, trades, initial_balance = backtest
+    returns = nav_returns(nav)
+    per_trade = trade_returns(trades, initial_balance)
+    whole = block_bootstrap(returns, n_resamples=30, block_size=60, seed=5)
+    batched = block_bootstrap(returns, n_resamples=30, block_size=60, seed=5, batch_size=7)
+    for name in RETURN_METRICS:
+        np.testing.assert_array_equal(batched[name], whole[name])
+    for replace in (False, True):
+        whole = trade_shuffle(per_trade, n_resamples=30, replace=replace, seed=5)
+        batched = trade_shuffle(per_trade, n_resamples=30, replace=replace, seed=5, batch_size=4)
+        for name in TRADE_METRICS:
+            np.testing.assert_array_equal(batched[name], whole[name])
+
+
+def test_report_point_estimates(backtest):
+    nav, trades, initial_balance = backtest
+    report = robustness_report(nav, trades, initial_balance, n_resamples=50, block_size=60, seed=0)
+    assert set(report["method"]) == {"block_bootstrap", "trade_shuffle", "trade_bootstrap"}
+    expected = performance_metrics(nav["nav"].to_numpy(), len(trades), 0)
+    row = report.filter((report["method"] == "block_bootstrap") & (report["metric"] == "max_drawdown")).row(0, named=True)
+    assert row["point"] == expected["max_drawdown"]
+    assert row["lower"] <= row["upper"]
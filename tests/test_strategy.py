@@ -0,0 +1,86 @@
+import polars as pl
+import pytest
+
+from module.strategy import Strategy, create_strategy
+from portfolio_backtest_engine import portfolio_back_test
+from single_backtest_engine import back_test
+from walk_forward import _load_market_data
+
+
+class BandStrategy(Strategy):
+    """测试用的自定义策略：均线下方band买入，上方band卖出"""
+
+    def __init__(self, window=30, band=0.004):
+        self.window = window
+        self.band = band
+
+    def indicator_stages(self):
+        return [
+            {"mean": pl.col("close").rolling_mean(self.window)},
+            {"lower_band": pl.col("mean") * (1 - self.band), "upper_band": pl.col("mean") * (1 + self.band)},
+        ]
+
+    def required_history(self):
+        return self.window - 1
+
+    def states(self):
+        return ('flat', 'long')
+
+    def order(self, state):
+        return ('buy', "lower_band") if state == 'flat' else ('sell', "upper_band")
+
+    def on_fill(self, state, side):
+        return 'long' if side == 'buy' else 'flat'
+
+    def params(self):
+        return {'window': self.window, 'band': self.band}
+
+
+CUSTOM = {'strategy': 'test_strategy:BandStrategy', 'strategy_params': {'window': 45}}
+
+
+def test_incomplete_strategy_cannot_be_instantiated():
+    class NoFill(Strategy):
+        def indicator_stages(self):
+            return []
+
+        def required_history(self):
+            return 0
+
+        def states(self):
+            return ('flat',)
+
+        def order(self, state):
+            return 'buy', "close"
+
+    with pytest.raises(TypeError):
+        NoFill()
+
+
+def test_custom_strategy_engines_agree(base_config, tmp_path):
+    results = {}
+    for engine in ('loop', 'array'):
+        output = str(tmp_path / f"{engine}.csv")
+        results[engine] = back_test({**base_config, **CUSTOM, 'engine': engine, 'trades_output': output})
+        results[engine + "_trades"] = pl.read_csv(output)
+    assert results['loop_trades'].equals(results['array_trades'])
+    assert len(results['loop_trades']) > 20
+    assert results['loop'] == pytest.approx(results['array'], rel=1e-9)
+
+
+def test_walk_forward_loads_custom_strategy(base_config, tmp_path):
+    market_data = _load_market_data(base_config['data_path'], "synthetic", str(tmp_path), {**base_config, **CUSTOM})
+    assert isinstance(market_data.strategy, BandStrategy)
+    assert market_data.strategy.window == 45
+    assert "lower_band" in market_data.data.columns
+
+
+def test_portfolio_rejects_custom_strategy(base_config):
+    config = {'data_paths': [base_config['data_path']], 'verbose': False, 'trades_output': None}
+    with pytest.raises(ValueError):
+        portfolio_back_test({**config, **CUSTOM})
+    # 默认策略的strategy_params生效
+    default = portfolio_back_test(config).metrics_frame()
+    tighter = portfolio_back_test({**config, 'strategy_params': {'n_sigma': 1.0}}).metrics_frame()
+    assert not default.equals(tighter)
+    assert create_strategy({'strategy_params': {'n_sigma': 1.0}}).n_sigma == 1.0
@@ -0,0 +1,66 @@
+import polars as pl
+import pytest
+
+from module.market_data import MarketData
+from module.streaming_market_data import StreamingMarketData, replay_parquet, replay_warmup
+from single_backtest_engine import back_test
+
+from conftest import INDICATOR_CONFIG
+
+START = "2021-01-05 00:00:00"
+END = "2021-01-10 12:00:00"
+INDICATOR_COLUMNS = ["vwap", "bias", "sigma", "bottom_threshold", "top_threshold"]
+
+
+def stream(path, interval, warmup):
+    """逐根消费StreamingMarketData，返回产出的K线表"""
+    vwap_window, estimate_window = INDICATOR_CONFIG['vwap_window'], INDICATOR_CONFIG['estimate_window']
+    warmup_source = None
+    if warmup:
+        warmup_source = replay_warmup(path, START, (vwap_window + estimate_window - 1) * interval, interval)
+    market_data = StreamingMarketData(replay_parquet(path, START, END), interval, vwap_window, estimate_window,
+                                      INDICATOR_CONFIG['n_sigma'], warmup_source=warmup_source)
+    rows = []
+    while market_data.has_more_data():
+        rows.append(market_data.get_current_bar())
+        market_data.next_bar()
+    return pl.DataFrame(rows)
+
+
+def test_replay_matches_scan(klines, klines_path):
+    replayed = pl.DataFrame(list(replay_parquet(klines_path, START, END, batch_size=777)))
+    expected = klines.filter(
+        pl.col("open_time").is_between(pl.lit(START).str.to_datetime(), pl.lit(END).str.to_datetime())
+    )
+    assert replayed.equals(expected.select(replayed.columns))
+
+
+def test_replay_rejects_unsorted(klines, tmp_path):
+    path = tmp_path / "unsorted.parquet"
+    klines.reverse().write_parquet(path)
+    with pytest.raises(ValueError):
+        list(replay_parquet(str(path)))
+
+
+@pytest.mark.parametrize("warmup", [False, True])
+@pytest.mark.parametrize("interval", [1, 5])
+def test_online_matches_batch_indicators(klines_path, interval, warmup):
+    """增量指标与批量指标的K线一一对应，数值只有浮点舍入误差"""
+    online = stream(klines_path, interval, warmup)
+    batch = MarketData(klines_path, START, END, interval, INDICATOR_CONFIG['vwap_window'],
+                       INDICATOR_CONFIG['estimate_window'], INDICATOR_CONFIG['n_sigma'], warmup=warmup).data
+    assert len(online) == len(batch) > 1000
+    assert online["open_time"].equals(batch["open_time"])
+    for name in ["open", "high", "low", "close", "volume", "quote_volume"]:
+        assert online[name].to_list() == pytest.approx(batch[name].to_list(), rel=1e-12)
+    for name in INDICATOR_COLUMNS:
+        assert online[name].to_list() == pytest.approx(batch[name].to_list(), rel=1e-9)
+
+
+def test_streaming_uses_strategy_params(base_config):
+    """流式回放的指标和预热长度取自strategy_params，与写在顶层参数时结果相同"""
+    config = {**base_config, 'streaming': True, 'start_date': START, 'end_date': END}
+    default = back_test(config)
+    tighter = back_test({**config, 'strategy_params': {'n_sigma': 3.0, 'estimate_window': 200}})
+    assert tighter == back_test({**config, 'n_sigma': 3.0, 'estimate_window': 200})
+    assert tighter['num_trades'] < default['num_trades']
@@ -0,0 +1,48 @@
+import pytest
+
+from single_backtest_engine import simulate, validate_config
+from walk_forward import _load_market_data, _indicator_key, run_walk_forward
+
+from conftest import INDICATOR_CONFIG
+
+
+def test_load_market_data_uses_strategy_params(base_config, tmp_path):
+    config = {**base_config, 'strategy_params': {'n_sigma': 2.5}, 'cache_max_bytes': 1}
+    market_data = _load_market_data(base_config['data_path'], "synthetic", str(tmp_path), config)
+    assert market_data.strategy.params()['n_sigma'] == 2.5
+    assert market_data.cache.max_bytes == 1
+    assert _indicator_key(config) != _indicator_key(base_config)
+
+
+@pytest.mark.parametrize("config", [
+    {'engine': 'vectorized'},
+    {'engine': 'array', 'streaming': True},
+    {'streaming': True, 'chunk_days': 1},
+    {'streaming': True, 'strategy': 'package.module:Strategy'},
+])
+def test_invalid_combinations_rejected(base_config, config):
+    with pytest.raises(ValueError):
+        validate_config({**base_config, **config})
+    with pytest.raises(ValueError):
+        simulate(None, {**base_config, **config})
+
+
+def test_walk_forward_applies_strategy_params(base_config):
+    """strategy_params不能被静默丢弃：不同的策略参数得到不同的样本外结果"""
+    base = {**base_config, **INDICATOR_CONFIG}
+    results = [run_walk_forward(base, {'strategy_params': [params]}, train_days=3, test_days=2,
+                                processes=2, show_progress=False)
+               for params in ({'n_sigma': 1.0}, {'n_sigma': 2.0})]
+    assert len(results[0]['folds']) == 5
+    assert results[0]['metrics'] != results[1]['metrics']
+
+
+def test_ties_pick_first_combo(base_config):
+    """目标指标相同（包括全部无效）时每折都取网格中的第一个组合，与子进程完成顺序无关"""
+    base = {**base_config, **INDICATOR_CONFIG}
+    # log_level不影响回测结果，各组合的指标完全相同
+    grid = {'log_level': ['ERROR', 'WARNING', 'INFO', 'DEBUG']}
+    for objective in ('sharpe_ratio', 'missing_metric'):
+        result = run_walk_forward(base, grid, train_days=3, test_days=2, objective=objective,
+                                  processes=4, show_progress=False)
+        assert result['folds']['log_level'].to_list() == ['ERROR'] * 5
@@ -0,0 +1,219 @@
+from single_backtest_engine import simulate
+from parameter_sweep import expand_grid, share_klines, create_pool, SWEEP_DEFAULTS
+from module.market_data import MarketData, scan_klines, DATE_FORMAT
+from module.indicator_cache import IndicatorCache, file_identity
+from module.performance import performance_metrics, empty_metrics
+from module.strategy import create_strategy, DEFAULT_STRATEGY
+from datetime import datetime, timedelta
+import json
+import math
+import os
+import sys
+import tempfile
+import numpy as np
+import polars as pl
+from tqdm import tqdm
+
+'''
+Walk-forward优化需要的参数：
+'base_config', 'grid', 'n_samples', 'seed', 'processes': 同参数扫描
+'train_days': 训练（样本内）窗口天数
+'test_days': 测试（样本外）窗口天数
+'step_days': 窗口滚动步长（天），默认等于test_days
+'anchored': 训练窗口是否固定从数据起点开始（扩张窗口），默认False（滚动窗口）
+'objective': 训练窗口上选参的指标，越大越好，默认'sharpe_ratio'
+'output': 每折结果保存路径（csv），默认None表示不保存
+'nav_output': 拼接后的样本外净值保存路径（csv），默认None表示不保存
+
+数据只读取一次并以内存映射的Arrow IPC文件共享给子进程；每组指标参数（含'strategy'和'strategy_params'）
+在全部历史上只计算一次，写入共享的指标缓存（大小上限为base_config的'cache_max_bytes'），
+各折直接按时间截取，因此所有窗口的指标都是充分预热的。
+'''
+
+# 决定指标帧的参数
+INDICATOR_PARAMS = ('interval', 'vwap_window', 'estimate_window', 'n_sigma')
+INDICATOR_DEFAULTS = {'interval': 1, 'vwap_window': 20, 'estimate_window': 60 * 24, 'n_sigma': 3}
+
+
+def _indicator_key(config):
+    """决定指标帧的参数组合：指标参数和策略"""
+    values = [config.get(key, INDICATOR_DEFAULTS[key]) for key in INDICATOR_PARAMS]
+    values += [config.get('strategy', DEFAULT_STRATEGY), config.get('strategy_params', None)]
+    return json.dumps(values, sort_keys=True, default=str)
+
+
+def make_folds(first, last, train_days, test_days, step_days=None, anchored=False):
+    """
+    生成滚动的训练/测试窗口，均为左闭右开区间：
+    [(train_start, train_end, test_start, test_end), ...]
+    """
+    train = timedelta(days=train_days)
+    test = timedelta(days=test_days)
+    step = timedelta(days=step_days or test_days)
+    folds = []
+    while True:
+        offset = step * len(folds)
+        train_end = first + train + offset
+        test_end = train_end + test
+        if test_end > last:
+            break
+        folds.append((first if anchored else first + offset, train_end, train_end, test_end))
+    return folds
+
+
+def _load_market_data(shared_path, data_identity, cache_dir, config):
+    """子进程：从共享指标缓存加载config对应的全历史指标帧（未命中时计算并写入）"""
+    indicator_params = {key: config.get(key, INDICATOR_DEFAULTS[key]) for key in INDICATOR_PARAMS}
+    return MarketData(shared_path, config.get('start_date', None), config.get('end_date', None),
+                      indicator_params['interval'], indicator_params['vwap_window'],
+                      indicator_params['estimate_window'], indicator_params['n_sigma'],
+                      cache=IndicatorCache(cache_dir, max_bytes=config.get('cache_max_bytes', 2 * 1024 ** 3)),
+                      data_identity=data_identity, strategy=create_strategy(config))
+
+
+def _precompute(task):
+    """子进程：预计算一组指标参数的全历史指标帧"""
+    shared_path, data_identity, cache_dir, config = task
+    _load_market_data(shared_path, data_identity, cache_dir, config)
+    return _indicator_key(config)
+
+
+def _evaluate(task):
+    """子进程：在一个时间窗口上运行第index个参数组合，返回指标（测试窗口额外返回净值和交易统计）"""
+    kind, fold, index, params, window, shared_path, data_identity, cache_dir, config = task
+    market_data = _load_market_data(shared_path, data_identity, cache_dir, config).slice(*window)
+    # 只有测试窗口需要净值序列用于拼接
+    exchange = simulate(market_data, {**config, 'store_nav': kind == 'test'})
+    exchange.close()
+    result = {'kind': kind, 'fold': fold, 'index': index, 'params': params, 'metrics': exchange.calculate_performance_metrics()}
+    if kind == 'test':
+        result['timestamp'] = exchange.minute_nav.column('timestamp').copy()
+        result['nav'] = exchange.minute_nav.column('nav').copy()
+        result['num_trade_records'] = exchange.metrics.num_trade_records
+        result['wins'] = exchange.metrics.wins
+    return result
+
+
+def _score(metrics, objective):
+    value = metrics.get(objective, None)
+    if value is None or not math.isfinite(value):
+        return -math.inf
+    return value
+
+
+def run_walk_forward(base_config, grid, train_days, test_days, step_days=None, anchored=False,
+                     objective='sharpe_ratio', n_samples=None, seed=None, processes=None, show_progress=True):
+    """
+    Walk-forward优化：每个训练窗口上搜索参数，取目标指标最优的配置在紧随其后的测试窗口上评估，
+    并把各折样本外净值按复利拼接。返回 {'folds': 每折结果表, 'nav': 样本外净值表, 'metrics': 样本外指标}
+    """
+    if base_config.get('data_path', None) is None:
+        raise ValueError("data_path is required")
+    combos = expand_grid(grid, n_samples, seed)
+    processes = processes or os.cpu_count()
+    base = {**base_config, **SWEEP_DEFAULTS}
+    initial_balance = base.get('initial_balance', 1000000)
+
+    with tempfile.TemporaryDirectory(prefix="walk_forward_") as directory:
+        shared_path = share_klines(base_config['data_path'], directory)
+        data_identity = base_config.get('data_identity', None) or file_identity(base_config['data_path'])
+        cache_dir = base_config.get('cache_dir', None) or os.path.join(directory, "indicators")
+
+        # 划分窗口
+        bounds = scan_klines(shared_path).select(
+            pl.col("open_time").cast(pl.Datetime(time_unit="ms")).min().alias("first"),
+            pl.col("open_time").cast(pl.Datetime(time_unit="ms")).max().alias("last")
+        ).collect().row(0)
+        first = datetime.strptime(base['start_date'], DATE_FORMAT) if base.get('start_date') else bounds[0]
+        last = datetime.strptime(base['end_date'], DATE_FORMAT) if base.get('end_date') else bounds[1] + timedelta(minutes=1)
+        folds = make_folds(first, last, train_days, test_days, step_days, anchored)
+        if not folds:
+            raise ValueError("history is too short for a single train/test fold")
+
+        configs = [{**base, **params} for params in combos]
+        shared = (shared_path, data_identity, cache_dir)
+
+        with create_pool(processes) as pool:
+            # 1. 每组指标参数只在全历史上计算一次
+            indicator_sets = {}
+            for config in configs:
+                indicator_sets.setdefault(_indicator_key(config), config)
+            tasks = [(*shared, indicator_sets[key]) for key in sorted(indicator_sets)]
+            for _ in tqdm(pool.imap_unordered(_precompute, tasks), total=len(tasks), desc='指标预计算', unit='set', disable=not show_progress):
+                pass
+
+            # 2. 所有折的训练窗口参数搜索并行运行
+            tasks = [('train', k, index, params, fold[:2], *shared, config)
+                     for k, fold in enumerate(folds) for index, (params, config) in enumerate(zip(combos, configs))]
+            best = {}
+            for result in tqdm(pool.imap_unordered(_evaluate, tasks), total=len(tasks), desc='样本内搜索', unit='run', disable=not show_progress):
+                # 目标指标相同时取序号小的参数组合，结果与子进程完成的先后无关
+                rank = (_score(result['metrics'], objective), -result['index'])
+                if result['fold'] not in best or rank > best[result['fold']][0]:
+                    best[result['fold']] = (rank, result['params'], result['metrics'])
+
+            # 3. 各折最优配置在测试窗口上评估
+            tasks = [('test', k, -best[k][0][1], best[k][1], fold[2:], *shared, {**base, **best[k][1]})
+                     for k, fold in enumerate(folds)]
+            tests = {}
+            for result in tqdm(pool.imap_unordered(_evaluate, tasks), total=len(tasks), desc='样本外评估', unit='fold', disable=not show_progress):
+                tests[result['fold']] = result
+
+    # 拼接样本外净值：每折从上一折的期末净值开始复利
+    rows, timestamps, navs = [], [], []
+    capital = initial_balance
+    num_trade_records, wins = 0, 0
+    for k, (train_start, train_end, test_start, test_end) in enumerate(folds):
+        test = tests[k]
+        rows.append({
+            'fold': k, 'train_start': train_start, 'train_end': train_end,
+            'test_start': test_start, 'test_end': test_end, **best[k][1],
+            f'train_{objective}': best[k][2].get(objective, None),
+            **{f'test_{key}': value for key, value in test['metrics'].items()},
+        })
+        if len(test['nav']) == 0:
+            continue
+        nav = test['nav'] * (capital / test['nav'][0])
+        timestamps.append(test['timestamp'])
+        navs.append(nav)
+        capital = nav[-1]
+        num_trade_records += test['num_trade_records']
+        wins += test['wins']
+
+    if navs:
+        nav = np.concatenate(navs)
+        metrics = performance_metrics(nav, num_trade_records, wins)
+        nav_frame = pl.DataFrame({
+            'timestamp': pl.Series(np.concatenate(timestamps)).cast(pl.Datetime(time_unit="ms")),
+            'nav': nav,
+        })
+    else:
+        metrics = empty_metrics()
+        nav_frame = pl.DataFrame({'timestamp': [], 'nav': []}, schema={'timestamp': pl.Datetime(time_unit="ms"), 'nav': pl.Float64})
+
+    return {'folds': pl.DataFrame(rows), 'nav': nav_frame, 'metrics': metrics}
+
+
+if __name__ == '__main__':
+    config_path = sys.argv[1] if len(sys.argv) > 1 else 'example_walk_forward_config.json'
+    wf_config = json.load(open(config_path, 'r'))
+    result = run_walk_forward(
+        wf_config['base_config'],
+        wf_config['grid'],
+        wf_config['train_days'],
+        wf_config['test_days'],
+        step_days=wf_config.get('step_days', None),
+        anchored=wf_config.get('anchored', False),
+        objective=wf_config.get('objective', 'sharpe_ratio'),
+        n_samples=wf_config.get('n_samples', None),
+        seed=wf_config.get('seed', None),
+        processes=wf_config.get('processes', None),
+    )
+    print(result['folds'])
+    print("样本外指标:")
+    for key, value in result['metrics'].items():
+        print(f"  {key}: {value}")
+    if wf_config.get('output', None) is not None:
+        result['folds'].write_csv(wf_config['output'])
+    if wf_config.get('nav_output', None) is not None:
+        result['nav'].write_csv(wf_config['nav_output'])